@@ -1,6 +1,7 @@
 import os
 import json
-from flask import Flask, request, jsonify, abort
+import time
+from flask import Flask, request, jsonify, abort, Response, stream_with_context
 from flask_cors import CORS
 from flask_caching import Cache
 from mistralai.client import MistralClient
@@ -10,9 +11,21 @@ import logging
 import requests
 import sqlite3
 import pickle
-from prompts.roles import system, user
-from langchain.memory import ConversationBufferMemory  # Import LangChain memory
-from vector_store import VectorStore
+from prompts.roles import system, user, small_talk_system, small_talk_user, structured_system, structured_user
+from session_store import SessionStore, SqliteSessionStore
+from response_cache import ResponseCache
+from catalog_refresh import CatalogRefresher
+from intent_router import IntentRouter, CONVERSATIONAL
+from prompt_builder import PromptBuilder
+from structured_response import StructuredAnswer
+from retrieval_depth import RetrievalDepth
+from single_flight import SingleFlight, FlightError
+from llm_scheduler import LLMScheduler, LLMOverloaded, estimate_call_tokens, read_error_bodies
+from embedding_cache import normalize_query
+from prefetch import Prefetcher
+from warmup import Warmup
+import metrics
+from metrics import stage, CACHE_LOOKUPS, LLM_REQUESTS, LLM_TOKENS
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -24,14 +37,37 @@ app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": ["https://jolly-sky-0071d7d03.5.azurestaticapps.net",
                                          "http://localhost:3000"]}})
 
-cache = Cache(app, config={'CACHE_TYPE': 'simple'})
+# Response cache for first-turn answers. RESPONSE_CACHE_SEMANTIC=1 also reuses
+# answers for near-duplicate queries (cosine >= RESPONSE_CACHE_THRESHOLD)
+# that retrieved the same datasets. RESPONSE_CACHE=0 (or a TTL of 0, which
+# cachelib would otherwise take as "never expire") turns it off.
+RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', 3600))
+RESPONSE_CACHE = os.getenv('RESPONSE_CACHE', '1') == '1' and RESPONSE_CACHE_TTL > 0
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', 1000))
+RESPONSE_CACHE_SEMANTIC = os.getenv('RESPONSE_CACHE_SEMANTIC', '0') == '1'
+RESPONSE_CACHE_THRESHOLD = float(os.getenv('RESPONSE_CACHE_THRESHOLD', 0.95))
+
+cache = Cache(app, config={'CACHE_TYPE': 'SimpleCache',
+                           'CACHE_DEFAULT_TIMEOUT': RESPONSE_CACHE_TTL,
+                           'CACHE_THRESHOLD': RESPONSE_CACHE_SIZE})
+response_cache = ResponseCache(cache, ttl=RESPONSE_CACHE_TTL, max_entries=RESPONSE_CACHE_SIZE,
+                               semantic=RESPONSE_CACHE_SEMANTIC, threshold=RESPONSE_CACHE_THRESHOLD,
+                               enabled=RESPONSE_CACHE)
 
 api_key = os.getenv('MIXTRAL_API_KEY')
 if not api_key:
     raise ValueError("MIXTRAL_API_KEY environment variable is not set")
 
-mistral_client = MistralClient(api_key=api_key)
+# MISTRAL_ENDPOINT can point at a local stand-in, e.g. benchmarks/mock_mistral.py
+mistral_endpoint = os.getenv('MISTRAL_ENDPOINT', 'https://api.mistral.ai')
+# Retries are left to llm_scheduler (jittered, within the quota), so the
+# client makes a single attempt. Its HTTP connections are pooled and kept alive.
+MISTRAL_TIMEOUT = int(os.getenv('MISTRAL_TIMEOUT', 120))
+mistral_client = read_error_bodies(MistralClient(api_key=api_key, endpoint=mistral_endpoint, max_retries=1,
+                                                timeout=MISTRAL_TIMEOUT))
 mistral_model = "mistral-large-latest"
+# Model used for small talk; set SMALL_TALK_MODEL to use a smaller, cheaper one
+small_talk_model = os.getenv('SMALL_TALK_MODEL', mistral_model)
 
 class MixtralAPIError(Exception):
     pass
@@ -40,11 +76,350 @@ class MixtralAPIError(Exception):
 def handle_mixtral_api_error(error):
     return jsonify({'error': str(error)}), 500
 
-# Initialize ConversationBufferMemory
-memory = ConversationBufferMemory()
+# Time every request and report its stages in a Server-Timing header. For
+# streamed answers the header only covers the work done before streaming.
+@app.before_request
+def start_timer():
+    metrics.start_request()
+
+@app.after_request
+def add_server_timing(response):
+    timer = metrics.current_request()
+    if timer is not None:
+        metrics.REQUEST_SECONDS.observe(timer.elapsed(), endpoint=request.endpoint or 'unknown')
+        response.headers['Server-Timing'] = timer.server_timing()
+    return response
+
+# Per-session conversation memory. The default SQLite store is shared by all
+# worker processes and survives restarts; SESSION_BACKEND=memory keeps the
+# history in this process only.
+SESSION_BACKEND = os.getenv('SESSION_BACKEND', 'sqlite')
+SESSION_BACKENDS = {'sqlite': SqliteSessionStore, 'memory': SessionStore}
+if SESSION_BACKEND not in SESSION_BACKENDS:
+    raise ValueError(f"Unknown SESSION_BACKEND: {SESSION_BACKEND}")
+sessions = SESSION_BACKENDS[SESSION_BACKEND]()
+
+# Refresh the dataset catalog in the background every CATALOG_REFRESH_INTERVAL
+# seconds (0 disables it)
+CATALOG_REFRESH_INTERVAL = int(os.getenv('CATALOG_REFRESH_INTERVAL', 86400))
+
+# Token budget for the assembled prompt (system prompt, message, search
+# results and history)
+prompt_builder = PromptBuilder(int(os.getenv('PROMPT_TOKEN_BUDGET', 3000)))
+
+# Route small talk around retrieval (INTENT_ROUTER=0 disables it)
+INTENT_ROUTER = os.getenv('INTENT_ROUTER', '1') == '1'
+
+# Number of search hits put in the prompt, cut off by distance (see
+# retrieval_depth.py for RETRIEVAL_CUTOFF and its thresholds)
+retrieval_depth = RetrievalDepth()
+
+# Identical work in progress is shared instead of repeated: routing and
+# retrieval for the same normalized message, and the Mistral call for the
+# same first-turn message and datasets (e.g. a shared link or client retries)
+retrieval_flights = SingleFlight('retrieve')
+llm_flights = SingleFlight('llm')
+
+# Routing and retrieval for the message a user is still typing, reused by
+# /api/chat when the submitted message matches (see prefetch.py)
+prefetcher = Prefetcher(lambda text: shared_route_and_retrieve(text, retrieval_depth.max_k))
+
+# Outbound Mistral calls wait for a slot and quota here (see llm_scheduler.py
+# for the quota, queue and retry settings)
+llm_scheduler = LLMScheduler()
+
+# Answer format for dataset queries. With 'structured' the LLM only writes an
+# intro and picks datasets by number (as JSON), and the links and titles are
+# rendered here from the index, so answers are a fraction of the output tokens
+# and every link is valid. With 'text' the LLM writes out the links itself.
+RESPONSE_FORMAT = os.getenv('RESPONSE_FORMAT', 'structured')
+if RESPONSE_FORMAT not in ('structured', 'text'):
+    raise ValueError(f"Unknown RESPONSE_FORMAT: {RESPONSE_FORMAT}")
+
+# The embedding model and vector index are loaded in the background so the
+# server can bind its port straight away: /readyz turns 200 once they are
+# loaded and /api/chat answers 503 until then. BACKGROUND_LOAD=0 loads them
+# before serving instead. WARMUP_ENCODE=1 also runs a throwaway encode and
+# search, so the first real request doesn't pay for one-off setup costs.
+BACKGROUND_LOAD = os.getenv('BACKGROUND_LOAD', '1') == '1'
+WARMUP_ENCODE = os.getenv('WARMUP_ENCODE', '1') == '1'
+NOT_READY_RETRY_AFTER = 5  # Seconds clients are asked to wait while loading
+
+vector_store = None
+intent_router = None
+catalog_refresher = None
+
+def load_components():
+    global vector_store, intent_router, catalog_refresher
+    # Deferred import: pulls in torch, sentence-transformers and chromadb
+    from vector_store import VectorStore
+    store = VectorStore()
+    router = IntentRouter(store.embed_queries, names_slug=store.names_slug) if INTENT_ROUTER else None
+    if WARMUP_ENCODE:
+        vector = store.embedding_function(["warm-up query"])[0]
+        store.search([vector], n_results=1)
+        if router:
+            router.centroids()
+    vector_store, intent_router = store, router
+    if CATALOG_REFRESH_INTERVAL > 0:
+        catalog_refresher = CatalogRefresher(store, CATALOG_REFRESH_INTERVAL)
+        catalog_refresher.start()
+
+warmup = Warmup(load_components).start(background=BACKGROUND_LOAD)
+
+# Limits for /api/search. Queries are retrieved in chunks of SEARCH_CHUNK_SIZE,
+# which is also the granularity of the streamed (NDJSON) output.
+SEARCH_MAX_QUERIES = int(os.getenv('SEARCH_MAX_QUERIES', 10000))
+SEARCH_MAX_RESULTS = 100
+SEARCH_CHUNK_SIZE = int(os.getenv('SEARCH_CHUNK_SIZE', 256))
+
+
+def build_messages(memory, user_message, hits, structured=False):
+    # The current message is only added to memory along with its answer
+    history, summary = memory.snapshot()
+    system_prompt, template = (structured_system, structured_user) if structured else (system, user)
+    with stage('prompt'):
+        messages, usage = prompt_builder.build(system_prompt, template, user_message, hits=hits,
+                                               history=history, summary=summary, numbered=structured)
+    logging.info(f"Search results: {[hit['name'] for hit in hits[:usage['hits_used']]]}")
+    return messages
+
+
+def build_small_talk_messages(memory, user_message):
+    history, summary = memory.snapshot()
+    with stage('prompt'):
+        messages, _ = prompt_builder.build(small_talk_system, small_talk_user, user_message,
+                                           history=history, summary=summary)
+    return messages
+
+
+def route_and_retrieve(user_message, n_results):
+    # Classify the message and fetch query results from the vector store for
+    # dataset queries. Returns the intent, the query vector (if one was
+    # computed) and the hits. Neither depends on the conversation so far.
+    # The route stage includes embedding the message when the lexicon can't decide
+    with stage('route'):
+        intent, query_vector = intent_router.classify(user_message) if intent_router else (None, None)
+    if intent == CONVERSATIONAL:
+        return intent, query_vector, []
+    query_vector, hits = vector_store.retrieve(user_message, n_results=n_results, query_vector=query_vector,
+                                               depth=retrieval_depth)
+    return intent, query_vector, hits
+
+
+def retrieval_key(user_message, n_results):
+    return normalize_query(user_message), n_results
+
+
+def shared_route_and_retrieve(user_message, n_results):
+    # route_and_retrieve, shared with identical messages in progress
+    return retrieval_flights.do(retrieval_key(user_message, n_results),
+                                lambda: route_and_retrieve(user_message, n_results))
+
+
+def prepare_chat(memory, user_message, n_results, prefetched=None):
+    # Route and retrieve, unless prefetched already has the result, and
+    # build the prompt. Returns the query vector (if one was computed), the
+    # hits, the messages, the model to use and, for structured answers, the
+    # StructuredAnswer that renders the reply.
+    intent, query_vector, hits = prefetched or shared_route_and_retrieve(user_message, n_results)
+    if intent == CONVERSATIONAL:
+        logging.info("Small talk, skipping retrieval")
+        return query_vector, [], build_small_talk_messages(memory, user_message), small_talk_model, None
+
+    structured = RESPONSE_FORMAT == 'structured'
+    messages = build_messages(memory, user_message, hits, structured)
+    answer = StructuredAnswer(hits, vector_store.title) if structured else None
+    return query_vector, hits, messages, mistral_model, answer
+
+
+def llm_options(answer):
+    # Structured answers ask Mistral for a JSON object
+    return {'response_format': {'type': 'json_object'}} if answer is not None else {}
+
+
+def chat_flight_key(user_message, hits, model):
+    # First-turn prompts only depend on the message, the datasets and the model
+    return normalize_query(user_message), tuple(hit['id'] for hit in hits), model
+
+
+def lookup_cached_response(user_message, query_vector, hits):
+    if not response_cache.enabled:
+        return None
+    with stage('cache'):
+        response = response_cache.get(user_message, query_vector, hits)
+    CACHE_LOOKUPS.inc(cache='response', result='miss' if response is None else 'hit')
+    return response
+
+
+def record_llm_call(model, mode, outcome, usage=None):
+    LLM_REQUESTS.inc(model=model, mode=mode, outcome=outcome)
+    if usage is not None:
+        LLM_TOKENS.inc(usage.prompt_tokens, model=model, kind='prompt')
+        LLM_TOKENS.inc(usage.completion_tokens, model=model, kind='completion')
+
+
+def not_ready_response():
+    return (jsonify({'error': 'The dataset index is still loading, please retry shortly', **warmup.status()}),
+            503, {'Retry-After': str(NOT_READY_RETRY_AFTER)})
+
+
+def overloaded_response(error):
+    logging.warning(f"Turning a chat request away: {error}")
+    return (jsonify({'error': 'Too many requests in progress, please retry shortly'}),
+            503, {'Retry-After': str(error.retry_after)})
+
+
+def parse_search_request(data):
+    # Validate an /api/search body: {"query": "..."} or {"queries": [...]},
+    # plus optional n_results and stream. Raises ValueError with a message
+    # for the client.
+    queries = data.get('queries', data.get('query'))
+    if isinstance(queries, str):
+        queries = [queries]
+    if not queries or not isinstance(queries, list) or not all(isinstance(q, str) and q.strip() for q in queries):
+        raise ValueError("query must be a non-empty string, or queries a non-empty list of them")
+    if len(queries) > SEARCH_MAX_QUERIES:
+        raise ValueError(f"At most {SEARCH_MAX_QUERIES} queries are accepted per request")
+    n_results = data.get('n_results', 10)
+    if not isinstance(n_results, int) or isinstance(n_results, bool) or not 1 <= n_results <= SEARCH_MAX_RESULTS:
+        raise ValueError(f"n_results must be an integer between 1 and {SEARCH_MAX_RESULTS}")
+    return queries, n_results, bool(data.get('stream', False))
 
-# Initialize vector store
-vector_store = VectorStore()
+
+def search_chunk(queries, n_results):
+    # One {'query', 'hits'} entry per query, retrieved as a single batch
+    results = vector_store.retrieve_many(queries, n_results=n_results)
+    return [{'query': query,
+             'hits': [{'id': hit['id'], 'name': hit['name'], 'distance': hit.get('distance')} for hit in hits]}
+            for query, hits in zip(queries, results)]
+
+
+def search_chunks(queries):
+    for start in range(0, len(queries), SEARCH_CHUNK_SIZE):
+        yield queries[start:start + SEARCH_CHUNK_SIZE]
+
+
+def sse_event(data, event=None):
+    # Format a single Server-Sent Event frame
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {json.dumps(data)}\n\n"
+
+
+def stream_chat(messages, on_complete, admission, model=mistral_model, answer=None, flight=None):
+    # Forward Mistral's streamed chunks to the client as SSE. Closing this
+    # generator (e.g. on client disconnect) closes the upstream stream too.
+    # on_complete receives the full answer once it has been received. A
+    # structured answer is streamed as its intro, then the rendered links.
+    # The streamed text and the answer are also published to flight, if
+    # identical requests are following this one; if the client disconnects
+    # while they are, the rest of the answer is still read for them (in the
+    # closing call). The call runs under admission, which is released when
+    # the stream ends.
+    start = time.perf_counter()
+    upstream = llm_scheduler.stream(admission, lambda: mistral_client.chat_stream(model=model, messages=messages,
+                                                                                  **llm_options(answer)))
+    chunks = []
+    usage = None
+    response, rest = None, ""
+    outcome = 'cancelled'
+    client_gone = False
+    try:
+        for chunk in upstream:
+            token = chunk.choices[0].delta.content
+            if token:
+                if not chunks:
+                    metrics.record('llm_first_token', time.perf_counter() - start)
+                chunks.append(token)
+                text = answer.feed(token) if answer is not None else token
+                if text:
+                    if flight is not None:
+                        flight.publish(text)
+                    if not client_gone:
+                        try:
+                            yield sse_event({'token': text})
+                        except GeneratorExit:
+                            if flight is None or not flight.followers:
+                                raise
+                            logging.info("Chat stream cancelled, finishing it for the requests following it")
+                            client_gone = True
+            usage = chunk.usage or usage
+        response, rest = answer.finish() if answer is not None else ("".join(chunks), "")
+        if rest and flight is not None:
+            flight.publish(rest)
+        outcome = 'ok'
+    except Exception as e:
+        logging.error(f"Failed to stream response from Mistral API: {str(e)}")
+        outcome = 'error'
+        if not client_gone:
+            yield sse_event({'error': f"Failed to get response from Mistral API: {str(e)}"}, event='error')
+        return
+    finally:
+        upstream.close()
+        admission.settle(usage)
+        admission.release()
+        metrics.record('llm', time.perf_counter() - start)
+        record_llm_call(model, 'stream', outcome, usage)
+        if outcome == 'ok':
+            on_complete(response)
+        elif outcome == 'cancelled':
+            logging.info("Chat stream cancelled before completion")
+        if flight is not None and outcome == 'ok':
+            flight.finish(response)
+        elif flight is not None:
+            flight.finish(error=f"Mistral stream {outcome}")
+
+    if client_gone:
+        return
+    if rest:
+        yield sse_event({'token': rest})
+    yield sse_event({'response': response}, event='done')
+
+
+def follow_chat(flight, on_complete):
+    # Stream the answer of an identical request in progress as it produces
+    # it, in the same SSE format as stream_chat
+    try:
+        for text in flight.follow():
+            yield sse_event({'token': text})
+    except FlightError as e:
+        yield sse_event({'error': f"Failed to get response from Mistral API: {str(e)}"}, event='error')
+        return
+    on_complete(flight.result)
+    yield sse_event({'response': flight.result}, event='done')
+
+
+def complete_chat(messages, model, answer, admission):
+    # Blocking Mistral call under admission, returning the (rendered) answer
+    try:
+        with stage('llm'):
+            chat_response = llm_scheduler.call(admission, lambda: mistral_client.chat(
+                model=model,
+                messages=messages,
+                **llm_options(answer)
+            ))
+    except Exception:
+        record_llm_call(model, 'blocking', 'error')
+        raise
+    admission.settle(chat_response.usage)
+    record_llm_call(model, 'blocking', 'ok', chat_response.usage)
+    refined_response = chat_response.choices[0].message.content
+    if answer is not None:
+        refined_response = answer.complete(refined_response)
+    return refined_response
+
+
+def stream_cached(response):
+    # Replay a cached answer in the same SSE format as stream_chat
+    yield sse_event({'token': response})
+    yield sse_event({'response': response}, event='done')
+
+
+def sse_response(events):
+    return Response(stream_with_context(events),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache',
+                             'X-Accel-Buffering': 'no'})
 
 
 @app.route('/api/chat', methods=['POST'])
@@ -52,50 +427,136 @@ def chat():
     data = request.json
     user_message = data.get('message')
     session_id = data.get('session_id')
-    n_results = 10  # Default number of results to retrieve
+    stream = bool(data.get('stream', False))
+    n_results = retrieval_depth.max_k  # Most results to retrieve; the distance cut-off may keep fewer
     
     if not user_message or not session_id:
         return jsonify({'error': 'Message and session_id are required'}), 400
 
+    if not warmup.ready:
+        return not_ready_response()
+
     try:
-        # Add user message to memory
-        memory.chat_memory.add_user_message(user_message)
-
-        # Fetch query results from vector store
-        search_results_text = vector_store.query_embeddings(user_message, n_results=n_results)
-        logging.info(f"Search results: {search_results_text}")  
-        
-
-        # Create the user prompt
-        user_prompt = user.format(user_message=user_message,
-                                  conv_history=memory.load_memory_variables({})['history'],
-                                  n_results=n_results,
-                                  search_results_text=search_results_text)
-        
-        logging.info(f"User prompt: {user_prompt}")
-
-        messages = [
-            {'role': 'system', 'content': system},
-            {'role': 'user', 'content': user_prompt}
-        ]
-
-        chat_response = mistral_client.chat(
-            model=mistral_model,
-            messages=messages
-        )
-        refined_response = chat_response.choices[0].message.content
-
-        # Add AI response to memory
-        memory.chat_memory.add_ai_message(refined_response)
+        # The message is added to this session's memory along with its
+        # answer, so a request that fails or is turned away with a 503 has
+        # no side effects and can simply be retried
+        memory = sessions.get(session_id)
+        first_turn = not memory.chat_memory.messages
+
+        prefetched = prefetcher.take(session_id, user_message)
+        query_vector, hits, messages, model, answer = prepare_chat(memory, user_message, n_results, prefetched)
+
+        # Answers only depend on the message and retrieved datasets on a first turn
+        cached_response = lookup_cached_response(user_message, query_vector, hits) if first_turn else None
+        if cached_response is not None:
+            memory.add_turn(user_message, cached_response)
+            if stream:
+                return sse_response(stream_cached(cached_response))
+            return jsonify({'response': cached_response})
+
+        # Identical first-turn requests in progress share one Mistral call
+        flight, leader = llm_flights.join(chat_flight_key(user_message, hits, model)) if first_turn else (None, True)
+        if not leader:
+            logging.info("Sharing the answer of an identical request in progress")
+            if stream:
+                return sse_response(follow_chat(flight, lambda response: memory.add_turn(user_message, response)))
+            refined_response = flight.wait()
+            memory.add_turn(user_message, refined_response)
+            return jsonify({'response': refined_response})
+
+        def on_complete(response):
+            # Add the turn to memory
+            memory.add_turn(user_message, response)
+            if first_turn:
+                response_cache.put(user_message, query_vector, hits, response)
+
+        # Wait for a Mistral call slot. When too many requests are waiting
+        # already, answer 503 with a Retry-After at once.
+        try:
+            with stage('llm_queue'):
+                admission = llm_scheduler.admit(estimate_call_tokens(messages))
+        except LLMOverloaded as e:
+            if flight is not None:
+                flight.finish(error=e)
+            return overloaded_response(e)
+
+        if stream:
+            response = sse_response(stream_chat(messages, on_complete, admission, model, answer, flight))
+
+            def close():
+                # Also when the stream is never started (client gone): free
+                # the slot, and fail the identical requests following it
+                admission.release()
+                if flight is not None:
+                    flight.finish(error="Chat stream closed before it started")
+            response.call_on_close(close)
+            return response
+
+        try:
+            with admission:
+                refined_response = complete_chat(messages, model, answer, admission)
+            on_complete(refined_response)
+        except Exception as e:
+            if flight is not None:
+                flight.finish(error=e)
+            raise
+        if flight is not None:
+            flight.publish(refined_response)
+            flight.finish(refined_response)
 
         logging.info(f"Conversation history: {memory.load_memory_variables({})}")
 
+    except LLMOverloaded as e:
+        # Mistral kept throttling us after retries
+        return overloaded_response(e)
     except Exception as e:
         logging.error(f"Failed to get response from Mistral API: {str(e)}")
         raise MixtralAPIError(f"Failed to get response from Mistral API: {str(e)}") from e
 
     return jsonify({'response': refined_response})
 
+# Retrieval only, without an LLM call, for one or many queries. Streamed
+# results are NDJSON, one line per query, sent as each chunk is retrieved.
+@app.route('/api/search', methods=['POST'])
+def search():
+    try:
+        queries, n_results, stream = parse_search_request(request.json or {})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if not warmup.ready:
+        return not_ready_response()
+
+    if stream:
+        def lines():
+            for chunk in search_chunks(queries):
+                for entry in search_chunk(chunk, n_results):
+                    yield json.dumps(entry) + "\n"
+        return Response(stream_with_context(lines()), mimetype='application/x-ndjson')
+
+    results = []
+    for chunk in search_chunks(queries):
+        results.extend(search_chunk(chunk, n_results))
+    return jsonify({'results': results})
+
+# Start routing and retrieval for a message the user is still typing, so
+# /api/chat can skip them if the submitted message matches. Returns straight
+# away; prefetching is debounced per session.
+@app.route('/api/prefetch', methods=['POST'])
+def prefetch():
+    data = request.json or {}
+    partial_message = data.get('message')
+    session_id = data.get('session_id')
+
+    if not isinstance(partial_message, str) or not session_id:
+        return jsonify({'error': 'Message and session_id are required'}), 400
+
+    if not warmup.ready:
+        return not_ready_response()
+
+    scheduled = prefetcher.schedule(session_id, partial_message)
+    return jsonify({'status': 'scheduled' if scheduled else 'skipped'}), 202
+
 @app.route('/api/clear_history', methods=['POST'])
 def clear_history():
     data = request.json
@@ -105,10 +566,24 @@ def clear_history():
         return jsonify({'error': 'session_id is required'}), 400
 
     # Clear the conversation history for the session
-    memory.chat_memory.clear()
+    sessions.clear(session_id)
 
     logging.info(f"Conversation history cleared for session: {session_id}")
     return jsonify({'message': 'Conversation history cleared'}), 200
 
+# Liveness: the process is up and serving requests
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    return jsonify({'status': 'ok'}), 200
+
+# Readiness: the embedding model and vector index are loaded
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    return jsonify(warmup.status()), 200 if warmup.ready else 503
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,383 @@
+import os
+import json
+import time
+import asyncio
+import contextvars
+import logging
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from quart import Quart, request, jsonify, Response
+from quart_cors import cors
+from mistralai.async_client import MistralAsyncClient
+import metrics
+from metrics import stage
+from single_flight import FlightError
+from llm_scheduler import LLMOverloaded, estimate_call_tokens, read_error_bodies
+from app import (api_key, mistral_endpoint, mistral_model, sessions, response_cache, prepare_chat,
+                 lookup_cached_response, record_llm_call, llm_options, sse_event, stream_cached, MixtralAPIError,
+                 warmup, retrieval_depth, llm_flights, chat_flight_key, NOT_READY_RETRY_AFTER, parse_search_request,
+                 search_chunk, search_chunks, llm_scheduler, MISTRAL_TIMEOUT, prefetcher, retrieval_flights,
+                 retrieval_key, route_and_retrieve)
+
+# Async serving mode: the same /api/chat and /api/clear_history contracts as
+# app.py, served over ASGI so a request waiting on Mistral doesn't hold a
+# worker thread. Run with e.g. `hypercorn async_app:app --bind 0.0.0.0:5000`.
+
+# Threads used for CPU-bound work (routing, embedding, vector search, prompt formatting)
+CPU_WORKERS = int(os.getenv('CPU_WORKERS', 4))
+
+app = Quart(__name__)
+app = cors(app, allow_origin=["https://jolly-sky-0071d7d03.5.azurestaticapps.net",
+                              "http://localhost:3000"])
+
+# Concurrent Mistral calls are bounded by the scheduler (LLM_MAX_CONCURRENCY),
+# so the client's connection pool is sized to match
+mistral_client = read_error_bodies(MistralAsyncClient(api_key=api_key, endpoint=mistral_endpoint, max_retries=1,
+                                                      timeout=MISTRAL_TIMEOUT,
+                                                      max_concurrent_requests=llm_scheduler.max_concurrency))
+executor = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix='cpu')
+background_tasks = set()  # Tasks that outlive their request, referenced until they are done
+
+
+@app.errorhandler(MixtralAPIError)
+async def handle_mixtral_api_error(error):
+    return jsonify({'error': str(error)}), 500
+
+@app.before_request
+async def start_timer():
+    metrics.start_request()
+
+@app.after_request
+async def add_server_timing(response):
+    timer = metrics.current_request()
+    if timer is not None:
+        metrics.REQUEST_SECONDS.observe(timer.elapsed(), endpoint=request.endpoint or 'unknown')
+        response.headers['Server-Timing'] = timer.server_timing()
+    return response
+
+
+async def run_in_executor(func, *args):
+    # Run in this request's context, so stage timings reach its Server-Timing header
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(executor, context.run, func, *args)
+
+
+async def shared_route_and_retrieve(user_message, n_results):
+    # Async counterpart of app.shared_route_and_retrieve. A follower awaits the
+    # identical request's flight on the event loop rather than on an executor
+    # thread. The leader's executor job lands the flight even if this request
+    # is cancelled meanwhile.
+    flight, leader = retrieval_flights.join(retrieval_key(user_message, n_results))
+    if not leader:
+        return await flight.await_result(retrieval_flights.timeout)
+    return await run_in_executor(retrieval_flights.lead, flight, lambda: route_and_retrieve(user_message, n_results))
+
+
+async def stream_chat(messages, on_complete, admission, model=mistral_model, answer=None, flight=None):
+    # Async counterpart of app.stream_chat. If the client disconnects the
+    # generator is cancelled and closing it closes the upstream stream.
+    start = time.perf_counter()
+    upstream = llm_scheduler.astream(admission, lambda: mistral_client.chat_stream(model=model, messages=messages,
+                                                                                   **llm_options(answer)))
+    chunks = []
+    usage = None
+    response, rest = None, ""
+    outcome = 'cancelled'
+    try:
+        async for chunk in upstream:
+            token = chunk.choices[0].delta.content
+            if token:
+                if not chunks:
+                    metrics.record('llm_first_token', time.perf_counter() - start)
+                chunks.append(token)
+                text = answer.feed(token) if answer is not None else token
+                if text:
+                    if flight is not None:
+                        flight.publish(text)
+                    yield sse_event({'token': text})
+            usage = chunk.usage or usage
+        response, rest = answer.finish() if answer is not None else ("".join(chunks), "")
+        if rest and flight is not None:
+            flight.publish(rest)
+        outcome = 'ok'
+    except Exception as e:
+        logging.error(f"Failed to stream response from Mistral API: {str(e)}")
+        outcome = 'error'
+        yield sse_event({'error': f"Failed to get response from Mistral API: {str(e)}"}, event='error')
+        return
+    finally:
+        await upstream.aclose()
+        admission.settle(usage)
+        admission.release()
+        metrics.record('llm', time.perf_counter() - start)
+        record_llm_call(model, 'stream', outcome, usage)
+        if outcome == 'ok':
+            on_complete(response)
+        elif outcome == 'cancelled':
+            logging.info("Chat stream cancelled before completion")
+        if flight is not None and outcome == 'ok':
+            flight.finish(response)
+        elif flight is not None:
+            flight.finish(error=f"Mistral stream {outcome}")
+
+    if rest:
+        yield sse_event({'token': rest})
+    yield sse_event({'response': response}, event='done')
+
+
+async def follow_chat(flight, on_complete):
+    # Async counterpart of app.follow_chat. The flight's chunks are closed
+    # here rather than left to the garbage collector, so a client that
+    # disconnects stops following straight away.
+    chunks = flight.afollow()
+    try:
+        async for text in chunks:
+            yield sse_event({'token': text})
+    except FlightError as e:
+        yield sse_event({'error': f"Failed to get response from Mistral API: {str(e)}"}, event='error')
+        return
+    finally:
+        await chunks.aclose()
+    on_complete(flight.result)
+    yield sse_event({'response': flight.result}, event='done')
+
+
+async def drain(events):
+    async for _ in events:
+        pass
+
+
+async def lead_chat(flight, producer):
+    # Stream a first-turn answer that identical requests may follow. The
+    # Mistral stream is read by the producer task, which publishes it to
+    # flight, and this client follows the flight like the others do. If it
+    # disconnects, the call goes on while others are still following it and
+    # is cancelled otherwise.
+    flight.attach()
+    events = follow_chat(flight, lambda response: None)  # The producer adds the answer to memory
+    try:
+        async for event in events:
+            yield event
+    finally:
+        await events.aclose()
+        if not flight.done and not flight.followers:
+            producer.cancel()
+
+
+async def complete_chat(messages, model, answer, admission):
+    # Async counterpart of app.complete_chat
+    try:
+        with stage('llm'):
+            chat_response = await llm_scheduler.acall(admission, lambda: mistral_client.chat(
+                model=model,
+                messages=messages,
+                **llm_options(answer)
+            ))
+    except Exception:
+        record_llm_call(model, 'blocking', 'error')
+        raise
+    admission.settle(chat_response.usage)
+    record_llm_call(model, 'blocking', 'ok', chat_response.usage)
+    refined_response = chat_response.choices[0].message.content
+    if answer is not None:
+        refined_response = answer.complete(refined_response)
+    return refined_response
+
+
+class AdmittedEvents:
+    # Response body for a stream that runs under admission. Its slot is
+    # released when the body is closed, and also when the body is dropped
+    # without ever being sent (the client left before the response started),
+    # in which case stream_chat never runs to release it.
+    def __init__(self, events, admission):
+        self.events = events
+        self.admission = admission
+        weakref.finalize(self, admission.release)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.events.__anext__()
+
+    async def aclose(self):
+        try:
+            await self.events.aclose()
+        finally:
+            self.admission.release()
+
+
+def not_ready_response():
+    return (jsonify({'error': 'The dataset index is still loading, please retry shortly', **warmup.status()}),
+            503, {'Retry-After': str(NOT_READY_RETRY_AFTER)})
+
+
+def overloaded_response(error):
+    logging.warning(f"Turning a chat request away: {error}")
+    return (jsonify({'error': 'Too many requests in progress, please retry shortly'}),
+            503, {'Retry-After': str(error.retry_after)})
+
+
+def sse_response(events):
+    return Response(events,
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache',
+                             'X-Accel-Buffering': 'no'})
+
+
+@app.route('/api/chat', methods=['POST'])
+async def chat():
+    data = await request.get_json()
+    user_message = data.get('message')
+    session_id = data.get('session_id')
+    stream = bool(data.get('stream', False))
+    n_results = retrieval_depth.max_k  # Most results to retrieve; the distance cut-off may keep fewer
+
+    if not user_message or not session_id:
+        return jsonify({'error': 'Message and session_id are required'}), 400
+
+    if not warmup.ready:
+        return not_ready_response()
+
+    try:
+        # Loading a session may read the session database, so keep it off the event loop
+        # The message is added to memory along with its answer (see app.chat)
+        memory = await run_in_executor(sessions.get, session_id)
+        first_turn = not memory.chat_memory.messages
+
+        retrieved = prefetcher.take(session_id, user_message)
+        if retrieved is None:
+            retrieved = await shared_route_and_retrieve(user_message, n_results)
+        query_vector, hits, messages, model, answer = await run_in_executor(prepare_chat, memory, user_message,
+                                                                            n_results, retrieved)
+
+        cached_response = lookup_cached_response(user_message, query_vector, hits) if first_turn else None
+        if cached_response is not None:
+            memory.add_turn(user_message, cached_response)
+            if stream:
+                return sse_response(stream_cached(cached_response))
+            return jsonify({'response': cached_response})
+
+        flight, leader = llm_flights.join(chat_flight_key(user_message, hits, model)) if first_turn else (None, True)
+        if not leader:
+            logging.info("Sharing the answer of an identical request in progress")
+            if stream:
+                return sse_response(follow_chat(flight, lambda response: memory.add_turn(user_message, response)))
+            refined_response = await flight.await_result()
+            memory.add_turn(user_message, refined_response)
+            return jsonify({'response': refined_response})
+
+        def on_complete(response):
+            memory.add_turn(user_message, response)
+            if first_turn:
+                response_cache.put(user_message, query_vector, hits, response)
+
+        try:
+            with stage('llm_queue'):
+                admission = await llm_scheduler.aadmit(estimate_call_tokens(messages))
+        except LLMOverloaded as e:
+            if flight is not None:
+                flight.finish(error=e)
+            return overloaded_response(e)
+
+        if stream and flight is not None:
+            # Started here, so the flight lands even if the response is never sent
+            producer = asyncio.create_task(drain(stream_chat(messages, on_complete, admission, model, answer,
+                                                             flight)))
+            background_tasks.add(producer)
+            producer.add_done_callback(background_tasks.discard)
+            return sse_response(lead_chat(flight, producer))
+        if stream:
+            return sse_response(AdmittedEvents(stream_chat(messages, on_complete, admission, model, answer),
+                                               admission))
+
+        try:
+            with admission:
+                refined_response = await complete_chat(messages, model, answer, admission)
+            on_complete(refined_response)
+        except BaseException as e:
+            # Also on cancellation (client disconnect), so followers aren't left waiting
+            if flight is not None:
+                flight.finish(error=e)
+            raise
+        if flight is not None:
+            flight.publish(refined_response)
+            flight.finish(refined_response)
+
+    except LLMOverloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        logging.error(f"Failed to get response from Mistral API: {str(e)}")
+        raise MixtralAPIError(f"Failed to get response from Mistral API: {str(e)}") from e
+
+    return jsonify({'response': refined_response})
+
+@app.route('/api/search', methods=['POST'])
+async def search():
+    try:
+        queries, n_results, stream = parse_search_request(await request.get_json() or {})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if not warmup.ready:
+        return not_ready_response()
+
+    if stream:
+        async def lines():
+            for chunk in search_chunks(queries):
+                for entry in await run_in_executor(search_chunk, chunk, n_results):
+                    yield json.dumps(entry) + "\n"
+        return Response(lines(), mimetype='application/x-ndjson')
+
+    results = []
+    for chunk in search_chunks(queries):
+        results.extend(await run_in_executor(search_chunk, chunk, n_results))
+    return jsonify({'results': results})
+
+@app.route('/api/prefetch', methods=['POST'])
+async def prefetch():
+    data = await request.get_json() or {}
+    partial_message = data.get('message')
+    session_id = data.get('session_id')
+
+    if not isinstance(partial_message, str) or not session_id:
+        return jsonify({'error': 'Message and session_id are required'}), 400
+
+    if not warmup.ready:
+        return not_ready_response()
+
+    scheduled = prefetcher.schedule(session_id, partial_message)
+    return jsonify({'status': 'scheduled' if scheduled else 'skipped'}), 202
+
+@app.route('/api/clear_history', methods=['POST'])
+async def clear_history():
+    data = await request.get_json()
+    session_id = data.get('session_id')
+
+    if not session_id:
+        return jsonify({'error': 'session_id is required'}), 400
+
+    sessions.clear(session_id)
+
+    logging.info(f"Conversation history cleared for session: {session_id}")
+    return jsonify({'message': 'Conversation history cleared'}), 200
+
+@app.route('/healthz', methods=['GET'])
+async def healthz():
+    return jsonify({'status': 'ok'}), 200
+
+@app.route('/readyz', methods=['GET'])
+async def readyz():
+    return jsonify(warmup.status()), 200 if warmup.ready else 503
+
+@app.route('/metrics', methods=['GET'])
+async def prometheus_metrics():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.after_serving
+async def shutdown():
+    await mistral_client.close()
+    executor.shutdown(wait=False)
+
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=5000)
@@ -0,0 +1,168 @@
+import os, json, logging, pickle, shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+PACKAGE_LIST = 'package_list'
+PACKAGE_SEARCH = 'package_search'
+
+# Packages fetched (and embedded and checkpointed) per page, and the number
+# of pages fetched concurrently
+INGEST_PAGE_SIZE = int(os.getenv('INGEST_PAGE_SIZE', 500))
+INGEST_CONCURRENCY = int(os.getenv('INGEST_CONCURRENCY', 4))
+
+# Characters of a package description that go into its embedded document
+NOTES_CHARS = 500
+
+
+def make_session(concurrency=INGEST_CONCURRENCY):
+    # Pooled connections to the CKAN host, with retries for transient errors
+    retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                  allowed_methods=['GET'])
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def package_document(package):
+    # Text embedded for a package_search result: title, description and tags
+    tags = ", ".join(tag['name'] for tag in package.get('tags') or [])
+    parts = [package.get('title') or package['name'], (package.get('notes') or "")[:NOTES_CHARS].strip()]
+    if tags:
+        parts.append(f"Tags: {tags}")
+    return "\n".join(part for part in parts if part)
+
+
+def package_metadata(package):
+    # Chroma metadata values must be scalars, so tags are joined
+    organization = package.get('organization') or {}
+    return {'name': package['name'],
+            'title': package.get('title') or "",
+            'organization': organization.get('title') or "",
+            'tags': ",".join(tag['name'] for tag in package.get('tags') or []),
+            'modified': package.get('metadata_modified') or ""}
+
+
+class CatalogIngest:
+    # Reads the CKAN catalog page by page and embeds it. With the
+    # package_search source each dataset is embedded from its title,
+    # description and tags; with package_list only the slug is available.
+    # Pages are fetched concurrently over a pooled session and each one is
+    # embedded and checkpointed as it arrives, so an interrupted run resumes
+    # with the pages it had not finished.
+    def __init__(self, api_url, checkpoint_dir, source=PACKAGE_SEARCH, page_size=INGEST_PAGE_SIZE,
+                 concurrency=INGEST_CONCURRENCY, session=None):
+        if source not in (PACKAGE_LIST, PACKAGE_SEARCH):
+            raise ValueError(f"Unknown catalog source: {source}")
+        self.api_url = api_url
+        self.checkpoint_dir = checkpoint_dir
+        self.source = source
+        self.page_size = page_size
+        self.concurrency = concurrency
+        self.session = session or make_session(concurrency)
+        self._package_list = None
+
+    def get(self, action, **params):
+        response = self.session.get(f"{self.api_url}/{action}", params=params, timeout=60)
+        response.raise_for_status()
+        return response.json()['result']
+
+    def count(self):
+        if self.source == PACKAGE_LIST:
+            self._package_list = self.get('package_list')
+            return len(self._package_list)
+        return self.get('package_search', rows=0)['count']
+
+    # One page of (names, documents, metadatas), in catalog order
+    def fetch_page(self, start):
+        if self.source == PACKAGE_LIST:
+            names = self._package_list[start:start + self.page_size]
+            return names, list(names), [{'name': name} for name in names]
+        packages = self.get('package_search', rows=self.page_size, start=start, sort='name asc')['results']
+        return ([package['name'] for package in packages], [package_document(package) for package in packages],
+                [package_metadata(package) for package in packages])
+
+    # Fetch pages concurrently, yielding (start, page) as each one arrives
+    def pages(self, starts):
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='ingest') as executor:
+            futures = {executor.submit(self.fetch_page, start): start for start in starts}
+            try:
+                for future in as_completed(futures):
+                    yield futures[future], future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    # The whole catalog as (names, documents, metadatas), without embedding
+    def fetch_catalog(self):
+        pages = dict(self.pages(range(0, self.count(), self.page_size)))
+        return self.merge(pages[start] for start in sorted(pages))
+
+    # Embed the whole catalog, resuming from checkpoints left by an
+    # interrupted run. Returns (names, vectors, metadatas).
+    def run(self, embedding_function, model_name):
+        count = self.count()
+        self.prepare_checkpoints({'source': self.source, 'api_url': self.api_url, 'model': model_name,
+                                  'page_size': self.page_size, 'count': count})
+        starts = range(0, count, self.page_size)
+        pending = [start for start in starts if not os.path.exists(self.page_path(start))]
+        if len(pending) < len(starts):
+            logging.info(f"Resuming catalog ingest: {len(starts) - len(pending)} of {len(starts)} pages done.")
+
+        for done, (start, (names, documents, metadatas)) in enumerate(self.pages(pending), 1):
+            vectors = np.asarray(embedding_function(documents), dtype=np.float32) if documents else None
+            self.write_page(start, (names, vectors, metadatas))
+            logging.info(f"Ingested catalog page {done}/{len(pending)} ({len(names)} datasets).")
+
+        pages = []
+        for start in starts:
+            with open(self.page_path(start), 'rb') as f:
+                pages.append(pickle.load(f))
+        return self.merge(pages)
+
+    # Concatenate pages, dropping datasets that moved across a page boundary
+    # while the catalog was being read
+    @staticmethod
+    def merge(pages):
+        seen = set()
+        names, columns, metadatas = [], [], []
+        for page_names, page_column, page_metadatas in pages:
+            for i, name in enumerate(page_names):
+                if name in seen:
+                    continue
+                seen.add(name)
+                names.append(name)
+                columns.append(page_column[i])
+                metadatas.append(page_metadatas[i])
+        if columns and isinstance(columns[0], np.ndarray):
+            columns = np.stack(columns)
+        return names, columns, metadatas
+
+    def page_path(self, start):
+        return os.path.join(self.checkpoint_dir, f"page-{start:08d}.pkl")
+
+    def write_page(self, start, page):
+        path = self.page_path(start)
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(page, f)
+        os.replace(path + '.tmp', path)
+
+    # Keep checkpoints only if they were written for the same catalog and settings
+    def prepare_checkpoints(self, state):
+        state_path = os.path.join(self.checkpoint_dir, 'state.json')
+        if os.path.exists(state_path):
+            with open(state_path) as f:
+                if json.load(f) == state:
+                    return
+            logging.info("Discarding ingest checkpoints from a different catalog or settings.")
+            shutil.rmtree(self.checkpoint_dir)
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        with open(state_path, 'w') as f:
+            json.dump(state, f)
+
+    def clear_checkpoints(self):
+        shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
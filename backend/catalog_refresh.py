@@ -0,0 +1,31 @@
+import logging, threading
+
+
+class CatalogRefresher:
+    # Background thread that periodically brings the vector store up to date
+    # with the CKAN package list. Queries keep using the live index while the
+    # refreshed one is built.
+    # on_refresh, if set, is called with the refresh result whenever the
+    # catalog changed.
+    def __init__(self, vector_store, interval, on_refresh=None):
+        self.vector_store = vector_store
+        self.interval = interval
+        self.on_refresh = on_refresh
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='catalog-refresh', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                result = self.vector_store.refresh_catalog()
+                if result and any(result.values()) and self.on_refresh:
+                    self.on_refresh(result)
+            except Exception as e:
+                logging.error(f"Catalog refresh failed: {str(e)}")
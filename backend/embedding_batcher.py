@@ -0,0 +1,88 @@
+import os, logging, queue, threading, time, weakref
+from concurrent.futures import Future
+
+
+class EmbeddingBatcher:
+    # Collects query texts submitted from concurrent request threads and
+    # encodes them together on a single worker thread. A batch is flushed once
+    # it holds max_batch_size texts or max_wait_ms has passed since its first
+    # text arrived, and each caller gets back only its own vector.
+    def __init__(self, encode, max_batch_size=32, max_wait_ms=5):
+        self.encode = encode
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.batches = 0
+        self.items = 0
+        self._start()
+        _batchers.add(self)
+
+    def _start(self):
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='embedding-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, text):
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def embed(self, texts):
+        futures = [self.submit(text) for text in texts]
+        return [future.result() for future in futures]
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def stats(self):
+        return {'batches': self.batches,
+                'items': self.items,
+                'mean_batch_size': self.items / self.batches if self.batches else 0.0}
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._flush(batch)
+
+    def _flush(self, batch):
+        texts = [text for text, _ in batch]
+        try:
+            vectors = self.encode(texts)
+        except Exception as e:
+            logging.error(f"Failed to encode batch of {len(texts)} queries: {str(e)}")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        self.batches += 1
+        self.items += len(batch)
+        for (_, future), vector in zip(batch, vectors):
+            future.set_result(vector)
+
+
+# A forked child (e.g. a pre-forked server worker) only inherits the thread
+# that called fork(), so each live batcher gets a fresh queue and worker there
+_batchers = weakref.WeakSet()
+
+def _restart_after_fork():
+    for batcher in list(_batchers):
+        batcher._start()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_after_fork)
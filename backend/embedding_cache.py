@@ -0,0 +1,81 @@
+import os, logging, pickle, threading
+from collections import OrderedDict
+import numpy as np
+
+
+def normalize_query(text):
+    # The MiniLM tokenizer is uncased and ignores runs of whitespace, so these
+    # variants produce the same embedding and can share a cache entry.
+    return " ".join(text.lower().split())
+
+
+class EmbeddingCache:
+    # Bounded LRU cache of query embeddings keyed on the normalized query text,
+    # optionally persisted to disk so repeat queries survive restarts.
+    def __init__(self, max_size=10000, path=None, model_name=None):
+        self.max_size = max_size
+        self.path = path
+        self.model_name = model_name
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if path:
+            self.load()
+
+    def get(self, text):
+        key = normalize_query(text)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, text, vector):
+        key = normalize_query(text)
+        vector = np.array(vector, dtype=np.float32)
+        vector.flags.writeable = False
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'rb') as f:
+                model_name, entries = pickle.load(f)
+        except Exception as e:
+            logging.warning(f"Ignoring unreadable query embedding cache {self.path}: {str(e)}")
+            return
+        if model_name != self.model_name:
+            logging.info(f"Ignoring query embedding cache built with {model_name}.")
+            return
+        for key, vector in entries[-self.max_size:]:
+            self.put(key, vector)
+        logging.info(f"Loaded {len(self._entries)} cached query embeddings.")
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            entries = [(key, np.asarray(vector)) for key, vector in self._entries.items()]
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((self.model_name, entries), f)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,51 @@
+import os, gc, signal
+
+# Pre-fork serving mode, run from backend/ with
+#   gunicorn -c gunicorn.conf.py app:app
+# The app (embedding model, catalog embeddings, index) is loaded once in the
+# master and the workers are forked from it, so they share those pages
+# copy-on-write instead of each loading their own copy.
+
+workers = int(os.getenv('WEB_CONCURRENCY', os.cpu_count() or 1))
+# The workers split the Mistral quota between them (see llm_scheduler.py)
+os.environ['WEB_CONCURRENCY'] = str(workers)
+threads = int(os.getenv('WORKER_THREADS', 4))
+bind = os.getenv('BIND', '0.0.0.0:5000')
+timeout = int(os.getenv('WORKER_TIMEOUT', 120))
+preload_app = True
+
+# Threads don't survive fork(), so load everything before the workers are
+# forked rather than in the background
+os.environ['BACKGROUND_LOAD'] = '0'
+
+# The numpy index is memory-mapped, so all workers read one page-cache copy.
+# A Chroma client (and its SQLite connections) can't be shared across fork().
+os.environ.setdefault('SEARCH_BACKEND', 'numpy')
+
+# torch threads per worker, splitting the cores between the workers
+TORCH_THREADS = int(os.getenv('TORCH_THREADS', max(1, (os.cpu_count() or 1) // workers)))
+
+# The master encodes on a single thread: once OpenMP has started its thread
+# pool, forked children hang on their first parallel op.
+import torch
+torch.set_num_threads(1)
+
+
+def when_ready(server):
+    # Catalog refreshes run in the master. A refreshed index reaches the
+    # workers by replacing them (SIGHUP), since new workers are forked from
+    # the master's updated state.
+    import app
+    if app.catalog_refresher is not None:
+        app.catalog_refresher.on_refresh = lambda result: os.kill(server.pid, signal.SIGHUP)
+
+
+def pre_fork(server, worker):
+    # Keep the garbage collector from writing to (and so copying) the pages
+    # of objects loaded in the master
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    torch.set_num_threads(TORCH_THREADS)
+    server.log.info(f"Worker {worker.pid} using {TORCH_THREADS} torch threads")
@@ -0,0 +1,66 @@
+import re, threading
+import numpy as np
+from lexical_index import is_slug_like
+
+CONVERSATIONAL = 'conversational'
+DATASET_QUERY = 'dataset_query'
+
+# Utterances answered without any dataset lookup (see the `user` prompt)
+SMALL_TALK = {'hi', 'hello', 'hey', 'hiya', 'thanks', 'thank you', 'thanks a lot', 'cheers', 'amazing',
+              'great', 'cool', 'nice', 'ok', 'okay', 'perfect', 'awesome', 'how are you', 'whats up',
+              'good morning', 'good afternoon', 'good evening', 'bye', 'goodbye', 'see you',
+              'who are you', 'what can you do'}
+
+# Example messages the nearest-centroid check compares against
+CONVERSATIONAL_EXAMPLES = ["hi there", "thanks, that was helpful", "how are you today", "whats up",
+                           "you are amazing", "good morning", "tell me about yourself", "see you later"]
+DATASET_EXAMPLES = ["housing data for Dublin", "datasets about vocational training",
+                    "road traffic statistics", "population census 2016", "water quality measurements",
+                    "list datasets on further education", "covid cases by county", "public transport usage"]
+
+
+def normalize_utterance(text):
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower().replace("'", "")))
+
+
+class IntentRouter:
+    # Classifies a message as small talk or a dataset query before any
+    # retrieval happens: first against a small lexicon, then by comparing the
+    # query embedding with the centroids of the two example sets. Messages
+    # that are slug-like, or that names_slug(message) says spell out a
+    # dataset slug, are dataset queries without being embedded.
+    def __init__(self, embed_queries, margin=0.05, names_slug=None):
+        self.embed_queries = embed_queries
+        self.names_slug = names_slug
+        self.margin = margin
+        self._centroids = None
+        self._lock = threading.Lock()
+
+    def centroids(self):
+        with self._lock:
+            if self._centroids is None:
+                self._centroids = np.stack([self._centroid(CONVERSATIONAL_EXAMPLES),
+                                            self._centroid(DATASET_EXAMPLES)])
+            return self._centroids
+
+    def _centroid(self, examples):
+        vectors = np.asarray(self.embed_queries(examples), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        centroid = vectors.mean(axis=0)
+        return centroid / np.linalg.norm(centroid)
+
+    # Returns (intent, query_vector). The vector is None when no embedding
+    # was needed, and can otherwise be reused for retrieval.
+    def classify(self, message):
+        utterance = normalize_utterance(message)
+        if not utterance or utterance in SMALL_TALK:
+            return CONVERSATIONAL, None
+        if is_slug_like(message) or (self.names_slug is not None and self.names_slug(message)):
+            return DATASET_QUERY, None
+
+        query_vector = self.embed_queries([message])[0]
+        query = np.asarray(query_vector, dtype=np.float32)
+        conversational, dataset = self.centroids() @ (query / (np.linalg.norm(query) or 1.0))
+        if conversational - dataset > self.margin:
+            return CONVERSATIONAL, query_vector
+        return DATASET_QUERY, query_vector
@@ -0,0 +1,124 @@
+import math, re, heapq
+from collections import defaultdict
+import numpy as np
+
+# Words that carry no signal when matching queries against dataset slugs
+STOPWORDS = {'a', 'an', 'and', 'any', 'are', 'about', 'can', 'data', 'dataset', 'datasets', 'do', 'find',
+             'for', 'have', 'i', 'in', 'is', 'me', 'of', 'on', 'or', 'show', 'the', 'there', 'to',
+             'want', 'what', 'which', 'with', 'you'}
+
+# Reciprocal rank fusion constant
+RRF_K = 60
+
+
+def tokenize(text):
+    return re.findall(r'[a-z0-9]+', text.lower())
+
+
+def is_slug_like(query):
+    # A single term with a hyphen or a digit, e.g. "ppo08" or "youthreach-2020"
+    query = query.strip()
+    return bool(query) and not any(c.isspace() for c in query) and ('-' in query or any(c.isdigit() for c in query))
+
+
+class LexicalIndex:
+    # BM25 inverted index over dataset slugs. ids and dataset_names are kept
+    # as given and read by document number on demand, so the memory-mapped
+    # columns of an mmap index are not copied into Python strings. Postings
+    # are numpy arrays of document numbers and term frequencies, and exact
+    # slugs are looked up by their hash.
+    def __init__(self, ids, dataset_names, k1=1.2, b=0.75):
+        self.ids = ids
+        self.names = dataset_names
+        self.k1 = k1
+        self.b = b
+        postings = defaultdict(list)  # token -> [(doc, term frequency)]
+        doc_lengths = []
+        self.slugs = {}  # hash of a slug -> first doc with it
+        for doc, name in enumerate(dataset_names):
+            tokens = tokenize(name)
+            doc_lengths.append(len(tokens))
+            self.slugs.setdefault(hash("-".join(tokens)), doc)
+            counts = defaultdict(int)
+            for token in tokens:
+                counts[token] += 1
+            for token, tf in counts.items():
+                postings[token].append((doc, tf))
+        self.postings = {token: (np.array([doc for doc, _ in entries], dtype=np.int32),
+                                 np.array([tf for _, tf in entries], dtype=np.int32))
+                         for token, entries in postings.items()}
+        self.doc_lengths = np.array(doc_lengths, dtype=np.int32)
+        self.avg_length = float(self.doc_lengths.mean()) if len(doc_lengths) else 0.0
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    # The doc whose name is exactly this slug, or None
+    def slug_doc(self, slug):
+        doc = self.slugs.get(hash(slug))
+        if doc is None or "-".join(tokenize(self.names[doc])) != slug:
+            return None
+        return doc
+
+    # True if the query spells out a dataset slug, e.g. "road traffic counts"
+    def names_slug(self, query):
+        return self.slug_doc("-".join(tokenize(query))) is not None
+
+    def query_tokens(self, query):
+        return [token for token in tokenize(query) if token not in STOPWORDS]
+
+    def idf(self, df):
+        return math.log(1 + (len(self) - df + 0.5) / (df + 0.5))
+
+    def scores(self, tokens):
+        scores = defaultdict(float)
+        for token in set(tokens):
+            if token not in self.postings:
+                continue
+            docs, tfs = self.postings[token]
+            norms = self.k1 * (1 - self.b + self.b * self.doc_lengths[docs] / self.avg_length)
+            weights = self.idf(len(docs)) * tfs * (self.k1 + 1) / (tfs + norms)
+            for doc, weight in zip(docs.tolist(), weights.tolist()):
+                scores[doc] += weight
+        return scores
+
+    def hit(self, doc, score):
+        return {'id': self.ids[doc], 'name': self.names[doc], 'distance': None, 'score': score}
+
+    def search(self, query, n_results=10):
+        scores = self.scores(self.query_tokens(query))
+        return [self.hit(doc, score) for doc, score in heapq.nlargest(n_results, scores.items(), key=lambda x: x[1])]
+
+    # Lexical-only answer for queries that name slugs directly: an exact slug,
+    # or a slug-like term whose tokens all occur in some dataset names.
+    # Returns None when the query needs the vector search.
+    def exact_hits(self, query, n_results=10):
+        tokens = tokenize(query)
+        if not tokens:
+            return None
+        exact = self.slug_doc("-".join(tokens))
+        if exact is None and not is_slug_like(query):
+            return None
+
+        matching = None
+        for token in set(tokens):
+            docs = set(self.postings[token][0].tolist()) if token in self.postings else set()
+            matching = docs if matching is None else matching & docs
+        if not matching:
+            return None
+
+        scores = self.scores(tokens)
+        ranked = sorted(matching, key=lambda doc: (doc != exact, -scores[doc]))[:n_results]
+        return [self.hit(doc, scores[doc]) for doc in ranked]
+
+
+def fuse(vector_hits, lexical_hits, n_results=10):
+    # Reciprocal rank fusion of the vector and lexical rankings
+    fused = {}
+    for hits in (vector_hits, lexical_hits):
+        for rank, hit in enumerate(hits):
+            entry = fused.setdefault(hit['id'], dict(hit, score=0.0))
+            if entry.get('distance') is None:
+                entry['distance'] = hit.get('distance')
+            entry['score'] += 1.0 / (RRF_K + rank + 1)
+    return sorted(fused.values(), key=lambda hit: -hit['score'])[:n_results]
@@ -0,0 +1,366 @@
+import os, asyncio, logging, math, random, threading, time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from mistralai.constants import RETRY_STATUS_CODES
+from mistralai.exceptions import MistralConnectionException
+from metrics import LLM_ADMISSIONS, LLM_RETRIES
+from tokens import estimate_tokens
+
+# Our Mistral API quota: requests and tokens (prompt + completion) per minute
+MISTRAL_RPM = int(os.getenv('MISTRAL_RPM', 300))
+MISTRAL_TPM = int(os.getenv('MISTRAL_TPM', 500000))
+
+# Server processes sharing that quota. Each one's buckets hold an equal share,
+# so together they stay within it. gunicorn.conf.py sets this to its worker
+# count; when running several hypercorn workers, set it to their number.
+WEB_CONCURRENCY = max(1, int(os.getenv('WEB_CONCURRENCY', 1)))
+
+# Mistral calls in progress at once from this process, and requests allowed to
+# wait for one. Past LLM_MAX_QUEUE waiting, or after LLM_QUEUE_TIMEOUT seconds
+# without a slot and quota, requests are turned away with a 503 and a
+# Retry-After instead of queueing without bound.
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 16))
+LLM_MAX_QUEUE = int(os.getenv('LLM_MAX_QUEUE', 64))
+LLM_QUEUE_TIMEOUT = float(os.getenv('LLM_QUEUE_TIMEOUT', 5))
+
+# Retries of a call that got a 429/5xx or couldn't connect. The delay before
+# retry n is drawn uniformly from [0, LLM_BACKOFF_BASE * 2**n] seconds, capped
+# at LLM_BACKOFF_MAX, and is at least the Retry-After Mistral sent.
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', 3))
+LLM_BACKOFF_BASE = float(os.getenv('LLM_BACKOFF_BASE', 0.5))
+LLM_BACKOFF_MAX = float(os.getenv('LLM_BACKOFF_MAX', 8))
+
+# Completion tokens reserved per call until its actual usage is known
+COMPLETION_TOKEN_ESTIMATE = 300
+
+# Statuses that mean Mistral itself is out of capacity for us
+THROTTLED_STATUSES = (429, 503)
+
+
+class LLMOverloaded(Exception):
+    # No capacity for a Mistral call: the wait queue is full, no slot or
+    # quota freed up in time, or Mistral kept throttling us after retries.
+    # retry_after is the number of seconds clients are asked to wait.
+    def __init__(self, reason, retry_after):
+        super().__init__(f"Too many requests to the Mistral API in progress ({reason})")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def estimate_call_tokens(messages):
+    return sum(estimate_tokens(message['content']) for message in messages) + COMPLETION_TOKEN_ESTIMATE
+
+
+class TokenBucket:
+    # Refills continuously at rate_per_minute, holding at most a minute's
+    # worth. Not thread-safe; LLMScheduler serializes access.
+    def __init__(self, rate_per_minute):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(rate_per_minute)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Seconds until amount is available (amounts over the capacity wait for a full bucket)
+    def wait_time(self, amount, now):
+        self.refill(now)
+        return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+    # The level may go negative (a call that used more than was reserved); the debt is repaid by refilling
+    def take(self, amount, now):
+        self.refill(now)
+        self.level -= amount
+
+
+class Admission:
+    # A call slot held for one Mistral call, including its retries, and the
+    # tokens reserved per attempt. Releasing is idempotent.
+    def __init__(self, scheduler, tokens):
+        self.scheduler = scheduler
+        self.tokens = tokens
+        self.released = False
+
+    def settle(self, usage):
+        # Correct the token bucket once the actual usage is known
+        if usage is not None:
+            self.scheduler.take_tokens(usage.total_tokens - self.tokens)
+
+    def release(self):
+        self.scheduler.release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class LLMScheduler:
+    # Admission control for outbound Mistral calls. A request first gets one
+    # of max_concurrency call slots, waiting in a bounded queue, then each
+    # attempt takes a request and its estimated tokens from buckets sized to
+    # the API quota. Calls that are throttled (429) or fail with a 5xx are
+    # retried with jittered exponential backoff. When the queue is full or
+    # the wait would pass the deadline, LLMOverloaded is raised straight
+    # away, so overload sheds requests instead of growing the tail latency.
+    # Waiting requests get slots in arrival order: each one waits on a
+    # future, and a released slot is handed straight to the oldest. The
+    # quota is split evenly between the processes that share it.
+    def __init__(self, rpm=MISTRAL_RPM, tpm=MISTRAL_TPM, max_concurrency=LLM_MAX_CONCURRENCY,
+                 max_queue=LLM_MAX_QUEUE, queue_timeout=LLM_QUEUE_TIMEOUT, max_retries=LLM_MAX_RETRIES,
+                 backoff_base=LLM_BACKOFF_BASE, backoff_max=LLM_BACKOFF_MAX, processes=WEB_CONCURRENCY):
+        self.requests = TokenBucket(rpm / processes)
+        self.tokens = TokenBucket(tpm / processes)
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.active = 0
+        self.queue = deque()  # Futures of the requests waiting for a slot, oldest first
+        self._lock = threading.RLock()
+
+    @property
+    def waiting(self):
+        return len(self.queue)
+
+    def admit(self, tokens):
+        # Wait for a call slot; returns an Admission to release once the call is done
+        waiter = self.enqueue()
+        if waiter is not None:
+            try:
+                waiter.result(self.queue_timeout)
+            except FutureTimeout:
+                if not self.dequeue(waiter):
+                    raise self.overloaded('timeout') from None
+        LLM_ADMISSIONS.inc(result='admitted')
+        return Admission(self, tokens)
+
+    async def aadmit(self, tokens):
+        # Counterpart of admit for the async app, awaiting the future on the event loop
+        waiter = self.enqueue()
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.wrap_future(waiter), self.queue_timeout)
+            except asyncio.TimeoutError:
+                if not self.dequeue(waiter):
+                    raise self.overloaded('timeout') from None
+            except asyncio.CancelledError:
+                # The request went away: pass on a slot it was handed meanwhile
+                if self.dequeue(waiter):
+                    self.release(Admission(self, 0))
+                raise
+        LLM_ADMISSIONS.inc(result='admitted')
+        return Admission(self, tokens)
+
+    def enqueue(self):
+        # Take a free slot, returning None, or a place in the queue, returning
+        # the future that is resolved once a slot is handed over
+        with self._lock:
+            if self.active < self.max_concurrency and not self.queue:
+                self.active += 1
+                return None
+            if len(self.queue) >= self.max_queue:
+                raise self.overloaded('queue_full')
+            waiter = Future()
+            self.queue.append(waiter)
+            return waiter
+
+    def dequeue(self, waiter):
+        # Stop waiting; returns True if a slot was handed over in the meantime
+        with self._lock:
+            if waiter in self.queue:
+                self.queue.remove(waiter)
+                return False
+            return not waiter.cancelled()
+
+    def release(self, admission):
+        with self._lock:
+            if admission.released:
+                return
+            admission.released = True
+            # The slot goes to the oldest waiter still waiting, if there is one
+            while self.queue:
+                waiter = self.queue.popleft()
+                if waiter.set_running_or_notify_cancel():
+                    waiter.set_result(None)
+                    return
+            self.active -= 1
+
+    def overloaded(self, reason, retry_after=None):
+        LLM_ADMISSIONS.inc(result=reason)
+        if retry_after is None:
+            with self._lock:
+                retry_after = self.requests.wait_time(1, time.monotonic())
+        return LLMOverloaded(reason, max(1, math.ceil(retry_after)))
+
+    def take_tokens(self, amount):
+        with self._lock:
+            self.tokens.take(amount, time.monotonic())
+
+    def quota_wait(self, tokens):
+        # Take a request and the tokens from the buckets if both are
+        # available; otherwise return the seconds until they will be
+        with self._lock:
+            now = time.monotonic()
+            wait = max(self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+            if wait == 0:
+                self.requests.take(1, now)
+                self.tokens.take(tokens, now)
+            return wait
+
+    def take_quota(self, tokens):
+        deadline = time.monotonic() + self.queue_timeout
+        while True:
+            wait = self.quota_wait(tokens)
+            if wait == 0:
+                return
+            if time.monotonic() + wait > deadline:
+                raise self.overloaded('rate_limited', wait)
+            time.sleep(wait)
+
+    async def atake_quota(self, tokens):
+        deadline = time.monotonic() + self.queue_timeout
+        while True:
+            wait = self.quota_wait(tokens)
+            if wait == 0:
+                return
+            if time.monotonic() + wait > deadline:
+                raise self.overloaded('rate_limited', wait)
+            await asyncio.sleep(wait)
+
+    def retry_delay(self, error, attempt):
+        # Seconds to wait before retrying after error, or None if it can't be retried
+        status = getattr(error, 'http_status', None)
+        if attempt >= self.max_retries or not (status in RETRY_STATUS_CODES
+                                               or isinstance(error, MistralConnectionException)):
+            return None
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        LLM_RETRIES.inc(reason=str(status or 'connection'))
+        logging.warning(f"Mistral API call failed ({status or 'connection error'}), "
+                        f"retry {attempt + 1} of {self.max_retries} in {delay:.2f}s")
+        return delay
+
+    def give_up(self, error):
+        # Once retries are exhausted, throttling by Mistral becomes a 503 for our clients
+        if getattr(error, 'http_status', None) in THROTTLED_STATUSES:
+            raise self.overloaded('throttled', retry_after_seconds(error) or self.backoff_max) from error
+
+    def call(self, admission, request):
+        # Run request() (a blocking Mistral call) within the quota, retrying transient failures
+        attempt = 0
+        while True:
+            self.take_quota(admission.tokens)
+            try:
+                return request()
+            except Exception as e:
+                delay = self.retry_delay(e, attempt)
+                if delay is None:
+                    self.give_up(e)
+                    raise
+            attempt += 1
+            time.sleep(delay)
+
+    async def acall(self, admission, request):
+        # Counterpart of call; request() returns a coroutine
+        attempt = 0
+        while True:
+            await self.atake_quota(admission.tokens)
+            try:
+                return await request()
+            except Exception as e:
+                delay = self.retry_delay(e, attempt)
+                if delay is None:
+                    self.give_up(e)
+                    raise
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def stream(self, admission, open_stream):
+        # Yield the chunks of open_stream() (a streamed Mistral call). It is
+        # retried until its first chunk arrives; after that the client has
+        # seen part of the answer, so failures are raised.
+        attempt = 0
+        while True:
+            self.take_quota(admission.tokens)
+            upstream = open_stream()
+            try:
+                first = next(upstream)
+            except StopIteration:
+                return
+            except Exception as e:
+                upstream.close()
+                delay = self.retry_delay(e, attempt)
+                if delay is None:
+                    self.give_up(e)
+                    raise
+                attempt += 1
+                time.sleep(delay)
+                continue
+            try:
+                yield first
+                yield from upstream
+            finally:
+                upstream.close()
+            return
+
+    async def astream(self, admission, open_stream):
+        # Counterpart of stream for async generators
+        attempt = 0
+        while True:
+            await self.atake_quota(admission.tokens)
+            upstream = open_stream()
+            try:
+                first = await upstream.__anext__()
+            except StopAsyncIteration:
+                return
+            except Exception as e:
+                await upstream.aclose()
+                delay = self.retry_delay(e, attempt)
+                if delay is None:
+                    self.give_up(e)
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            try:
+                yield first
+                async for chunk in upstream:
+                    yield chunk
+            finally:
+                await upstream.aclose()
+            return
+
+
+def retry_after_seconds(error):
+    # The Retry-After Mistral sent with an error, if it is a number of seconds
+    value = (getattr(error, 'headers', None) or {}).get('retry-after')
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def read_error_bodies(client):
+    # mistralai builds the exception for a failed streamed call from the
+    # response body without reading it first, which raises httpx's
+    # ResponseNotRead instead of the status error that retries depend on.
+    # Read error bodies as soon as the response arrives.
+    http_client = client._client
+    if asyncio.iscoroutinefunction(http_client.send):
+        async def read(response):
+            if response.status_code >= 400:
+                await response.aread()
+    else:
+        def read(response):
+            if response.status_code >= 400:
+                response.read()
+    http_client.event_hooks['response'].append(read)
+    return client
@@ -0,0 +1,174 @@
+import time, threading, contextvars
+from contextlib import contextmanager
+
+# Histogram buckets in seconds, from a cached lookup up to a slow LLM answer
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+def format_value(value):
+    return repr(float(value)) if value != float('inf') else "+Inf"
+
+
+class Metric:
+    # Base for the Prometheus text-format metrics below. Values are kept per
+    # label combination; label values are passed as keyword arguments.
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+        # Unlabelled metrics are exported from the start, at zero
+        if not self.labelnames:
+            self._values[()] = self.zero()
+
+    def label_key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple((name, labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            for key, value in sorted(self._values.items(), key=lambda item: str(item[0])):
+                lines.extend(self.samples(key, value))
+        return lines
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def zero(self):
+        return 0
+
+    def inc(self, amount=1, **labels):
+        key = self.label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self.label_key(labels), 0)
+
+    def samples(self, key, value):
+        return [f"{self.name}{format_labels(key)} {format_value(value)}"]
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        super().__init__(name, documentation, labelnames)
+
+    def zero(self):
+        return [0] * len(self.buckets), 0.0
+
+    def observe(self, value, **labels):
+        key = self.label_key(labels)
+        with self._lock:
+            counts, total = self._values.get(key) or self.zero()
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels):
+        counts, _ = self._values.get(self.label_key(labels), ([0], 0.0))
+        return counts[-1]
+
+    def samples(self, key, value):
+        counts, total = value
+        lines = [f"{self.name}_bucket{format_labels(key + (('le', format_value(bound)),))} {count}"
+                 for bound, count in zip(self.buckets, counts)]
+        lines.append(f"{self.name}_sum{format_labels(key)} {format_value(total)}")
+        lines.append(f"{self.name}_count{format_labels(key)} {counts[-1]}")
+        return lines
+
+
+REGISTRY = []
+
+REQUEST_SECONDS = Histogram('chatmixtral_request_seconds', "Time to produce a response, by endpoint.",
+                            ['endpoint'])
+STAGE_SECONDS = Histogram('chatmixtral_stage_seconds',
+                          "Time spent in each stage of a request (route, embed, search, lexical, "
+                          "prompt, cache, llm_queue, llm, llm_first_token).", ['stage'])
+CACHE_LOOKUPS = Counter('chatmixtral_cache_lookups_total', "Cache lookups, by cache and result.",
+                        ['cache', 'result'])
+EMBEDDED_TEXTS = Counter('chatmixtral_embedded_texts_total', "Query texts encoded by the embedding model.")
+LLM_REQUESTS = Counter('chatmixtral_llm_requests_total', "Mistral API calls, by model, mode and outcome.",
+                       ['model', 'mode', 'outcome'])
+LLM_TOKENS = Counter('chatmixtral_llm_tokens_total', "Tokens used by Mistral API calls, by model and kind.",
+                     ['model', 'kind'])
+
+COALESCED_REQUESTS = Counter('chatmixtral_coalesced_requests_total',
+                             "Requests that shared identical work already in progress, by kind of work.", ['flight'])
+RETRIEVAL_DEPTH = Histogram('chatmixtral_retrieval_depth', "Search hits kept for the prompt after the distance cut-off.",
+                            buckets=(0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20))
+LLM_ADMISSIONS = Counter('chatmixtral_llm_admissions_total',
+                         "Requests for a Mistral call slot, by result (admitted, queue_full, timeout, rate_limited, "
+                         "throttled).", ['result'])
+LLM_RETRIES = Counter('chatmixtral_llm_retries_total', "Retried Mistral API calls, by status (or connection).",
+                      ['reason'])
+
+
+def render():
+    # All registered metrics in the Prometheus text exposition format
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+# Per-request stage timings, reported in the Server-Timing header
+class RequestTimer:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def server_timing(self):
+        entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items()]
+        entries.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(entries)
+
+
+_request_timer = contextvars.ContextVar('request_timer', default=None)
+
+
+def start_request():
+    timer = RequestTimer()
+    _request_timer.set(timer)
+    return timer
+
+
+def current_request():
+    return _request_timer.get()
+
+
+def record(name, seconds):
+    STAGE_SECONDS.observe(seconds, stage=name)
+    timer = _request_timer.get()
+    if timer is not None:
+        timer.stages[name] = timer.stages.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name):
+    # Time a block as one stage of the current request. Repeated stages add up.
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
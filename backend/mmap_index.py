@@ -0,0 +1,61 @@
+import os, json
+import numpy as np
+
+
+def normalize(vectors):
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class MmapIndex:
+    # Exact cosine top-k search over normalized float32 embeddings stored in a
+    # .npy file. The matrix is opened with mmap, so worker processes on the
+    # same host share one page-cache-backed copy instead of each loading it.
+    def __init__(self, path):
+        self.path = path
+        self.vectors = np.load(path + '.npy', mmap_mode='r')
+        with open(path + '.json') as f:
+            columns = json.load(f)
+        self.ids = columns['ids']
+        self.names = columns['names']
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(path + '.npy') and os.path.exists(path + '.json')
+
+    @classmethod
+    def build(cls, path, ids, dataset_names, vectors):
+        # Write to temporary files first so readers never see a half-written index
+        matrix = normalize(vectors)
+        with open(path + '.tmp.npy', 'wb') as f:
+            np.save(f, matrix)
+        with open(path + '.tmp.json', 'w') as f:
+            json.dump({'ids': list(ids), 'names': list(dataset_names)}, f)
+        os.replace(path + '.tmp.npy', path + '.npy')
+        os.replace(path + '.tmp.json', path + '.json')
+        return cls(path)
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    # Score one or many query vectors with a single matrix product.
+    # Returns one list of hits per query, best first, with Chroma-style
+    # cosine distances (1 - similarity).
+    def search(self, query_vectors, n_results=10):
+        k = min(n_results, len(self))
+        queries = normalize(query_vectors)
+        if k == 0:
+            return [[] for _ in range(len(queries))]
+
+        scores = queries @ self.vectors.T
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+        return [[{'id': self.ids[i], 'name': self.names[i], 'distance': float(1.0 - score)}
+                 for i, score in zip(row, row_scores)]
+                for row, row_scores in zip(top.tolist(), top_scores.tolist())]
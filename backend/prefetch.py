@@ -0,0 +1,136 @@
+import os, heapq, itertools, logging, threading, time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from difflib import SequenceMatcher
+from embedding_cache import normalize_query
+from lexical_index import tokenize
+from metrics import CACHE_LOOKUPS
+
+# Speculative retrieval for the message a user is still typing (/api/prefetch).
+# A session's prefetch runs once it has had no newer text for PREFETCH_DEBOUNCE
+# seconds. The frontend already waits for a pause in typing before sending a
+# draft, so this is a short second guard against clients that send every
+# change. The result is kept for PREFETCH_TTL seconds. The submitted message
+# reuses it only if their normalized texts are equal. PREFETCH_MATCH_RATIO
+# below 1.0 also accepts close texts (difflib ratio) with the same words,
+# e.g. differing only in punctuation.
+PREFETCH_DEBOUNCE = float(os.getenv('PREFETCH_DEBOUNCE', 0.1))
+PREFETCH_TTL = int(os.getenv('PREFETCH_TTL', 60))
+PREFETCH_MATCH_RATIO = float(os.getenv('PREFETCH_MATCH_RATIO', 1.0))
+PREFETCH_MIN_CHARS = int(os.getenv('PREFETCH_MIN_CHARS', 4))  # Shorter partial messages are not worth retrieving
+PREFETCH_MAX_SESSIONS = int(os.getenv('PREFETCH_MAX_SESSIONS', 10000))
+PREFETCH_WORKERS = int(os.getenv('PREFETCH_WORKERS', 2))
+
+
+def similar(a, b, ratio=PREFETCH_MATCH_RATIO):
+    # A high character ratio alone would match "cork" with "york" or 2018
+    # with 2019, which retrieve different datasets, so the words must agree
+    a, b = normalize_query(a), normalize_query(b)
+    return a == b or (ratio < 1.0 and tokenize(a) == tokenize(b) and SequenceMatcher(None, a, b).ratio() >= ratio)
+
+
+class Prefetch:
+    # The latest partial message of a session and, once computed, its result
+    def __init__(self, text, due, expires):
+        self.text = text
+        self.due = due
+        self.expires = expires
+        self.result = None
+        self.cancelled = False
+
+
+class Prefetcher:
+    # Runs compute(text) in the background for the message a user is typing,
+    # so the result is ready by the time they submit it. Each session has at
+    # most one prefetch: newer text replaces it (cancelling it if it hasn't
+    # started), and it only starts once the text has been left alone for
+    # `debounce` seconds. take() hands the result over once, if the
+    # submitted message is close enough to the prefetched one.
+    def __init__(self, compute, debounce=PREFETCH_DEBOUNCE, ttl=PREFETCH_TTL, match_ratio=PREFETCH_MATCH_RATIO,
+                 min_chars=PREFETCH_MIN_CHARS, max_sessions=PREFETCH_MAX_SESSIONS, workers=PREFETCH_WORKERS):
+        self.compute = compute
+        self.debounce = debounce
+        self.ttl = ttl
+        self.match_ratio = match_ratio
+        self.min_chars = min_chars
+        self.max_sessions = max_sessions
+        self.workers = workers
+        self._entries = OrderedDict()  # session id -> Prefetch, least recently scheduled first
+        self._queue = []  # (due, sequence, Prefetch) heap of prefetches not started yet
+        self._sequence = itertools.count()
+        self._changed = threading.Condition()
+        self._dispatcher = None
+        self._executor = None
+
+    def schedule(self, session_id, text):
+        # Returns False if the text is too short to prefetch
+        if len(normalize_query(text)) < self.min_chars:
+            return False
+        now = time.monotonic()
+        with self._changed:
+            previous = self._entries.pop(session_id, None)
+            if previous is not None and normalize_query(previous.text) == normalize_query(text):
+                # Unchanged text (e.g. a cursor move): keep what is already scheduled or done
+                self._entries[session_id] = previous
+                return True
+            if previous is not None:
+                previous.cancelled = True
+            entry = self._entries[session_id] = Prefetch(text, now + self.debounce, now + self.ttl)
+            heapq.heappush(self._queue, (entry.due, next(self._sequence), entry))
+            while self._entries:
+                oldest = next(iter(self._entries.values()))
+                if len(self._entries) <= self.max_sessions and oldest.expires > now:
+                    break
+                self._entries.popitem(last=False)[1].cancelled = True
+            self._start()
+            self._changed.notify()
+        return True
+
+    def take(self, session_id, text):
+        # The prefetched result for the submitted text, or None. Anything
+        # else prefetched for the session is dropped.
+        with self._changed:
+            entry = self._entries.pop(session_id, None)
+        result = None
+        if entry is not None:
+            entry.cancelled = True
+            if entry.result is not None and entry.expires > time.monotonic() and similar(entry.text, text,
+                                                                                         self.match_ratio):
+                result = entry.result
+        CACHE_LOOKUPS.inc(cache='prefetch', result='miss' if result is None else 'hit')
+        return result
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _start(self):
+        # Called with the lock held. Started on first use, and again in a
+        # forked worker, which doesn't inherit the parent's threads.
+        if self._dispatcher is None or not self._dispatcher.is_alive():
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='prefetch')
+            self._dispatcher = threading.Thread(target=self._dispatch, name='prefetch-dispatch', daemon=True)
+            self._dispatcher.start()
+
+    def _dispatch(self):
+        while True:
+            with self._changed:
+                while self._queue and self._queue[0][2].cancelled:
+                    heapq.heappop(self._queue)
+                if not self._queue:
+                    self._changed.wait()
+                    continue
+                wait = self._queue[0][0] - time.monotonic()
+                if wait > 0:
+                    self._changed.wait(wait)
+                    continue
+                entry = heapq.heappop(self._queue)[2]
+                executor = self._executor
+            executor.submit(self._run, entry)
+
+    def _run(self, entry):
+        if entry.cancelled:
+            return
+        try:
+            entry.result = self.compute(entry.text)
+        except Exception as e:
+            logging.warning(f"Prefetch failed for {entry.text!r}: {e}")
@@ -0,0 +1,63 @@
+import logging
+from tokens import estimate_tokens
+
+
+class PromptBuilder:
+    # Assembles the chat prompt within a token budget. The system prompt and
+    # template are always sent, then the context is filled by priority: the
+    # current message, the top retrieval hits in rank order, the most recent
+    # turns, and finally the rolling summary of older turns. Every piece of
+    # context appears in the prompt once.
+    def __init__(self, budget=3000):
+        self.budget = budget
+
+    # numbered=True lists the hits as "1. name", so the LLM can pick them by number
+    def build(self, system_prompt, template, user_message, hits=(), history=(), summary="", numbered=False):
+        usage = {'system': estimate_tokens(system_prompt),
+                 'template': estimate_tokens(template.format(user_message="", search_results_text="",
+                                                             conv_history="", n_results=0)),
+                 'message': estimate_tokens(user_message)}
+        remaining = self.budget - sum(usage.values())
+
+        names = [f"{i}. {hit['name']}" if numbered else hit['name'] for i, hit in enumerate(hits, 1)]
+        search_lines, usage['search_results'] = self._fill(names, remaining)
+        remaining -= usage['search_results']
+
+        # Newest turns first, so the oldest ones are dropped when space runs out
+        lines = [f"{'Human' if message.type == 'human' else 'AI'}: {message.content}" for message in history]
+        turns, usage['history'] = self._fill(lines[::-1], remaining)
+        turns.reverse()
+        remaining -= usage['history']
+
+        conv_history = "\n".join(turns)
+        usage['summary'] = 0
+        if summary and estimate_tokens(summary) <= remaining:
+            conv_history = f"Summary of earlier conversation:\n{summary}\n\n{conv_history}"
+            usage['summary'] = estimate_tokens(summary)
+
+        usage['total'] = sum(usage.values())
+        usage['hits_used'] = len(search_lines)
+        usage['turns_used'] = len(turns)
+        logging.info(f"Prompt token usage: {usage}")
+
+        user_prompt = template.format(user_message=user_message,
+                                      search_results_text="\n".join(search_lines),
+                                      conv_history=conv_history or "(none)",
+                                      n_results=len(search_lines))
+        messages = [
+            {'role': 'system', 'content': system_prompt},
+            {'role': 'user', 'content': user_prompt}
+        ]
+        return messages, usage
+
+    # Take lines in order until the next one would exceed the budget
+    @staticmethod
+    def _fill(lines, budget):
+        taken, used = [], 0
+        for line in lines:
+            cost = estimate_tokens(line) + 1  # +1 for the newline
+            if used + cost > budget:
+                break
+            taken.append(line)
+            used += cost
+        return taken, used
@@ -0,0 +1,134 @@
+import os
+import numpy as np
+from mmap_index import MmapIndex, normalize
+
+# 'int8' stores each vector as int8 codes with a float32 scale (~4x smaller
+# than float32), 'float16' as half floats (2x smaller)
+QUANTIZATION = os.getenv('QUANTIZATION', 'int8')
+
+# Candidates re-ranked with exact scores, as a multiple of n_results
+RERANK_FACTOR = int(os.getenv('RERANK_FACTOR', 4))
+
+# Rows dequantized at a time while scoring, to bound the temporary float32 copy
+SCORE_CHUNK_ROWS = 65536
+
+
+def save_array(path, array):
+    # Write to a temporary file first so readers never see a half-written array
+    with open(path + '.tmp', 'wb') as f:
+        np.save(f, array)
+    os.replace(path + '.tmp', path)
+
+
+def quantize(matrix, quantization=QUANTIZATION):
+    # Returns (codes, scales) such that codes * scales[:, None] ~= matrix
+    if quantization == 'float16':
+        return matrix.astype(np.float16), np.ones(len(matrix), dtype=np.float32)
+    if quantization != 'int8':
+        raise ValueError(f"Unknown quantization: {quantization}")
+    scales = np.abs(matrix).max(axis=1) / 127.0 if len(matrix) else np.ones(0)
+    scales[scales == 0] = 1.0
+    codes = np.round(matrix / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class StringColumn:
+    # A list of strings stored as one UTF-8 buffer plus offsets, both
+    # memory-mapped instead of held as Python string objects
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def save(cls, path, strings):
+        encoded = [string.encode('utf-8') for string in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        save_array(path + '.data.npy', np.frombuffer(b"".join(encoded) or b"\0", dtype=np.uint8))
+        save_array(path + '.offsets.npy', offsets)
+
+    @classmethod
+    def load(cls, path):
+        return cls(np.load(path + '.data.npy', mmap_mode='r'), np.load(path + '.offsets.npy', mmap_mode='r'))
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(path + '.data.npy') and os.path.exists(path + '.offsets.npy')
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self.data[self.offsets[i]:self.offsets[i + 1]]).decode('utf-8')
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+class QuantizedIndex(MmapIndex):
+    # Cosine top-k over quantized vectors. Every vector is scored from its
+    # int8 (or float16) codes, then a shortlist of rerank_factor * n_results
+    # candidates is re-ranked with exact scores from the full-precision
+    # matrix. That matrix stays memory-mapped and only the shortlisted rows
+    # are read, so the resident set is the codes plus a few pages.
+    def __init__(self, path, rerank_factor=RERANK_FACTOR):
+        self.path = path
+        self.rerank_factor = rerank_factor
+        self.vectors = np.load(path + '.npy', mmap_mode='r')
+        self.codes = np.load(path + '.codes.npy', mmap_mode='r')
+        self.scales = np.load(path + '.scales.npy', mmap_mode='r')
+        self.ids = StringColumn.load(path + '.ids')
+        self.names = StringColumn.load(path + '.names')
+
+    @staticmethod
+    def exists(path):
+        return (all(os.path.exists(path + suffix) for suffix in ('.npy', '.codes.npy', '.scales.npy'))
+                and StringColumn.exists(path + '.ids') and StringColumn.exists(path + '.names'))
+
+    @classmethod
+    def build(cls, path, ids, dataset_names, vectors, quantization=QUANTIZATION):
+        matrix = normalize(vectors)
+        codes, scales = quantize(matrix, quantization)
+        StringColumn.save(path + '.ids', ids)
+        StringColumn.save(path + '.names', dataset_names)
+        save_array(path + '.codes.npy', codes)
+        save_array(path + '.scales.npy', scales)
+        # Written last: exists() is only true once every file is in place
+        save_array(path + '.npy', matrix)
+        return cls(path)
+
+    def approximate_scores(self, queries):
+        scores = np.empty((len(queries), len(self)), dtype=np.float32)
+        for start in range(0, len(self), SCORE_CHUNK_ROWS):
+            end = start + SCORE_CHUNK_ROWS
+            chunk = np.asarray(self.codes[start:end], dtype=np.float32)
+            scores[:, start:end] = (queries @ chunk.T) * self.scales[start:end]
+        return scores
+
+    def search(self, query_vectors, n_results=10):
+        k = min(n_results, len(self))
+        queries = normalize(query_vectors)
+        if k == 0:
+            return [[] for _ in range(len(queries))]
+
+        shortlist_size = min(len(self), k * max(self.rerank_factor, 1))
+        approximate = self.approximate_scores(queries)
+        shortlists = np.argpartition(-approximate, shortlist_size - 1, axis=1)[:, :shortlist_size]
+
+        results = []
+        for query, rows in zip(queries, shortlists):
+            rows = np.sort(rows)  # Read the shortlisted rows in file order
+            exact = np.asarray(self.vectors[rows], dtype=np.float32) @ query
+            order = np.argsort(-exact, kind='stable')[:k]
+            results.append([{'id': self.ids[rows[j]], 'name': self.names[rows[j]], 'distance': float(1.0 - exact[j])}
+                            for j in order.tolist()])
+        return results
+
+    # Fraction of the exact top-k (from the full-precision matrix) that the
+    # quantized search returns, averaged over the queries
+    def recall(self, query_vectors, n_results=10):
+        exact = MmapIndex.search(self, query_vectors, n_results=n_results)
+        approximate = self.search(query_vectors, n_results=n_results)
+        overlaps = [len({hit['id'] for hit in a} & {hit['id'] for hit in e}) / max(len(e), 1)
+                    for a, e in zip(approximate, exact)]
+        return float(np.mean(overlaps)) if overlaps else 1.0
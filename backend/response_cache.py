@@ -0,0 +1,95 @@
+import hashlib, logging, threading, time
+from collections import OrderedDict
+import numpy as np
+from embedding_cache import normalize_query
+
+
+class ResponseCache:
+    # Caches first-turn chat answers in a flask_caching Cache (which provides
+    # the TTL and size-bounded eviction). Entries are keyed on the normalized
+    # message plus the retrieved dataset ids. In semantic mode a miss falls
+    # back to the most similar cached query, whose answer is reused if the
+    # cosine similarity is at least `threshold` and the retrieved ids match.
+    # A disabled cache stores nothing and always misses.
+    def __init__(self, cache, ttl=3600, max_entries=1000, semantic=False, threshold=0.95, enabled=True):
+        self.cache = cache
+        self.enabled = enabled
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.semantic = semantic
+        self.threshold = threshold
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._queries = OrderedDict()  # key -> (unit query vector, dataset ids, expiry)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def dataset_ids(hits):
+        return tuple(sorted(hit['id'] for hit in hits))
+
+    def key(self, user_message, hits):
+        ids = ",".join(self.dataset_ids(hits))
+        digest = hashlib.sha256(f"{normalize_query(user_message)}|{ids}".encode('utf-8')).hexdigest()
+        return f"chat:{digest}"
+
+    def get(self, user_message, query_vector, hits):
+        if not self.enabled:
+            return None
+        response = self.cache.get(self.key(user_message, hits))
+        if response is not None:
+            self.exact_hits += 1
+            logging.info(f"Response cache hit (exact), stats: {self.stats()}")
+            return response
+
+        # Lexical fast-path queries have no embedding to compare
+        if self.semantic and query_vector is not None:
+            key = self._nearest(query_vector, self.dataset_ids(hits))
+            response = self.cache.get(key) if key else None
+            if response is not None:
+                self.semantic_hits += 1
+                logging.info(f"Response cache hit (semantic), stats: {self.stats()}")
+                return response
+
+        self.misses += 1
+        return None
+
+    def put(self, user_message, query_vector, hits, response):
+        if not self.enabled:
+            return
+        key = self.key(user_message, hits)
+        self.cache.set(key, response, timeout=self.ttl)
+        if not self.semantic or query_vector is None:
+            return
+        vector = np.asarray(query_vector, dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        with self._lock:
+            self._queries[key] = (vector, self.dataset_ids(hits), time.monotonic() + self.ttl)
+            self._queries.move_to_end(key)
+            while len(self._queries) > self.max_entries:
+                self._queries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {'exact_hits': self.exact_hits,
+                'semantic_hits': self.semantic_hits,
+                'misses': self.misses,
+                'hit_rate': (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0}
+
+    def _nearest(self, query_vector, ids):
+        now = time.monotonic()
+        with self._lock:
+            for key in [key for key, (_, _, expiry) in self._queries.items() if expiry < now]:
+                del self._queries[key]
+            candidates = [(key, vector) for key, (vector, cached_ids, _) in self._queries.items()
+                          if cached_ids == ids]
+        if not candidates:
+            return None
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        similarities = np.stack([vector for _, vector in candidates]) @ query
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            return None
+        return candidates[best][0]
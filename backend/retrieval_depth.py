@@ -0,0 +1,68 @@
+import os, logging
+from metrics import RETRIEVAL_DEPTH
+
+# How many of the ranked hits go into the prompt. Retrieval fetches
+# RETRIEVAL_MAX_K hits and the cut-off keeps a prefix of them, never fewer
+# than RETRIEVAL_MIN_K:
+#   'distance'  hits within MAX_DISTANCE (cosine distance)
+#   'gap'       hits within MAX_DISTANCE_GAP of the best hit's distance
+#   'elbow'     hits before the largest jump in distance, if it is at least ELBOW_MIN_JUMP
+#   'none'      all RETRIEVAL_MAX_K hits
+RETRIEVAL_CUTOFF = os.getenv('RETRIEVAL_CUTOFF', 'gap')
+RETRIEVAL_MIN_K = int(os.getenv('RETRIEVAL_MIN_K', 2))
+RETRIEVAL_MAX_K = int(os.getenv('RETRIEVAL_MAX_K', 10))
+MAX_DISTANCE = float(os.getenv('MAX_DISTANCE', 0.6))
+MAX_DISTANCE_GAP = float(os.getenv('MAX_DISTANCE_GAP', 0.15))
+ELBOW_MIN_JUMP = float(os.getenv('ELBOW_MIN_JUMP', 0.05))
+
+CUTOFFS = ('none', 'distance', 'gap', 'elbow')
+
+
+class RetrievalDepth:
+    # Picks the number of hits to keep from their distances. Hits without a
+    # distance (lexical matches, see lexical_index.py) never cause a cut.
+    def __init__(self, cutoff=RETRIEVAL_CUTOFF, min_k=RETRIEVAL_MIN_K, max_k=RETRIEVAL_MAX_K,
+                 max_distance=MAX_DISTANCE, max_gap=MAX_DISTANCE_GAP, elbow_min_jump=ELBOW_MIN_JUMP):
+        if cutoff not in CUTOFFS:
+            raise ValueError(f"Unknown retrieval cut-off: {cutoff}")
+        if not 1 <= min_k <= max_k:
+            raise ValueError(f"Retrieval depth needs 1 <= min_k <= max_k, got {min_k} and {max_k}")
+        self.cutoff = cutoff
+        self.min_k = min_k
+        self.max_k = max_k
+        self.max_distance = max_distance
+        self.max_gap = max_gap
+        self.elbow_min_jump = elbow_min_jump
+
+    def k(self, distances):
+        distances = list(distances[:self.max_k])
+        known = [d for d in distances if d is not None]
+        if self.cutoff == 'none' or not known:
+            return len(distances)
+
+        if self.cutoff == 'elbow':
+            # The largest step between consecutive distances, from min_k on
+            best_k, best_jump, previous = len(distances), self.elbow_min_jump, None
+            for i, distance in enumerate(distances):
+                if distance is None:
+                    continue
+                if previous is not None and i >= self.min_k and distance - previous >= best_jump:
+                    best_k, best_jump = i, distance - previous
+                previous = distance
+            return best_k
+
+        limit = self.max_distance if self.cutoff == 'distance' else min(known) + self.max_gap
+        for i, distance in enumerate(distances):
+            if i >= self.min_k and distance is not None and distance > limit:
+                return i
+        return len(distances)
+
+    # The leading hits to keep. The distances and the chosen k are logged so
+    # the thresholds can be tuned offline.
+    def truncate(self, hits):
+        distances = [hit.get('distance') for hit in hits]
+        k = self.k(distances)
+        RETRIEVAL_DEPTH.observe(k)
+        logging.info(f"Retrieval depth: kept {k} of {len(hits)} hits (cutoff={self.cutoff}, distances="
+                     f"{[None if d is None else round(d, 4) for d in distances]})")
+        return hits[:k]
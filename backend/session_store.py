@@ -0,0 +1,350 @@
+import os, logging, queue, sqlite3, threading, time, weakref
+from collections import Counter, OrderedDict
+from langchain_core.chat_history import InMemoryChatMessageHistory
+from langchain_core.messages import AIMessage, HumanMessage, get_buffer_string
+from tokens import estimate_tokens
+
+# Session store limits, overridable from the environment
+SESSION_TTL = int(os.getenv('SESSION_TTL', 1800))  # Seconds of inactivity before a session expires
+MAX_SESSIONS = int(os.getenv('MAX_SESSIONS', 1000))  # Least recently used sessions are evicted past this
+HISTORY_TOKEN_BUDGET = int(os.getenv('HISTORY_TOKEN_BUDGET', 1000))  # Tokens of verbatim turns kept per session
+SUMMARY_TOKEN_BUDGET = int(os.getenv('SUMMARY_TOKEN_BUDGET', 200))  # Tokens of rolling summary kept per session
+SUMMARY_LINE_CHARS = 160  # Each folded turn is condensed to at most this many characters
+
+# SQLite session store settings
+SESSION_DB = os.getenv('SESSION_DB', os.path.join('cache', 'sessions.db'))
+HISTORY_TURNS = int(os.getenv('HISTORY_TURNS', 20))  # Most recent turns (question and answer) read back on load
+SESSION_PRUNE_INTERVAL = int(os.getenv('SESSION_PRUNE_INTERVAL', 300))  # Seconds between expired-session sweeps
+WRITE_BATCH_SIZE = 256  # Queued writes committed per transaction
+
+
+class SessionMemory:
+    # Conversation memory for a single session, exposing the same
+    # chat_memory / load_memory_variables interface as ConversationBufferMemory.
+    def __init__(self, token_budget=HISTORY_TOKEN_BUDGET, summary_budget=SUMMARY_TOKEN_BUDGET):
+        self.chat_memory = InMemoryChatMessageHistory()
+        self.summary_lines = []
+        self.token_budget = token_budget
+        self.summary_budget = summary_budget
+        self.last_access = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add_user_message(self, message):
+        with self._lock:
+            self.chat_memory.add_user_message(message)
+            self._trim()
+
+    def add_ai_message(self, message):
+        with self._lock:
+            self.chat_memory.add_ai_message(message)
+            self._trim()
+
+    # A question and its answer, recorded together once the answer is
+    # complete, so a request that fails or is turned away leaves no trace
+    def add_turn(self, user_message, ai_message):
+        self.add_user_message(user_message)
+        self.add_ai_message(ai_message)
+
+    def clear(self):
+        with self._lock:
+            self.chat_memory.clear()
+            self.summary_lines = []
+
+    @property
+    def summary(self):
+        return "\n".join(self.summary_lines)
+
+    def history_tokens(self):
+        return sum(estimate_tokens(m.content) for m in self.chat_memory.messages)
+
+    # Copy of the verbatim turns and the rolling summary, for prompt building
+    def snapshot(self):
+        with self._lock:
+            return list(self.chat_memory.messages), self.summary
+
+    def load_memory_variables(self, inputs):
+        with self._lock:
+            history = get_buffer_string(self.chat_memory.messages)
+            if self.summary_lines:
+                history = f"Summary of earlier conversation:\n{self.summary}\n\n{history}"
+            return {'history': history}
+
+    # Fold the oldest turns into the rolling summary until the verbatim
+    # history fits the token budget. The latest message is always kept.
+    def _trim(self):
+        messages = self.chat_memory.messages
+        while len(messages) > 1 and self.history_tokens() > self.token_budget:
+            oldest = messages.pop(0)
+            self.summary_lines.append(self._condense(oldest))
+        while len(self.summary_lines) > 1 and estimate_tokens(self.summary) > self.summary_budget:
+            self.summary_lines.pop(0)
+
+    @staticmethod
+    def _condense(message):
+        # Keep only the first line of a turn (the question, or the intro of an answer)
+        first_line = message.content.strip().splitlines()[0] if message.content.strip() else ""
+        if len(first_line) > SUMMARY_LINE_CHARS:
+            first_line = first_line[:SUMMARY_LINE_CHARS].rstrip() + "..."
+        speaker = 'Human' if message.type == 'human' else 'AI'
+        return f"{speaker}: {first_line}"
+
+
+class SessionStore:
+    # Process-local session_id -> SessionMemory map with idle-TTL and LRU eviction
+    def __init__(self, ttl=SESSION_TTL, max_sessions=MAX_SESSIONS,
+                 token_budget=HISTORY_TOKEN_BUDGET, summary_budget=SUMMARY_TOKEN_BUDGET):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.token_budget = token_budget
+        self.summary_budget = summary_budget
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            memory = self._sessions.get(session_id)
+            if memory is None:
+                memory = SessionMemory(self.token_budget, self.summary_budget)
+                self._sessions[session_id] = memory
+            else:
+                self._sessions.move_to_end(session_id)
+            memory.last_access = now
+            self._evict(now)
+            return memory
+
+    def clear(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, session_id):
+        return session_id in self._sessions
+
+    def _evict(self, now):
+        # Sessions are kept in access order, so expired ones are at the front
+        while self._sessions:
+            session_id, memory = next(iter(self._sessions.items()))
+            if now - memory.last_access <= self.ttl and len(self._sessions) <= self.max_sessions:
+                break
+            self._sessions.popitem(last=False)
+            logging.info(f"Evicted conversation history for session: {session_id}")
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    last_active REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_last_active ON sessions (last_active);
+CREATE TABLE IF NOT EXISTS turns (
+    id INTEGER PRIMARY KEY,
+    session_id TEXT NOT NULL REFERENCES sessions (session_id) ON DELETE CASCADE,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS turns_session ON turns (session_id, id);
+"""
+
+# The statements are fixed strings, so each connection compiles them once
+# and reuses them from sqlite3's statement cache
+SELECT_TURNS = "SELECT role, content FROM turns WHERE session_id = ? ORDER BY id DESC LIMIT ?"
+TOUCH_SESSION = ("INSERT INTO sessions (session_id, last_active) VALUES (?, ?) "
+                 "ON CONFLICT (session_id) DO UPDATE SET last_active = excluded.last_active")
+INSERT_TURN = "INSERT INTO turns (session_id, role, content) VALUES (?, ?, ?)"
+# Turns go with their session through the cascade on turns_session
+DELETE_SESSION = "DELETE FROM sessions WHERE session_id = ?"
+PRUNE_SESSIONS = "DELETE FROM sessions WHERE last_active < ?"
+SESSION_EXISTS = "SELECT 1 FROM sessions WHERE session_id = ?"
+COUNT_SESSIONS = "SELECT COUNT(*) FROM sessions"
+
+MESSAGE_TYPES = {'human': HumanMessage, 'ai': AIMessage}
+
+
+class StoredSessionMemory(SessionMemory):
+    # SessionMemory loaded from, and appending its turns to, a SqliteSessionStore
+    def __init__(self, store, session_id, messages, token_budget=HISTORY_TOKEN_BUDGET,
+                 summary_budget=SUMMARY_TOKEN_BUDGET):
+        super().__init__(token_budget, summary_budget)
+        self.store = store
+        self.session_id = session_id
+        self.chat_memory.add_messages(messages)
+        self._trim()
+
+    def add_user_message(self, message):
+        super().add_user_message(message)
+        self.store.append(self.session_id, 'human', message)
+
+    def add_ai_message(self, message):
+        super().add_ai_message(message)
+        self.store.append(self.session_id, 'ai', message)
+
+    def clear(self):
+        super().clear()
+        self.store.clear(self.session_id)
+
+
+class SqliteSessionStore:
+    # Session history in a SQLite database in WAL mode, so every worker
+    # process shares it and it survives restarts. Turns are append-only rows
+    # indexed by session_id and a session is loaded from its last
+    # history_turns turns only. Writes are queued to a single writer thread
+    # that commits them in batches, so requests never wait on the disk; the
+    # same thread deletes sessions idle for longer than ttl.
+    def __init__(self, path=SESSION_DB, ttl=SESSION_TTL, history_turns=HISTORY_TURNS,
+                 prune_interval=SESSION_PRUNE_INTERVAL, token_budget=HISTORY_TOKEN_BUDGET,
+                 summary_budget=SUMMARY_TOKEN_BUDGET):
+        self.path = path
+        self.ttl = ttl
+        self.history_turns = history_turns
+        self.prune_interval = prune_interval
+        self.token_budget = token_budget
+        self.summary_budget = summary_budget
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        connection = self.connect()
+        connection.executescript(SCHEMA)
+        connection.close()
+        self._start()
+        _stores.add(self)
+
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA foreign_keys=ON")
+        return connection
+
+    def _start(self):
+        self._local = threading.local()
+        self._pending = Counter()
+        self._written = threading.Condition()
+        self._queue = queue.Queue()
+        self._thread = None
+
+    # Per-thread read connection; WAL readers don't block the writer
+    def _reader(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = self.connect()
+        return connection
+
+    def get(self, session_id):
+        # Wait for this process's queued writes to the session, so a request
+        # sees the turns of the one before it
+        self.wait(session_id)
+        # Each turn is two rows, a user message and its answer
+        rows = self._reader().execute(SELECT_TURNS, (session_id, 2 * self.history_turns)).fetchall()
+        messages = [MESSAGE_TYPES[role](content=content) for role, content in reversed(rows)]
+        # Never start with an answer cut off from its question (e.g. in
+        # history written before turns were stored in pairs)
+        while messages and isinstance(messages[0], AIMessage):
+            messages.pop(0)
+        return StoredSessionMemory(self, session_id, messages, self.token_budget, self.summary_budget)
+
+    def append(self, session_id, role, content):
+        self._submit(session_id, [(TOUCH_SESSION, (session_id, time.time())),
+                                  (INSERT_TURN, (session_id, role, content))])
+
+    def clear(self, session_id):
+        self._submit(session_id, [(DELETE_SESSION, (session_id,))])
+
+    def wait(self, session_id=None, timeout=5):
+        # Block until the queued writes (for session_id, or all of them) are committed
+        with self._written:
+            done = (lambda: not self._pending[session_id]) if session_id else (lambda: not self._pending)
+            return self._written.wait_for(done, timeout)
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def __len__(self):
+        self.wait()
+        return self._reader().execute(COUNT_SESSIONS).fetchone()[0]
+
+    def __contains__(self, session_id):
+        self.wait(session_id)
+        return self._reader().execute(SESSION_EXISTS, (session_id,)).fetchone() is not None
+
+    def _submit(self, session_id, statements):
+        with self._written:
+            self._pending[session_id] += 1
+            # Started on the first write: a SQLite connection must not be open
+            # across fork(), so a store that is only created before forking
+            # (e.g. in a pre-fork master) can be used by every worker
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='session-writer', daemon=True)
+                self._thread.start()
+        self._queue.put((session_id, statements))
+
+    def _run(self):
+        connection = self.connect()
+        next_prune = time.monotonic()
+        while True:
+            if time.monotonic() >= next_prune:
+                self._prune(connection)
+                next_prune = time.monotonic() + self.prune_interval
+            try:
+                item = self._queue.get(timeout=max(next_prune - time.monotonic(), 0))
+            except queue.Empty:
+                continue
+            batch = []
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= WRITE_BATCH_SIZE:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(connection, batch)
+            if item is None:
+                connection.close()
+                return
+
+    def _write(self, connection, batch):
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            for _, statements in batch:
+                for sql, params in statements:
+                    connection.execute(sql, params)
+            connection.execute("COMMIT")
+        except sqlite3.Error as e:
+            logging.error(f"Failed to write {len(batch)} session updates: {str(e)}")
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+        finally:
+            with self._written:
+                for session_id, _ in batch:
+                    self._pending[session_id] -= 1
+                    if not self._pending[session_id]:
+                        del self._pending[session_id]
+                self._written.notify_all()
+
+    def _prune(self, connection):
+        try:
+            pruned = connection.execute(PRUNE_SESSIONS, (time.time() - self.ttl,)).rowcount
+        except sqlite3.Error as e:
+            logging.error(f"Failed to prune expired sessions: {str(e)}")
+            return
+        if pruned:
+            logging.info(f"Pruned {pruned} expired sessions.")
+
+
+# A forked child (e.g. a pre-forked server worker) only inherits the thread
+# that called fork(), so each live store starts over with no writer or connections there
+_stores = weakref.WeakSet()
+
+def _restart_after_fork():
+    for store in list(_stores):
+        store._start()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_after_fork)
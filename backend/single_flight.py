@@ -0,0 +1,188 @@
+import os, asyncio, threading, time
+from metrics import COALESCED_REQUESTS
+
+# Seconds a request waits on an identical one in flight before giving up.
+# A flight older than this is treated as abandoned and a new one is started.
+FLIGHT_TIMEOUT = int(os.getenv('FLIGHT_TIMEOUT', 120))
+
+
+class FlightError(Exception):
+    pass
+
+
+class Flight:
+    # One computation in progress that concurrent identical requests attach
+    # to. The leader publishes its output as chunks (e.g. the tokens of a
+    # streamed answer) and then lands it with the result or an error.
+    # Followers replay the chunks from the start, so they can join at any point.
+    # followers counts the requests attached to the flight and still waiting
+    # on it, so a leader whose own client has gone can tell whether anyone
+    # still needs the result.
+    def __init__(self, group, key):
+        self.group = group
+        self.key = key
+        self.started = time.monotonic()
+        self.chunks = []
+        self.done = False
+        self.result = None
+        self.error = None
+        self.followers = 0
+        self._changed = threading.Condition()
+        self._waiters = []  # (loop, future) of async followers waiting for a change
+
+    def attach(self):
+        with self._changed:
+            self.followers += 1
+
+    def detach(self):
+        with self._changed:
+            self.followers -= 1
+
+    def publish(self, chunk):
+        with self._changed:
+            self.chunks.append(chunk)
+            self._notify()
+
+    # Only the first call lands the flight; later ones are ignored
+    def finish(self, result=None, error=None):
+        self.group.land(self)
+        with self._changed:
+            if self.done:
+                return
+            self.result, self.error, self.done = result, error, True
+            self._notify()
+
+    def _notify(self):
+        # Called with the lock held. Async followers are woken on their own event loops.
+        self._changed.notify_all()
+        for loop, future in self._waiters:
+            try:
+                loop.call_soon_threadsafe(wake, future)
+            except RuntimeError:
+                pass  # The loop has been closed
+        self._waiters = []
+
+    # The chunks from index start on, once there are any or the flight has landed
+    def read(self, start, timeout=FLIGHT_TIMEOUT):
+        with self._changed:
+            if not self._changed.wait_for(lambda: len(self.chunks) > start or self.done, timeout):
+                raise FlightError("Timed out waiting for an identical request in progress")
+            return self.chunks[start:], self.done
+
+    def outcome(self):
+        if self.error is not None:
+            raise FlightError(str(self.error) or type(self.error).__name__)
+        return self.result
+
+    # follow, wait and their async counterparts detach the follower once it
+    # stops waiting, whether the flight landed or it gave up
+    def follow(self, timeout=FLIGHT_TIMEOUT):
+        # Yields the chunks as they are published; returns once the flight has landed
+        try:
+            start, done = 0, False
+            while not done:
+                chunks, done = self.read(start, timeout)
+                start += len(chunks)
+                yield from chunks
+        finally:
+            self.detach()
+        self.outcome()
+
+    def wait(self, timeout=FLIGHT_TIMEOUT):
+        try:
+            with self._changed:
+                if not self._changed.wait_for(lambda: self.done, timeout):
+                    raise FlightError("Timed out waiting for an identical request in progress")
+        finally:
+            self.detach()
+        return self.outcome()
+
+    # Wait on the event loop until ready() holds, without blocking it or a thread
+    async def await_change(self, ready, timeout=FLIGHT_TIMEOUT):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            with self._changed:
+                if ready():
+                    return
+                future = loop.create_future()
+                self._waiters.append((loop, future))
+            try:
+                await asyncio.wait_for(future, max(0.0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                raise FlightError("Timed out waiting for an identical request in progress") from None
+
+    # Counterparts of follow and wait for the async app
+    async def afollow(self, timeout=FLIGHT_TIMEOUT):
+        try:
+            start, done = 0, False
+            while not done:
+                await self.await_change(lambda: len(self.chunks) > start or self.done, timeout)
+                with self._changed:
+                    chunks, done = self.chunks[start:], self.done
+                start += len(chunks)
+                for chunk in chunks:
+                    yield chunk
+        finally:
+            self.detach()
+        self.outcome()
+
+    async def await_result(self, timeout=FLIGHT_TIMEOUT):
+        try:
+            await self.await_change(lambda: self.done, timeout)
+        finally:
+            self.detach()
+        return self.outcome()
+
+
+def wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class SingleFlight:
+    # Deduplicates identical work in progress: the first caller for a key
+    # leads and the ones arriving before it lands attach to its flight.
+    # Nothing is kept once a flight lands, so results are never served stale.
+    def __init__(self, name, timeout=FLIGHT_TIMEOUT):
+        self.name = name
+        self.timeout = timeout
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    # Returns (flight, True) for the leader, who must finish() the flight,
+    # and (flight, False) for a follower
+    def join(self, key):
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None and time.monotonic() - flight.started <= self.timeout:
+                COALESCED_REQUESTS.inc(flight=self.name)
+                flight.attach()
+                return flight, False
+            flight = self._flights[key] = Flight(self, key)
+            return flight, True
+
+    def land(self, flight):
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+
+    # Run compute() once for the concurrent callers with the same key
+    def do(self, key, compute):
+        flight, leader = self.join(key)
+        if not leader:
+            return flight.wait(self.timeout)
+        return self.lead(flight, compute)
+
+    # The leader's half of do: run compute() and land the flight with its outcome
+    def lead(self, flight, compute):
+        try:
+            result = compute()
+        except Exception as e:
+            flight.finish(error=e)
+            raise
+        flight.finish(result)
+        return result
+
+    def __len__(self):
+        return len(self._flights)
@@ -0,0 +1,127 @@
+import json, logging, re
+from html import escape
+
+DATASET_URL = 'https://data.gov.ie/dataset/'
+
+# Characters trimmed at most from a partial intro before it decodes (an
+# escape sequence cut in half by a token boundary, e.g. "\u00e")
+MAX_PARTIAL_ESCAPE = 6
+
+INTRO_KEY = re.compile(r'"intro"\s*:\s*"')
+
+
+def slug_title(name):
+    # Display title for a dataset without a catalog title: my-example-name -> My Example Name
+    return " ".join(word.capitalize() for word in name.split('-') if word)
+
+
+def dataset_link(name, title):
+    return f'<a href="{DATASET_URL}{name}" target="_blank">**{escape(title, quote=False)}**</a>'
+
+
+def render(intro, hits, title=slug_title):
+    # The answer in the format the text prompt asks the LLM for: the intro,
+    # then one link per selected dataset
+    lines = [intro] if intro.strip() else []
+    lines.extend(dataset_link(hit['name'], title(hit['name'])) for hit in hits)
+    return "<br>\n".join(lines)
+
+
+def parse_selection(text, hits):
+    # Parse {"intro": "...", "datasets": [...]} from the LLM. Datasets are
+    # picked by their 1-based number in the candidate list (or by name);
+    # anything else is dropped, so every rendered link is a real dataset.
+    # Returns (intro, selected hits), or None if the text isn't that JSON.
+    text = text.strip()
+    start, end = text.find('{'), text.rfind('}')
+    if start < 0 or end < start:
+        return None
+    try:
+        selection = json.loads(text[start:end + 1], strict=False)
+    except ValueError:
+        return None
+    if not isinstance(selection, dict):
+        return None
+
+    by_name = {hit['name']: hit for hit in hits}
+    picks = selection.get('datasets') or []
+    selected, seen = [], set()
+    for pick in picks if isinstance(picks, list) else []:
+        if isinstance(pick, str) and pick.strip().isdigit():
+            pick = int(pick)
+        if isinstance(pick, int) and not isinstance(pick, bool) and 1 <= pick <= len(hits):
+            hit = hits[pick - 1]
+        elif isinstance(pick, str) and pick in by_name:
+            hit = by_name[pick]
+        else:
+            continue
+        if hit['name'] not in seen:
+            seen.add(hit['name'])
+            selected.append(hit)
+    # Only leading whitespace is dropped, so the intro matches what was streamed
+    return str(selection.get('intro') or "").lstrip(), selected
+
+
+class StructuredAnswer:
+    # Turns the LLM's JSON selection into the rendered answer. Tokens are fed
+    # in as they are generated and feed() returns the part of the intro that
+    # can be shown so far, so streamed answers still start straight away;
+    # finish() returns the rendered answer and the text not yet shown. An
+    # LLM reply that isn't JSON is passed through as it is.
+    def __init__(self, hits, title=slug_title):
+        self.hits = hits
+        self.title = title
+        self.raw = ""
+        self.shown = ""
+        self.passthrough = None
+
+    def feed(self, token):
+        self.raw += token
+        if self.passthrough is None and self.raw.strip():
+            self.passthrough = not self.raw.lstrip().startswith(('{', '`'))
+        if self.passthrough:
+            return self._show(self.raw)
+        return self._show(self.partial_intro())
+
+    # The rendered answer for a complete (not streamed) LLM reply
+    def complete(self, text):
+        self.feed(text)
+        return self.finish()[0]
+
+    def finish(self):
+        parsed = None if self.passthrough else parse_selection(self.raw, self.hits)
+        if parsed is None:
+            if not self.passthrough:
+                logging.warning("LLM answer is not a dataset selection, returning it unrendered")
+            response = self.raw
+        else:
+            intro, selected = parsed
+            response = render(intro, selected, self.title)
+        # If the shown text isn't a prefix of the answer (a malformed reply),
+        # the final response event carries the authoritative text
+        rest = response[len(self.shown):] if response.startswith(self.shown) else ""
+        self.shown += rest
+        return response, rest
+
+    # The intro decoded as far as it has been generated
+    def partial_intro(self):
+        match = INTRO_KEY.search(self.raw)
+        if match is None:
+            return ""
+        i = match.end()
+        while i < len(self.raw) and self.raw[i] != '"':
+            i += 2 if self.raw[i] == '\\' else 1
+        value = self.raw[match.end():min(i, len(self.raw))]
+        for cut in range(len(value), max(len(value) - MAX_PARTIAL_ESCAPE, 0) - 1, -1):
+            try:
+                return json.loads(f'"{value[:cut]}"', strict=False).lstrip()
+            except ValueError:
+                continue
+        return self.shown
+
+    def _show(self, text):
+        if not text.startswith(self.shown):
+            return ""
+        new = text[len(self.shown):]
+        self.shown = text
+        return new
@@ -0,0 +1,5 @@
+def estimate_tokens(text):
+    # Cheap approximation (~4 characters per token), good enough for budgeting
+    if not text:
+        return 0
+    return max(1, len(text) // 4)
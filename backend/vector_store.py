@@ -1,93 +1,508 @@
-import chromadb, os, logging, pickle, requests
+import chromadb, os, logging, pickle, requests, json, hashlib, atexit, threading
+import numpy as np
 from chromadb.utils.embedding_functions import EmbeddingFunction
 from sentence_transformers import SentenceTransformer
+from mmap_index import MmapIndex
+from quantized_index import QuantizedIndex
+from embedding_cache import EmbeddingCache
+from embedding_batcher import EmbeddingBatcher
+from lexical_index import LexicalIndex, fuse
+from metrics import stage, CACHE_LOOKUPS, EMBEDDED_TEXTS
+from catalog_ingest import CatalogIngest, PACKAGE_LIST, PACKAGE_SEARCH
+from structured_response import slug_title
 
 # Define the model to use for embeddings
 EMBEDDING_MODEL = 'paraphrase-MiniLM-L6-v2'
 
+CACHE_DIR = "cache"
+if not os.path.exists(CACHE_DIR):
+    os.makedirs(CACHE_DIR)
+
+# Query embedding cache. Set QUERY_CACHE_PERSIST=1 to keep it across restarts.
+QUERY_CACHE_SIZE = int(os.getenv('QUERY_CACHE_SIZE', 10000))
+QUERY_CACHE_FILE = os.path.join(CACHE_DIR, "query_embeddings.pkl")
+QUERY_CACHE_PERSIST = os.getenv('QUERY_CACHE_PERSIST', '0') == '1'
+
+# Concurrent query embeddings are encoded together in batches of up to
+# EMBEDDING_BATCH_SIZE, waiting at most EMBEDDING_BATCH_WAIT_MS for a batch
+# to fill. Set EMBEDDING_BATCH_WAIT_MS=0 to encode each request on its own.
+EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', 32))
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv('EMBEDDING_BATCH_WAIT_MS', 5))
+
+# Only show a progress bar when encoding a large batch, e.g. the whole catalog
+PROGRESS_BAR_MIN_TEXTS = 1000
+
 class CustomEmbeddingFunction(EmbeddingFunction):
-    def __init__(self, model_name=EMBEDDING_MODEL, batch_size=32):
+    def __init__(self, model_name=EMBEDDING_MODEL, batch_size=32, cache=None,
+                 batch_wait_ms=EMBEDDING_BATCH_WAIT_MS, max_batch_size=EMBEDDING_BATCH_SIZE):
+        self.model_name = model_name
         self.model = SentenceTransformer(model_name)
         self.batch_size = batch_size
+        self.batcher = EmbeddingBatcher(self.encode_queries, max_batch_size, batch_wait_ms) if batch_wait_ms > 0 else None
+        if cache is None:
+            cache = EmbeddingCache(QUERY_CACHE_SIZE, QUERY_CACHE_FILE if QUERY_CACHE_PERSIST else None, model_name)
+            if cache.path:
+                atexit.register(cache.save)
+        self.cache = cache
 
     def __call__(self, texts):
         if not isinstance(texts, list):
             texts = [texts]
-        return self.model.encode(texts, batch_size=self.batch_size, show_progress_bar=True).tolist()
+        return self.model.encode(texts, batch_size=self.batch_size,
+                                 show_progress_bar=len(texts) >= PROGRESS_BAR_MIN_TEXTS).tolist()
 
-CACHE_DIR = "cache"
-if not os.path.exists(CACHE_DIR):
-    os.makedirs(CACHE_DIR)
+    def encode_queries(self, texts):
+        return self.model.encode(texts, batch_size=self.batch_size, show_progress_bar=False)
+
+    # Embed user queries, serving repeats from the cache and encoding the
+    # misses together, batched with other threads' queries when enabled.
+    # Misses that fill a batch on their own are encoded directly.
+    def embed_queries(self, texts):
+        vectors = [self.cache.get(text) for text in texts]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        CACHE_LOOKUPS.inc(len(texts) - len(missing), cache='embedding', result='hit')
+        CACHE_LOOKUPS.inc(len(missing), cache='embedding', result='miss')
+        if missing:
+            EMBEDDED_TEXTS.inc(len(missing))
+            missing_texts = [texts[i] for i in missing]
+            if self.batcher and len(missing_texts) < self.batcher.max_batch_size:
+                encoded = self.batcher.embed(missing_texts)
+            else:
+                encoded = self.encode_queries(missing_texts)
+            for i, vector in zip(missing, encoded):
+                self.cache.put(texts[i], vector)
+                vectors[i] = vector
+        return vectors
 
 # File to store embeddings
 EMBEDDINGS_FILE = os.path.join(CACHE_DIR, "dataset_embeddings.pkl")
 
+# Manifest describing the embeddings file (model name, catalog hash, size)
+CATALOG_FILE = os.path.join(CACHE_DIR, "dataset_catalog.json")
+
+# Directory of the on-disk Chroma index. Set PERSISTENT_INDEX=0 to build
+# the index in memory on every start instead.
+INDEX_DIR = os.path.join(CACHE_DIR, "chroma")
+PERSISTENT_INDEX = os.getenv('PERSISTENT_INDEX', '1') == '1'
+
+# Search backend: 'chroma' (HNSW collection), 'numpy' (exact search over a
+# memory-mapped .npy matrix) or 'quantized' (int8/float16 codes with an exact
+# re-rank, see quantized_index.py). All rank by cosine distance.
+SEARCH_BACKEND = os.getenv('SEARCH_BACKEND', 'chroma')
+DISTANCE_SPACE = 'cosine'
+MMAP_INDEXES = {'numpy': MmapIndex, 'quantized': QuantizedIndex}
+
+# Catalog vectors used as queries for the recall@k check logged when a
+# quantized index is built
+RECALL_SAMPLE = 100
+
+# Hybrid retrieval: fuse a BM25 ranking over the dataset slugs with the vector
+# ranking, and answer queries that name slugs directly without embedding them.
+# Each ranking contributes up to FUSION_DEPTH * n_results candidates.
+HYBRID_SEARCH = os.getenv('HYBRID_SEARCH', '1') == '1'
+FUSION_DEPTH = 3
+
+COLLECTION_PREFIX = 'dataset_names'
+
+# CKAN action API the catalog is read from
+CKAN_API_URL = os.getenv('CKAN_API_URL', 'https://data.gov.ie/api/3/action')
+
+# Catalog source: 'package_list' indexes the dataset slugs, 'package_search'
+# indexes each dataset's title, description and tags (see catalog_ingest.py)
+CATALOG_SOURCE = os.getenv('CATALOG_SOURCE', PACKAGE_LIST)
+
+# Seconds a replaced index is kept around so in-flight queries can finish
+RETIRE_DELAY = 30
+
+
+# Index versions are named by their content, so a refresh that only changes
+# metadata (and so the embedded documents) builds a new version too
+def catalog_hash(dataset_names, metadatas=()):
+    digest = hashlib.sha256("\n".join(dataset_names).encode('utf-8'))
+    for metadata in metadatas:
+        digest.update(json.dumps(metadata, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def collection_name(model_name, dataset_hash):
+    # Chroma collection names only allow [a-zA-Z0-9._-]
+    model_slug = "".join(c if c.isalnum() or c in '._-' else '-' for c in model_name)
+    return f"{COLLECTION_PREFIX}-{model_slug}-{dataset_hash[:12]}"
+
+
+def read_manifest():
+    if not os.path.exists(CATALOG_FILE):
+        return None
+    with open(CATALOG_FILE) as f:
+        return json.load(f)
+
+
+def write_manifest(model_name, dataset_names, source=PACKAGE_LIST, metadatas=()):
+    manifest = {'embedding_model': model_name,
+                'catalog_hash': catalog_hash(dataset_names, metadatas),
+                'count': len(dataset_names),
+                'source': source}
+    with open(CATALOG_FILE, 'w') as f:
+        json.dump(manifest, f)
+    return manifest
+
+
+def save_embeddings(model_name, ids, dataset_names, vectors, metadatas, source=PACKAGE_LIST):
+    # Write to a temporary file first so a crash never leaves a truncated pickle.
+    # Vectors are stored as one float32 array rather than lists of floats.
+    vectors = np.asarray(vectors, dtype=np.float32)
+    with open(EMBEDDINGS_FILE + '.tmp', 'wb') as f:
+        pickle.dump((ids, dataset_names, vectors, metadatas), f)
+    os.replace(EMBEDDINGS_FILE + '.tmp', EMBEDDINGS_FILE)
+    write_manifest(model_name, dataset_names, source, metadatas)
+
 
-        
 class VectorStore:
-    def __init__(self):
-        self.client = chromadb.Client()
-        self.embedding_function = CustomEmbeddingFunction()  # Initialize the embedding function
-        self.collection = self.client.get_or_create_collection(
-                                name='dataset_names',
-                                metadata={'description': 'Collection of dataset names'},
-                                embedding_function=self.embedding_function
-                            )
-        self.initialize_chromadb()
+    def __init__(self, embedding_function=None, persistent=PERSISTENT_INDEX, index_dir=INDEX_DIR,
+                 backend=SEARCH_BACKEND, api_url=CKAN_API_URL, hybrid=HYBRID_SEARCH, source=CATALOG_SOURCE):
+        if backend != 'chroma' and backend not in MMAP_INDEXES:
+            raise ValueError(f"Unknown search backend: {backend}")
+        self.embedding_function = embedding_function or CustomEmbeddingFunction()  # Initialize the embedding function
+        self.model_name = getattr(self.embedding_function, 'model_name', EMBEDDING_MODEL)
+        self.persistent = persistent
+        self.backend = backend
+        self.index_dir = index_dir
+        self.api_url = api_url
+        self.source = source
+        self.client = None
+        self.collection = None
+        self.mmap_index = None
+        self.hybrid = hybrid
+        self.lexical_index = None
+        self.titles = {}
+        self._refresh_lock = threading.Lock()
+        if backend in MMAP_INDEXES:
+            self.initialize_mmap_index()
+        else:
+            self.client = chromadb.PersistentClient(path=index_dir) if persistent else chromadb.Client()
+            self.initialize_chromadb()
+
+    # The cached embeddings were computed with this model from this source.
+    # Manifests from before the source was recorded are package_list ones.
+    def manifest_matches(self, manifest):
+        return (manifest is not None and manifest['embedding_model'] == self.model_name
+                and manifest.get('source', PACKAGE_LIST) == self.source)
+
+    # Checkpoints of an interrupted ingest are kept next to the embeddings file
+    def catalog_ingest(self):
+        return CatalogIngest(self.api_url, EMBEDDINGS_FILE + '.ingest', source=self.source)
 
     # Ensure the dataset is initialized with embeddings
     def initialize_chromadb(self):
-        if os.path.exists(EMBEDDINGS_FILE):
+        manifest = read_manifest()
+        if self.persistent and self.manifest_matches(manifest):
+            name = collection_name(self.model_name, manifest['catalog_hash'])
+            collection = self.get_collection(name)
+            if (collection is not None and collection.count() == manifest['count']
+                    and (collection.metadata or {}).get('hnsw:space') == DISTANCE_SPACE):
+                logging.info(f"Reopened persistent index {name} ({manifest['count']} datasets).")
+                if self.hybrid or self.source == PACKAGE_SEARCH:
+                    stored = collection.get(include=['metadatas'])
+                    names = [m['name'] for m in stored['metadatas']]
+                    if self.hybrid:
+                        self.lexical_index = LexicalIndex(stored['ids'], names)
+                    self.set_titles(names, stored['metadatas'])
+                self.collection = collection
+                return
+
+        catalog = self.load_embeddings(manifest)
+        if catalog is None:
+            self.collection = self.create_collection(COLLECTION_PREFIX)
+            return
+        self.build_collection(*catalog)
+        self.drop_stale_indexes()
+
+    # Load the cached embeddings, or compute them from the data.gov.ie catalog
+    def load_embeddings(self, manifest):
+        # An embeddings file without a manifest predates it, and holds package_list embeddings
+        legacy = manifest is None and self.source == PACKAGE_LIST
+        if os.path.exists(EMBEDDINGS_FILE) and (legacy or self.manifest_matches(manifest)):
             logging.info("Loading existing embeddings from file.")
             with open(EMBEDDINGS_FILE, 'rb') as f:
                 ids, dataset_names, vectors, metadatas = pickle.load(f)
-                self.collection.add(
-                    ids=ids,
-                    documents=dataset_names,
-                    embeddings=vectors,
-                    metadatas=metadatas
-                )
-        else:
-            logging.info("Computing embeddings and storing them in file.")
-            api_endpoint = "https://data.gov.ie/api/3/action/package_list"
-            response = requests.get(api_endpoint)
-
-            if response.status_code == 200:
-                dataset_names = response.json().get('result', [])
-                ids = [str(i) for i in range(len(dataset_names))]
-                vectors = self.embedding_function(dataset_names)
-                metadatas = [{'name': name} for name in dataset_names]
-
-                # Save embeddings to file
-                with open(EMBEDDINGS_FILE, 'wb') as f:
-                    pickle.dump((ids, dataset_names, vectors, metadatas), f)
-                
-                # Add embeddings to ChromaDB collection
-                self.collection.add(
-                    ids=ids,
-                    documents=dataset_names,
-                    embeddings=vectors,
-                    metadatas=metadatas
-                )
+            if manifest is None:
+                write_manifest(self.model_name, dataset_names, metadatas=metadatas)
+            return ids, dataset_names, vectors, metadatas
+
+        logging.info(f"Computing embeddings from the {self.source} catalog and storing them in file.")
+        ingest = self.catalog_ingest()
+        try:
+            dataset_names, vectors, metadatas = ingest.run(self.embedding_function, self.model_name)
+        except requests.RequestException as e:
+            logging.error(f"Failed to fetch the catalog at startup: {str(e)}")
+            return None
+
+        ids = [str(i) for i in range(len(dataset_names))]
+
+        # Save embeddings to file
+        save_embeddings(self.model_name, ids, dataset_names, vectors, metadatas, self.source)
+        ingest.clear_checkpoints()
+
+        return ids, dataset_names, vectors, metadatas
+
+    # Bring the index up to date with the current catalog: only new datasets,
+    # and ones whose metadata changed, are embedded, removed ones are dropped,
+    # and the updated index is built next to the live one before being swapped in.
+    def refresh_catalog(self):
+        with self._refresh_lock:
+            try:
+                latest_names, documents, latest_metadatas = self.catalog_ingest().fetch_catalog()
+            except requests.RequestException as e:
+                logging.error(f"Failed to fetch the catalog from {self.api_url}: {str(e)}")
+                return None
+
+            manifest = read_manifest()
+            if os.path.exists(EMBEDDINGS_FILE) and self.manifest_matches(manifest):
+                with open(EMBEDDINGS_FILE, 'rb') as f:
+                    ids, dataset_names, vectors, metadatas = pickle.load(f)
             else:
-                logging.error("Failed to fetch dataset names at startup")
+                ids, dataset_names, vectors, metadatas = [], [], [], []
+
+            latest = dict(zip(latest_names, zip(documents, latest_metadatas)))
+            current = {name: i for i, name in enumerate(dataset_names)}
+            added = [name for name in latest_names if name not in current]
+            updated = [name for name in latest_names if name in current and metadatas[current[name]] != latest[name][1]]
+            removed = current.keys() - latest.keys()
+            if not added and not updated and not removed:
+                logging.info("Catalog is up to date.")
+                return {'added': 0, 'updated': 0, 'removed': 0}
+
+            logging.info(f"Refreshing catalog: {len(added)} new, {len(updated)} updated, "
+                         f"{len(removed)} removed datasets.")
+            embed = updated + added
+            new_vectors = dict(zip(embed, self.embedding_function([latest[name][0] for name in embed]))) if embed else {}
+
+            keep = [i for i, name in enumerate(dataset_names) if name in latest]
+            next_id = max((int(id_) for id_ in ids if id_.isdigit()), default=-1) + 1
+            ids = [ids[i] for i in keep] + [str(next_id + i) for i in range(len(added))]
+            vectors = np.asarray([new_vectors.get(dataset_names[i], vectors[i]) for i in keep]
+                                 + [new_vectors[name] for name in added], dtype=np.float32)
+            dataset_names = [dataset_names[i] for i in keep] + added
+            metadatas = [latest[name][1] for name in dataset_names]
+
+            save_embeddings(self.model_name, ids, dataset_names, vectors, metadatas, self.source)
+            if self.backend in MMAP_INDEXES:
+                self.build_mmap_index(ids, dataset_names, vectors, metadatas)
+            else:
+                self.build_collection(ids, dataset_names, vectors, metadatas)
+
+            # Give queries still running against the old index time to finish
+            timer = threading.Timer(RETIRE_DELAY, self.drop_stale_indexes)
+            timer.daemon = True
+            timer.start()
+            return {'added': len(added), 'updated': len(updated), 'removed': len(removed)}
+
+    # Build the index for this catalog and swap it in for the live one
+    def build_collection(self, ids, dataset_names, vectors, metadatas):
+        dataset_hash = catalog_hash(dataset_names, metadatas)
+        name = collection_name(self.model_name, dataset_hash)
+        if self.collection is not None and self.collection.name == name:
+            return  # The live collection already holds this content
+
+        # A leftover collection with this name but the wrong size or settings is rebuilt
+        if self.get_collection(name) is not None:
+            self.client.delete_collection(name)
+
+        logging.info(f"Building index {name} ({len(ids)} datasets).")
+        collection = self.create_collection(name, {'embedding_model': self.model_name,
+                                                   'catalog_hash': dataset_hash})
+
+        # Add embeddings to ChromaDB collection, in batches the client accepts
+        batch_size = self.client.get_max_batch_size()
+        for start in range(0, len(ids), batch_size):
+            end = start + batch_size
+            collection.add(
+                ids=ids[start:end],
+                documents=dataset_names[start:end],
+                embeddings=np.asarray(vectors[start:end], dtype=np.float32),
+                metadatas=metadatas[start:end]
+            )
+        if self.hybrid:
+            self.lexical_index = LexicalIndex(ids, dataset_names)
+        self.set_titles(dataset_names, metadatas)
+        self.collection = collection
+
+    # Remove index versions other than the live one
+    def drop_stale_indexes(self):
+        if self.backend in MMAP_INDEXES:
+            live = os.path.basename(self.mmap_index.path) + '.' if self.mmap_index else None
+            for filename in os.listdir(self.index_dir):
+                if filename.startswith(COLLECTION_PREFIX) and not (live and filename.startswith(live)):
+                    os.remove(os.path.join(self.index_dir, filename))
+            return
+
+        for existing in self.client.list_collections():
+            existing_name = getattr(existing, 'name', existing)
+            if existing_name.startswith(COLLECTION_PREFIX) and existing_name != self.collection.name:
+                self.client.delete_collection(existing_name)
+
+    def create_collection(self, name, metadata=None):
+        return self.client.get_or_create_collection(
+                    name=name,
+                    metadata={'description': 'Collection of dataset names',
+                              'hnsw:space': DISTANCE_SPACE, **(metadata or {})},
+                    embedding_function=self.embedding_function
+                )
+
+    def get_collection(self, name):
+        try:
+            return self.client.get_collection(name=name, embedding_function=self.embedding_function)
+        except Exception:
+            return None
+
+    # Open the memory-mapped matrix for this catalog, building it if needed
+    def initialize_mmap_index(self):
+        manifest = read_manifest()
+        if self.manifest_matches(manifest):
+            path = self.mmap_path(manifest['catalog_hash'])
+            index_class = MMAP_INDEXES[self.backend]
+            if index_class.exists(path):
+                logging.info(f"Opened memory-mapped index {path}.")
+                mmap_index = index_class(path)
+                if self.hybrid:
+                    self.lexical_index = LexicalIndex(mmap_index.ids, mmap_index.names)
+                if self.source == PACKAGE_SEARCH and os.path.exists(EMBEDDINGS_FILE):
+                    with open(EMBEDDINGS_FILE, 'rb') as f:
+                        _, dataset_names, _, metadatas = pickle.load(f)
+                    self.set_titles(dataset_names, metadatas)
+                self.mmap_index = mmap_index
                 return
-        
 
+        catalog = self.load_embeddings(manifest)
+        if catalog is None:
+            return
+        ids, dataset_names, vectors, metadatas = catalog
+        self.build_mmap_index(ids, dataset_names, vectors, metadatas)
+        self.drop_stale_indexes()
+
+    # Write the matrix for this catalog and swap it in for the live one
+    def build_mmap_index(self, ids, dataset_names, vectors, metadatas=()):
+        if not os.path.exists(self.index_dir):
+            os.makedirs(self.index_dir)
+        path = self.mmap_path(catalog_hash(dataset_names, metadatas))
+        if self.mmap_index is not None and self.mmap_index.path == path:
+            return  # Never rewrite the files the live index is reading
+        logging.info(f"Building memory-mapped index {path} ({len(ids)} datasets).")
+        mmap_index = MMAP_INDEXES[self.backend].build(path, ids, dataset_names, vectors)
+        if isinstance(mmap_index, QuantizedIndex) and len(mmap_index):
+            sample = np.random.default_rng(0).choice(len(mmap_index), min(RECALL_SAMPLE, len(mmap_index)),
+                                                     replace=False)
+            logging.info(f"Quantized index recall@10: {mmap_index.recall(mmap_index.vectors[np.sort(sample)]):.3f}")
+        if self.hybrid:
+            # Reads names from the index's columns rather than keeping these lists alive
+            self.lexical_index = LexicalIndex(mmap_index.ids, mmap_index.names)
+        self.set_titles(dataset_names, metadatas)
+        self.mmap_index = mmap_index
 
+    # Catalog titles by dataset name, for rendering links. Only package_search
+    # metadata has titles; other datasets are titled from their slug.
+    def set_titles(self, dataset_names, metadatas):
+        self.titles = {name: metadata['title'] for name, metadata in zip(dataset_names, metadatas)
+                       if metadata.get('title')}
 
-    def query_embeddings(self, user_message, n_results=10):
-    # Check if the user message is a dataset query
-        query_vector = self.embedding_function(user_message)[0]  # Ensure the embedding is correctly extracted
+    def title(self, name):
+        return self.titles.get(name) or slug_title(name)
 
-        
-        search_results = self.collection.query(
-            query_embeddings=[query_vector],
+    def mmap_path(self, dataset_hash):
+        return os.path.join(self.index_dir, collection_name(self.model_name, dataset_hash))
+
+    # Top-k search for one or more query vectors. Returns one list of
+    # {'id', 'name', 'distance'} hits per query, best first.
+    def search(self, query_vectors, n_results=10):
+        with stage('search'):
+            return self._search(query_vectors, n_results)
+
+    def _search(self, query_vectors, n_results):
+        # Read the live index once, so a concurrent refresh can swap it safely
+        if self.backend in MMAP_INDEXES:
+            mmap_index = self.mmap_index
+            if mmap_index is None:
+                return [[] for _ in query_vectors]
+            return mmap_index.search(query_vectors, n_results=n_results)
+
+        collection = self.collection
+        search_results = collection.query(
+            query_embeddings=np.asarray(query_vectors, dtype=np.float32),
             n_results=n_results
         )
-        
+        return [[{'id': id_, 'name': metadata['name'], 'distance': distance}
+                 for id_, metadata, distance in zip(ids, metadatas, distances)]
+                for ids, metadatas, distances in zip(search_results['ids'],
+                                                     search_results['metadatas'],
+                                                     search_results['distances'])]
+
+    # Embed user queries, through the query cache when the embedding function has one
+    def embed_queries(self, texts):
+        with stage('embed'):
+            if hasattr(self.embedding_function, 'embed_queries'):
+                return self.embedding_function.embed_queries(texts)
+            return self.embedding_function(texts)
+
+    # Embed a user message (unless its vector is passed in) and return the
+    # vector together with the top hits. The vector is None when the lexical
+    # fast path answered the query. With a RetrievalDepth, the hits are cut
+    # off by distance (n_results is then the most that are kept).
+    def retrieve(self, user_message, n_results=10, query_vector=None, depth=None):
+        query_vector, hits = self._retrieve(user_message, n_results, query_vector)
+        return query_vector, depth.truncate(hits) if depth is not None else hits
+
+    # True if retrieve() would answer the message from the lexical fast path
+    # with an exact slug, without embedding it
+    def names_slug(self, user_message):
+        lexical_index = self.lexical_index if self.hybrid else None
+        return lexical_index is not None and lexical_index.names_slug(user_message)
+
+    def _retrieve(self, user_message, n_results, query_vector):
+        lexical_index = self.lexical_index if self.hybrid else None
+        if lexical_index is not None:
+            with stage('lexical'):
+                hits = lexical_index.exact_hits(user_message, n_results=n_results)
+            if hits:
+                return query_vector, hits
+
+        if query_vector is None:
+            query_vector = self.embed_queries([user_message])[0]
+        if lexical_index is None:
+            return query_vector, self.search([query_vector], n_results=n_results)[0]
+
+        fusion_depth = n_results * FUSION_DEPTH
+        vector_hits = self.search([query_vector], n_results=fusion_depth)[0]
+        with stage('lexical'):
+            lexical_hits = lexical_index.search(user_message, n_results=fusion_depth)
+        return query_vector, fuse(vector_hits, lexical_hits, n_results)
 
-        search_results_text = "\n".join([metadata['name'] for metadata in search_results['metadatas'][0]])
-        return search_results_text
+    # Batch counterpart of retrieve: the queries not answered by the lexical
+    # fast path are embedded together and searched with one vectorized
+    # top-k. Returns one list of hits per query.
+    def retrieve_many(self, queries, n_results=10):
+        lexical_index = self.lexical_index if self.hybrid else None
+        results = [None] * len(queries)
+        if lexical_index is not None:
+            with stage('lexical'):
+                for i, query in enumerate(queries):
+                    results[i] = lexical_index.exact_hits(query, n_results=n_results) or None
 
+        pending = [i for i, hits in enumerate(results) if hits is None]
+        if not pending:
+            return results
+        vectors = self.embed_queries([queries[i] for i in pending])
+        depth = n_results if lexical_index is None else n_results * FUSION_DEPTH
+        for i, vector_hits in zip(pending, self.search(vectors, n_results=depth)):
+            if lexical_index is None:
+                results[i] = vector_hits
+                continue
+            with stage('lexical'):
+                lexical_hits = lexical_index.search(queries[i], n_results=depth)
+            results[i] = fuse(vector_hits, lexical_hits, n_results)
+        return results
 
+    # Scored {'id', 'name', 'distance'} hits for a user message, optionally
+    # cut off by a RetrievalDepth
+    def query_embeddings(self, user_message, n_results=10, depth=None):
+        _, hits = self.retrieve(user_message, n_results=n_results, depth=depth)
+        return hits
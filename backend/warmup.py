@@ -0,0 +1,57 @@
+import logging, threading, time
+
+LOADING = 'loading'
+READY = 'ready'
+FAILED = 'failed'
+
+
+class Warmup:
+    # Runs the loader for the heavy components (embedding model, vector
+    # index) once, in a background thread or inline, and tracks its state
+    # for the readiness probe.
+    def __init__(self, load):
+        self.load = load
+        self.state = LOADING
+        self.error = None
+        self.started = None
+        self.duration = None
+        self._done = threading.Event()
+
+    def start(self, background=True):
+        self.started = time.monotonic()
+        if background:
+            threading.Thread(target=self._run, name='warmup', daemon=True).start()
+        else:
+            self._run()
+        return self
+
+    @property
+    def ready(self):
+        return self.state == READY
+
+    # Block until loading has finished; True if it succeeded
+    def wait(self, timeout=None):
+        self._done.wait(timeout)
+        return self.ready
+
+    def status(self):
+        status = {'status': self.state}
+        if self.duration is not None:
+            status['load_seconds'] = round(self.duration, 3)
+        if self.error:
+            status['error'] = self.error
+        return status
+
+    def _run(self):
+        try:
+            self.load()
+        except Exception as e:
+            logging.exception("Failed to load the embedding model and vector index")
+            self.error = str(e)
+            self.state = FAILED
+        else:
+            self.state = READY
+        finally:
+            self.duration = time.monotonic() - self.started
+            logging.info(f"Warm-up finished in {self.duration:.1f}s: {self.state}")
+            self._done.set()
@@ -0,0 +1,54 @@
+import json
+import os
+import random
+
+WORKLOAD_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "workload.jsonl")
+
+
+def load_workload(path=WORKLOAD_FILE):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def sample_workload(workload, n, seed=0, small_talk_ratio=None, unique=False):
+    # Replayable sample: the same seed always yields the same request sequence.
+    # With unique=True each dataset query gets a request number appended, so
+    # no two requests can share a cached or in-progress answer.
+    rng = random.Random(seed)
+    if small_talk_ratio is None:
+        items = [rng.choice(workload) for _ in range(n)]
+    else:
+        small_talk = [item for item in workload if item['kind'] == 'small_talk']
+        dataset = [item for item in workload if item['kind'] != 'small_talk']
+        items = [rng.choice(small_talk if rng.random() < small_talk_ratio else dataset) for _ in range(n)]
+    if unique:
+        items = [{**item, 'message': f"{item['message']} #{i}"} if item['kind'] != 'small_talk' else item
+                 for i, item in enumerate(items)]
+    return items
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100.0
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(values_ms):
+    return {'count': len(values_ms),
+            'mean_ms': sum(values_ms) / len(values_ms) if values_ms else 0.0,
+            'p50_ms': percentile(values_ms, 50),
+            'p95_ms': percentile(values_ms, 95),
+            'p99_ms': percentile(values_ms, 99)}
+
+
+def print_table(title, rows):
+    # rows: {name: summary dict}
+    print(f"\n{title}")
+    print(f"{'':<28}{'count':>8}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}   (ms)")
+    for name, stats in rows.items():
+        print(f"{name:<28}{stats['count']:>8}{stats['mean_ms']:>10.2f}{stats['p50_ms']:>10.2f}"
+              f"{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}")
@@ -0,0 +1,240 @@
+"""
+ End-to-end load test for /api/chat. Starts the local mock Mistral/CKAN server,
+ launches the backend against it (unless --backend-url is given) and replays a
+ seeded mix of dataset queries and small talk with a fixed concurrency.
+
+ Reports throughput, p50/p95/p99 latency (and time to first token with
+ --stream), per message kind, plus any per-stage timings the backend returns
+ in a Server-Timing header.
+
+ Dataset queries are made unique per request and the launched backend runs
+ without its response cache, so every request pays for embedding, search and
+ the LLM call. --repeat-messages and --response-cache measure the cached
+ path instead. Cache hits and coalesced requests are reported separately.
+
+ Usage: python -m benchmarks.load_test --requests 200 --concurrency 16 --seed 1
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from benchmarks.common import load_workload, sample_workload, summarize, print_table
+from benchmarks.mock_mistral import MockConfig, start_server
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def launch_backend(server, mock_url, port, extra_env, workdir):
+    env = dict(os.environ,
+               PYTHONPATH=BACKEND_DIR,
+               MIXTRAL_API_KEY='benchmark',
+               MISTRAL_ENDPOINT=mock_url,
+               CKAN_API_URL=f"{mock_url}/api/3/action",
+               CATALOG_REFRESH_INTERVAL='0',
+               **extra_env)
+    if server == 'async':
+        command = [sys.executable, '-m', 'hypercorn', 'async_app:app', '--bind', f"127.0.0.1:{port}"]
+    else:
+        command = [sys.executable, '-m', 'flask', '--app', 'app', 'run', '--port', str(port), '--with-threads']
+    # Run from a scratch directory so the backend builds its cache/ from the mock catalog
+    return subprocess.Popen(command, env=env, cwd=workdir)
+
+
+def wait_for_ready(base_url, process, timeout):
+    # Poll /readyz until the backend has loaded its model and index. Returns
+    # the seconds until it accepted connections and until it was ready.
+    start = time.monotonic()
+    listening = None
+    while time.monotonic() - start < timeout:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError("backend exited during startup")
+        try:
+            response = requests.get(f"{base_url}/readyz", timeout=1)
+        except requests.ConnectionError:
+            time.sleep(0.1)
+            continue
+        listening = listening or time.monotonic() - start
+        if response.ok:
+            return listening, time.monotonic() - start
+        time.sleep(0.5)
+    raise TimeoutError(f"backend was not ready within {timeout}s")
+
+
+# Counters scraped from /metrics before and after the run
+COUNTERS = {'response cache hits': 'chatmixtral_cache_lookups_total{cache="response",result="hit"}',
+            'response cache misses': 'chatmixtral_cache_lookups_total{cache="response",result="miss"}',
+            'coalesced (retrieval)': 'chatmixtral_coalesced_requests_total{flight="retrieve"}',
+            'coalesced (llm)': 'chatmixtral_coalesced_requests_total{flight="llm"}'}
+
+
+def scrape_counters(base_url):
+    try:
+        text = requests.get(f"{base_url}/metrics", timeout=5).text
+    except requests.RequestException:
+        return {}
+    values = dict(line.rsplit(' ', 1) for line in text.splitlines() if line and not line.startswith('#'))
+    return {name: float(values.get(sample, 0.0)) for name, sample in COUNTERS.items()}
+
+
+def parse_server_timing(header):
+    # "embed;dur=1.2, search;dur=0.4" -> {'embed': 1.2, 'search': 0.4}
+    timings = {}
+    for part in (header or "").split(','):
+        fields = [field.strip() for field in part.split(';')]
+        durations = [field[4:] for field in fields[1:] if field.startswith('dur=')]
+        if fields[0] and durations:
+            timings[fields[0]] = float(durations[0])
+    return timings
+
+
+def send(base_url, item, session_id, stream, timeout):
+    payload = {'message': item['message'], 'session_id': session_id, 'stream': stream}
+    start = time.perf_counter()
+    first_token = None
+    with requests.post(f"{base_url}/api/chat", json=payload, stream=stream, timeout=timeout) as response:
+        if stream and response.ok:
+            for line in response.iter_lines():
+                if first_token is None and line.startswith(b'data: {"token"'):
+                    first_token = time.perf_counter()
+        else:
+            response.content
+        end = time.perf_counter()
+        return {'kind': item['kind'],
+                'status': response.status_code,
+                'latency_ms': (end - start) * 1000,
+                'ttft_ms': (first_token - start) * 1000 if first_token else None,
+                'stages': parse_server_timing(response.headers.get('Server-Timing'))}
+
+
+def run(base_url, items, concurrency, stream, timeout, session_prefix):
+    results = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(send, base_url, item, f"{session_prefix}-{i}", stream, timeout)
+                   for i, item in enumerate(items)]
+        for future in futures:
+            try:
+                results.append(future.result())
+            except requests.RequestException as e:
+                results.append({'kind': 'error', 'status': type(e).__name__, 'latency_ms': None,
+                                'ttft_ms': None, 'stages': {}})
+    return results, time.perf_counter() - start
+
+
+def report(results, elapsed, counters=None):
+    ok = [r for r in results if r['status'] == 200]
+    statuses = defaultdict(int)
+    for r in results:
+        statuses[str(r['status'])] += 1
+
+    latency = {'all': summarize([r['latency_ms'] for r in ok])}
+    for kind in sorted({r['kind'] for r in ok}):
+        latency[kind] = summarize([r['latency_ms'] for r in ok if r['kind'] == kind])
+    ttft = [r['ttft_ms'] for r in ok if r['ttft_ms'] is not None]
+    if ttft:
+        latency['time to first token'] = summarize(ttft)
+
+    stages = defaultdict(list)
+    for r in ok:
+        for name, duration in r['stages'].items():
+            stages[name].append(duration)
+
+    summary = {'requests': len(results),
+               'succeeded': len(ok),
+               'statuses': dict(statuses),
+               'elapsed_s': elapsed,
+               'throughput_rps': len(ok) / elapsed if elapsed else 0.0,
+               'latency': latency,
+               'stages': {name: summarize(values) for name, values in stages.items()},
+               'counters': counters or {}}
+
+    print(f"\n{summary['succeeded']}/{summary['requests']} succeeded in {elapsed:.2f}s "
+          f"-> {summary['throughput_rps']:.1f} req/s, statuses: {summary['statuses']}")
+    if summary['counters']:
+        print("Backend counters: " + ", ".join(f"{name} {value:g}" for name, value in summary['counters'].items()))
+    print_table("Latency", latency)
+    if summary['stages']:
+        print_table("Backend stages (Server-Timing)", summary['stages'])
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--seed', type=int, default=0, help="Seed for the replayable request sequence")
+    parser.add_argument('--workload', default=None, help="JSONL file of {message, kind} items")
+    parser.add_argument('--small-talk-ratio', type=float, default=None,
+                        help="Fraction of small talk (default: uniform over the workload file)")
+    parser.add_argument('--stream', action='store_true', help="Request SSE streaming and measure time to first token")
+    parser.add_argument('--repeat-messages', action='store_true',
+                        help="Send the workload messages as they are, so repeats can hit the response cache")
+    parser.add_argument('--response-cache', action='store_true', help="Keep the launched backend's response cache on")
+    parser.add_argument('--server', choices=['flask', 'async'], default='flask')
+    parser.add_argument('--backend-url', default=None, help="Use an already running backend")
+    parser.add_argument('--backend-env', action='append', default=[], metavar='KEY=VALUE',
+                        help="Extra environment for the launched backend")
+    parser.add_argument('--startup-timeout', type=float, default=600)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--latency-ms', type=float, default=300, help="Mock Mistral delay before the first token")
+    parser.add_argument('--tokens-per-second', type=float, default=50)
+    parser.add_argument('--output-tokens', type=int, default=60)
+    parser.add_argument('--catalog-size', type=int, default=2000)
+    parser.add_argument('--output', default=None, help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    config = MockConfig(args.latency_ms, args.tokens_per_second, args.output_tokens, args.catalog_size)
+    mock, mock_url = start_server(config)
+    process = None
+    workdir = tempfile.TemporaryDirectory()
+    try:
+        if args.backend_url:
+            base_url = args.backend_url
+        else:
+            port = free_port()
+            extra_env = {} if args.response_cache else {'RESPONSE_CACHE': '0'}
+            extra_env.update(item.split('=', 1) for item in args.backend_env)
+            process = launch_backend(args.server, mock_url, port, extra_env, workdir.name)
+            base_url = f"http://127.0.0.1:{port}"
+            listening, ready = wait_for_ready(base_url, process, args.startup_timeout)
+            print(f"Backend listening after {listening:.2f}s, ready after {ready:.2f}s")
+
+        workload = load_workload(args.workload) if args.workload else load_workload()
+        if args.warmup:
+            run(base_url, sample_workload(workload, args.warmup, seed=-1), 1, args.stream, args.timeout, 'warmup')
+
+        items = sample_workload(workload, args.requests, seed=args.seed, small_talk_ratio=args.small_talk_ratio,
+                                unique=not args.repeat_messages)
+        before = scrape_counters(base_url)
+        results, elapsed = run(base_url, items, args.concurrency, args.stream, args.timeout, f"bench-{args.seed}")
+        after = scrape_counters(base_url)
+        summary = report(results, elapsed, {name: after[name] - before.get(name, 0.0) for name in after})
+        summary['config'] = vars(args)
+        summary['mock_requests'] = config.requests
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(summary, f, indent=2)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+        mock.shutdown()
+        workdir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""
+ Micro-benchmarks for the retrieval path.
+
+   embedding  CustomEmbeddingFunction: single-query latency (cold and cached)
+              and batch throughput
+   search     VectorStore.search at several catalog sizes for each backend,
+              using random vectors (no model needed)
+   pipeline   Per-stage times (embedding, search, prompt build) for the
+              workload messages, in-process against a synthetic catalog
+
+ Usage: python -m benchmarks.micro search --sizes 1000 10000 50000
+"""
+import argparse
+import os
+import pickle
+import sys
+import tempfile
+import time
+import numpy as np
+from chromadb.utils.embedding_functions import EmbeddingFunction
+from benchmarks.common import load_workload, summarize, print_table
+from benchmarks.mock_mistral import MockConfig, start_server, synthetic_catalog
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def use_scratch_cache(vector_store, directory):
+    # Point the vector store's cache files at a scratch directory
+    vector_store.EMBEDDINGS_FILE = os.path.join(directory, "dataset_embeddings.pkl")
+    vector_store.CATALOG_FILE = os.path.join(directory, "dataset_catalog.json")
+
+
+def bench_embedding(args):
+    from embedding_cache import EmbeddingCache
+    from vector_store import CustomEmbeddingFunction
+
+    messages = [item['message'] for item in load_workload()]
+    embedding_function = CustomEmbeddingFunction(cache=EmbeddingCache(max_size=len(messages)), batch_wait_ms=0)
+    embedding_function.encode_queries(["warm up"])
+
+    rows = {'cold query': [], 'cached query': []}
+    for message in messages:
+        rows['cold query'].append(timed(embedding_function.embed_queries, [message])[1])
+    for message in messages:
+        rows['cached query'].append(timed(embedding_function.embed_queries, [message])[1])
+
+    for batch_size in args.batch_sizes:
+        batch = (messages * (batch_size // len(messages) + 1))[:batch_size]
+        per_item = []
+        for _ in range(args.repeat):
+            per_item.append(timed(embedding_function.encode_queries, batch)[1] / batch_size)
+        rows[f"batch of {batch_size} (per query)"] = per_item
+
+    print_table("CustomEmbeddingFunction", {name: summarize(values) for name, values in rows.items()})
+
+
+class RandomEmbeddingFunction(EmbeddingFunction):
+    model_name = 'random-benchmark'
+
+    def __init__(self, dim):
+        self.rng = np.random.default_rng(0)
+        self.dim = dim
+
+    def __call__(self, texts):
+        return self.rng.normal(size=(len(texts), self.dim)).astype(np.float32).tolist()
+
+
+def bench_search(args):
+    import vector_store
+    from vector_store import VectorStore
+
+    rows = {}
+    rng = np.random.default_rng(1)
+    queries = rng.normal(size=(args.queries, args.dim)).astype(np.float32)
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            use_scratch_cache(vector_store, directory)
+            names = synthetic_catalog(size)
+            vectors = rng.normal(size=(size, args.dim)).astype(np.float32)
+            with open(vector_store.EMBEDDINGS_FILE, 'wb') as f:
+                pickle.dump(([str(i) for i in range(size)], names, vectors.tolist(),
+                             [{'name': name} for name in names]), f)
+
+            for backend in args.backends:
+                store, build_ms = timed(VectorStore, embedding_function=RandomEmbeddingFunction(args.dim),
+                                        persistent=False, index_dir=os.path.join(directory, "index"),
+                                        backend=backend, hybrid=False)
+                print(f"{backend} index with {size} datasets built in {build_ms:.0f} ms")
+                single = [timed(store.search, [query], n_results=10)[1] for query in queries]
+                rows[f"{backend} {size} single"] = single
+                batch = [timed(store.search, queries[i:i + 32], n_results=10)[1] / 32
+                         for i in range(0, len(queries), 32)]
+                rows[f"{backend} {size} batch/query"] = batch
+                if hasattr(store.mmap_index, 'recall'):
+                    print(f"{backend} recall@10 at {size} datasets: {store.mmap_index.recall(queries, n_results=10):.3f}")
+                if store.client is not None:
+                    store.client.delete_collection(store.collection.name)
+
+    print_table("VectorStore.search (top 10)", {name: summarize(values) for name, values in rows.items()})
+
+
+def bench_pipeline(args):
+    import vector_store
+    from vector_store import VectorStore
+    from prompt_builder import PromptBuilder
+    from prompts.roles import system, user
+
+    mock, mock_url = start_server(MockConfig(catalog_size=args.catalog_size))
+    rows = {'embedding': [], 'search': [], 'prompt build': []}
+    with tempfile.TemporaryDirectory() as directory:
+        use_scratch_cache(vector_store, directory)
+        store = VectorStore(persistent=False, index_dir=os.path.join(directory, "index"),
+                            backend=args.backends[0], api_url=f"{mock_url}/api/3/action")
+        builder = PromptBuilder()
+        for item in load_workload():
+            if item['kind'] != 'dataset':
+                continue
+            [query_vector], embed_ms = timed(store.embed_queries, [item['message']])
+            [hits], search_ms = timed(store.search, [query_vector], n_results=10)
+            _, build_ms = timed(builder.build, system, user, item['message'], hits=hits)
+            rows['embedding'].append(embed_ms)
+            rows['search'].append(search_ms)
+            rows['prompt build'].append(build_ms)
+    mock.shutdown()
+
+    print_table(f"Per-stage times ({args.backends[0]}, {args.catalog_size} datasets)",
+                {name: summarize(values) for name, values in rows.items()})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('benchmark', choices=['embedding', 'search', 'pipeline'])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--backends', nargs='+', default=['chroma', 'numpy', 'quantized'],
+                        choices=['chroma', 'numpy', 'quantized'])
+    parser.add_argument('--dim', type=int, default=384, help="Embedding dimension (MiniLM: 384)")
+    parser.add_argument('--queries', type=int, default=256)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 32, 128])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--catalog-size', type=int, default=2000)
+    args = parser.parse_args()
+
+    {'embedding': bench_embedding, 'search': bench_search, 'pipeline': bench_pipeline}[args.benchmark](args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+"""
+ Local stand-in for the Mistral chat completions API (streaming and
+ non-streaming), with configurable latency and token rate. Requests for a
+ JSON object (response_format) get a structured dataset selection. Like the
+ real API it can throttle, answering 429 with a Retry-After past a quota of
+ requests per minute (--rpm) or for a random fraction of requests
+ (--throttle-rate). It also serves a synthetic CKAN catalog (package_list and
+ package_search) so the backend can be benchmarked without touching
+ data.gov.ie.
+
+ Usage: python -m benchmarks.mock_mistral --port 8100 --latency-ms 300 --tokens-per-second 50
+"""
+import argparse
+import json
+import random
+import threading
+from urllib.parse import urlparse, parse_qs
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TOPICS = ["housing", "traffic", "education", "population", "water-quality", "transport", "covid", "energy",
+          "agriculture", "tourism", "crime", "health", "employment", "weather", "fisheries", "planning"]
+PLACES = ["dublin", "cork", "galway", "limerick", "waterford", "kerry", "donegal", "mayo", "ireland"]
+
+
+def synthetic_catalog(size):
+    # Deterministic data.gov.ie-style slugs
+    return [f"{TOPICS[i % len(TOPICS)]}-{PLACES[(i // len(TOPICS)) % len(PLACES)]}-{2000 + i % 24}-{i}"
+            for i in range(size)]
+
+
+def synthetic_package(name):
+    # package_search result for a synthetic slug
+    parts = name.split('-')
+    topic, place = " ".join(parts[:-3]), parts[-3]
+    return {'name': name,
+            'title': f"{topic.title()} statistics for {place.title()}",
+            'notes': f"Annual {topic} figures published for {place.title()}.",
+            'tags': [{'name': topic}, {'name': place}],
+            'organization': {'title': f"{place.title()} County Council"},
+            'metadata_modified': "2024-01-01T00:00:00"}
+
+
+def json_tokens(payload):
+    # A JSON-mode reply, split into tokens of about four characters
+    content = json.dumps(payload)
+    return [content[i:i + 4] for i in range(0, len(content), 4)]
+
+
+class MockConfig:
+    def __init__(self, latency_ms=300, tokens_per_second=50, output_tokens=60, catalog_size=2000, rpm=0,
+                 throttle_rate=0.0):
+        self.latency = latency_ms / 1000.0
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.catalog = synthetic_catalog(catalog_size)
+        self.rpm = rpm  # Chat requests accepted per minute (0 for no quota)
+        self.throttle_rate = throttle_rate  # Fraction of chat requests answered 429 regardless of the quota
+        self.fail_next = 0  # Chat requests still to be answered 429 (set by tests)
+        self.requests = 0
+        self.throttled = 0
+        self.window_start = time.monotonic()
+        self.window_requests = 0
+        self.lock = threading.Lock()
+
+    def throttle(self):
+        # Seconds the client should wait if this chat request is throttled, else None
+        with self.lock:
+            now = time.monotonic()
+            if now - self.window_start >= 60:
+                self.window_start, self.window_requests = now, 0
+            if self.fail_next > 0:
+                self.fail_next -= 1
+                retry_after = 1
+            elif self.rpm and self.window_requests >= self.rpm:
+                retry_after = max(1, int(self.window_start + 60 - now))
+            elif random.random() < self.throttle_rate:
+                retry_after = 1
+            else:
+                self.window_requests += 1
+                return None
+            self.throttled += 1
+            return retry_after
+
+
+def make_handler(config):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def send_json(self, status, payload, headers=None):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path.endswith('/package_list'):
+                self.send_json(200, {'success': True, 'result': config.catalog})
+            elif url.path.endswith('/package_search'):
+                params = parse_qs(url.query)
+                rows = int(params.get('rows', ['10'])[0])
+                start = int(params.get('start', ['0'])[0])
+                names = sorted(config.catalog)[start:start + rows]
+                self.send_json(200, {'success': True, 'result': {'count': len(config.catalog),
+                                                                 'results': [synthetic_package(name)
+                                                                             for name in names]}})
+            else:
+                self.send_json(404, {'error': 'not found'})
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+            if not self.path.endswith('/v1/chat/completions'):
+                self.send_json(404, {'error': 'not found'})
+                return
+            with config.lock:
+                config.requests += 1
+            retry_after = config.throttle()
+            if retry_after is not None:
+                self.send_json(429, {'object': 'error', 'message': 'Requests rate limit exceeded',
+                                     'type': 'rate_limited'}, headers={'Retry-After': str(retry_after)})
+                return
+            self.chat(request)
+
+        def chat(self, request):
+            prompt_tokens = sum(len(m.get('content', '')) // 4 for m in request.get('messages', []))
+            if (request.get('response_format') or {}).get('type') == 'json_object':
+                tokens = json_tokens({'intro': "Here are some datasets related to your query:",
+                                      'datasets': [1, 2, 3, 4, 5]})
+            else:
+                tokens = [f"token{i} " for i in range(config.output_tokens)]
+            usage = {'prompt_tokens': prompt_tokens, 'completion_tokens': len(tokens),
+                     'total_tokens': prompt_tokens + len(tokens)}
+            completion_id = uuid.uuid4().hex
+            model = request.get('model', 'mock')
+            time.sleep(config.latency)
+
+            if not request.get('stream'):
+                time.sleep(len(tokens) / config.tokens_per_second)
+                self.send_json(200, {'id': completion_id, 'object': 'chat.completion', 'created': int(time.time()),
+                                     'model': model, 'usage': usage,
+                                     'choices': [{'index': 0, 'finish_reason': 'stop',
+                                                  'message': {'role': 'assistant', 'content': "".join(tokens)}}]})
+                return
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            for i, token in enumerate(tokens):
+                last = i == len(tokens) - 1
+                chunk = {'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                         'model': model, 'usage': usage if last else None,
+                         'choices': [{'index': 0, 'finish_reason': 'stop' if last else None,
+                                      'delta': {'role': 'assistant', 'content': token}}]}
+                try:
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    return
+                time.sleep(1.0 / config.tokens_per_second)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+            self.close_connection = True
+
+    return Handler
+
+
+def start_server(config, host='127.0.0.1', port=0):
+    # Start the mock in a background thread and return (server, base_url)
+    server = ThreadingHTTPServer((host, port), make_handler(config))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--latency-ms', type=float, default=300, help="Delay before the first token")
+    parser.add_argument('--tokens-per-second', type=float, default=50)
+    parser.add_argument('--output-tokens', type=int, default=60)
+    parser.add_argument('--catalog-size', type=int, default=2000)
+    parser.add_argument('--rpm', type=int, default=0, help="Chat requests per minute before answering 429")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="Fraction of chat requests answered 429")
+    args = parser.parse_args()
+
+    config = MockConfig(args.latency_ms, args.tokens_per_second, args.output_tokens, args.catalog_size,
+                        args.rpm, args.throttle_rate)
+    server, url = start_server(config, args.host, args.port)
+    print(f"Mock Mistral API on {url}/v1/chat/completions, CKAN on {url}/api/3/action/package_list")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from "react";
+import React, { useState, useEffect, useCallback, useRef } from "react";
 import ChatWindow from "./ChatWindow";
 import MessageInput from "./MessageInput";
 import "./App.css";
@@ -9,6 +9,7 @@ function App() {
   const [messages, setMessages] = useState([]);
   const [loading, setLoading] = useState(false); // Add loading state
   const [sessionId, setSessionId] = useState(null); // Add session ID state
+  const prefetchRequest = useRef(null); // AbortController of the latest prefetch
 
   useEffect(() => {
     // Generate or retrieve session ID on component mount
@@ -34,25 +35,86 @@ function App() {
       headers: {
         "Content-Type": "application/json",
       },
-      body: JSON.stringify({ session_id: sessionId, message: text }), // Send the message payload with session ID
+      body: JSON.stringify({ session_id: sessionId, message: text, stream: true }), // Ask the backend to stream the answer as SSE
     });
 
-    const data = await response.json();
-    console.log("Received response:", data); // Debugging log
+    if (!response.ok || !response.body) {
+      const data = await response.json();
+      setLoading(false);
+      console.error("Unexpected response format:", data); // Debugging log
+      return;
+    }
 
-    setLoading(false); // Set loading to false when a response is received
+    // Show the user message straight away and grow the AI message as tokens arrive
+    setMessages((prevMessages) => [
+      ...prevMessages,
+      { user: true, text },
+      { user: false, text: "" },
+    ]);
 
-    if (data && data.response) {
-      setMessages((prevMessages) => [
-        ...prevMessages,
-        { user: true, text },
-        { user: false, text: data.response },
-      ]);
-    } else {
-      console.error("Unexpected response format:", data); // Debugging log
+    const appendToLastMessage = (token) => {
+      setMessages((prevMessages) => {
+        const last = prevMessages[prevMessages.length - 1];
+        return [...prevMessages.slice(0, -1), { ...last, text: last.text + token }];
+      });
+    };
+
+    const replaceLastMessage = (text) => {
+      setMessages((prevMessages) => {
+        const last = prevMessages[prevMessages.length - 1];
+        return [...prevMessages.slice(0, -1), { ...last, text }];
+      });
+    };
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      // SSE frames are separated by a blank line
+      const frames = buffer.split("\n\n");
+      buffer = frames.pop();
+      for (const frame of frames) {
+        const event = (frame.match(/^event: (.*)$/m) || [])[1];
+        const payload = (frame.match(/^data: (.*)$/m) || [])[1];
+        if (!payload) continue;
+        const data = JSON.parse(payload);
+        if (event === "error") {
+          console.error("Streaming error:", data.error); // Debugging log
+        } else if (event === "done") {
+          setLoading(false);
+          replaceLastMessage(data.response); // The final answer, as rendered by the backend
+        } else if (data.token) {
+          setLoading(false); // Hide the spinner on the first token
+          appendToLastMessage(data.token);
+        }
+      }
     }
+
+    setLoading(false); // Set loading to false when the stream has finished
   };
 
+  // Best effort: the chat request works the same if this fails. A newer
+  // draft supersedes the previous one, so a request still pending is aborted.
+  const prefetch = useCallback((text) => {
+    if (!sessionId) return;
+    if (prefetchRequest.current) prefetchRequest.current.abort();
+    const controller = new AbortController();
+    prefetchRequest.current = controller;
+    fetch(`${process.env.REACT_APP_API_BASE_URL}/api/prefetch`, {
+      method: "POST",
+      headers: {
+        "Content-Type": "application/json",
+      },
+      body: JSON.stringify({ session_id: sessionId, message: text }),
+      signal: controller.signal,
+    }).catch(() => {});
+  }, [sessionId]);
+
   const clearHistory = async () => {
     if (!sessionId) {
       console.error("No session ID found");
@@ -80,7 +142,7 @@ function App() {
       </header>
       {loading && <div className="spinner"></div>} {/* Show spinner when loading */}
       <ChatWindow messages={messages} />
-      <MessageInput sendMessage={sendMessage} clearHistory={clearHistory} />
+      <MessageInput sendMessage={sendMessage} clearHistory={clearHistory} prefetch={prefetch} />
     </div>
   );
 }
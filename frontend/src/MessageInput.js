@@ -1,11 +1,27 @@
-import React, { useState } from "react";
+import React, { useState, useEffect, useRef } from "react";
 import "./MessageInput.css";
 
-const MessageInput = ({ sendMessage, clearHistory }) => {
+// Milliseconds of no typing before the draft is sent for prefetching, so a
+// burst of keystrokes becomes one request. The backend debounces drafts too
+// (PREFETCH_DEBOUNCE), in case a client sends every change.
+const PREFETCH_DELAY = 200;
+
+const MessageInput = ({ sendMessage, clearHistory, prefetch }) => {
   const [text, setText] = useState("");
+  const prefetchTimer = useRef(null);
+
+  // Let the backend start retrieval for the draft while the user is typing
+  useEffect(() => {
+    clearTimeout(prefetchTimer.current);
+    if (prefetch && text.trim() !== "") {
+      prefetchTimer.current = setTimeout(() => prefetch(text), PREFETCH_DELAY);
+    }
+    return () => clearTimeout(prefetchTimer.current);
+  }, [text, prefetch]);
 
   const handleSend = () => {
     if (text.trim() !== "") {
+      clearTimeout(prefetchTimer.current);
       sendMessage(text);
       setText("");
     }
@@ -21,7 +21,8 @@ def query_vector_db(query_text):
     if response.status_code == 200:
         data = response.json()
         print("Search Results:")
-        print(data['response'])
+        for hit in data['results'][0]['hits']:
+            print(hit['name'])
     else:
         print(f"Error: {response.status_code}")
         print(response.json())
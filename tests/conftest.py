@@ -0,0 +1,148 @@
+import os, sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The backend modules import each other as top-level modules (see backend/app.py)
+sys.path.insert(0, os.path.join(ROOT, 'backend'))
+# The benchmark helpers (e.g. the mock Mistral server) are imported as `benchmarks.*`
+sys.path.insert(0, ROOT)
+
+import json, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import pytest
+from chromadb.utils.embedding_functions import EmbeddingFunction
+from mistralai.client import MistralClient
+from benchmarks.mock_mistral import MockConfig, start_server
+
+# Settings for importing backend/app.py in tests: history in memory, the
+# index loaded inline from FakeVectorStore, and nothing in the background
+APP_ENVIRONMENT = {'MIXTRAL_API_KEY': 'test', 'SESSION_BACKEND': 'memory', 'BACKGROUND_LOAD': '0',
+                   'WARMUP_ENCODE': '0', 'INTENT_ROUTER': '0', 'CATALOG_REFRESH_INTERVAL': '0',
+                   'RESPONSE_CACHE': '0'}
+
+
+class FakeVectorStore:
+    # Stands in for the embedding model and index: every query retrieves the same datasets
+    def retrieve(self, user_message, n_results=10, query_vector=None, depth=None):
+        hits = [{'id': str(i), 'name': f"housing-data-{i}", 'distance': 0.1 * i} for i in range(5)]
+        return [1.0, 0.0], hits[:n_results]
+
+    def retrieve_many(self, queries, n_results=10):
+        return [self.retrieve(query, n_results)[1] for query in queries]
+
+    def title(self, name):
+        return name.replace('-', ' ').title()
+
+
+@pytest.fixture(scope='session')
+def backend_app():
+    with pytest.MonkeyPatch.context() as patch:
+        for name, value in APP_ENVIRONMENT.items():
+            patch.setenv(name, value)
+        import vector_store
+        patch.setattr(vector_store, 'VectorStore', FakeVectorStore)
+        import app
+    return app
+
+@pytest.fixture
+def mock_mistral():
+    config = MockConfig(latency_ms=1, tokens_per_second=10000, output_tokens=5, catalog_size=10)
+    server, url = start_server(config)
+    yield config, url
+    server.shutdown()
+
+@pytest.fixture
+def chat_app(backend_app, mock_mistral, monkeypatch):
+    # backend/app.py calling the mock Mistral API through a fresh scheduler
+    from llm_scheduler import LLMScheduler, read_error_bodies
+    config, url = mock_mistral
+    monkeypatch.setattr(backend_app, 'mistral_client',
+                        read_error_bodies(MistralClient(api_key='test', endpoint=url, max_retries=1)))
+    monkeypatch.setattr(backend_app, 'llm_scheduler', LLMScheduler(backoff_base=0.001, backoff_max=0.01))
+    return backend_app
+
+
+class CountingEmbeddingFunction(EmbeddingFunction):
+    # Toy ASCII embedding, so no model has to be loaded. Records the texts it
+    # embeds, and fails its fail_on_call'th call if that is set.
+    model_name = 'ascii-test'
+
+    def __init__(self, fail_on_call=None):
+        self.embedded = []
+        self.calls = 0
+        self.fail_on_call = fail_on_call
+
+    def __call__(self, texts):
+        if not isinstance(texts, list):
+            texts = [texts]
+        self.calls += 1
+        if self.calls == self.fail_on_call:
+            raise RuntimeError("embedding failed")
+        self.embedded.extend(texts)
+        return [self._embed(text) for text in texts]
+
+    def _embed(self, text):
+        vector = [float(ord(c)) for c in text]
+        if len(vector) < 128:
+            vector.extend([0.0] * (128 - len(vector)))
+        return vector[:128]
+
+
+def package(name, notes="", modified="2024-01-01"):
+    # A CKAN package as returned by package_search
+    return {'name': name, 'title': name.replace('-', ' ').title(), 'notes': notes,
+            'tags': [{'name': name.split('-')[0]}], 'organization': None, 'metadata_modified': modified}
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    # Catalog files written by VectorStore go to a temporary directory
+    import vector_store
+    monkeypatch.setattr(vector_store, 'EMBEDDINGS_FILE', str(tmp_path / "dataset_embeddings.pkl"))
+    monkeypatch.setattr(vector_store, 'CATALOG_FILE', str(tmp_path / "dataset_catalog.json"))
+    return tmp_path
+
+# Local stand-in for the CKAN action API: package_list lists the names of
+# state['packages'] in order, package_search pages through them by name
+@pytest.fixture
+def ckan():
+    state = {'packages': [package(f"dataset-{i:03d}", notes=f"About topic {i}") for i in range(25)],
+             'requests': 0, 'in_flight': 0, 'max_in_flight': 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            with lock:
+                state['requests'] += 1
+                state['in_flight'] += 1
+                state['max_in_flight'] = max(state['max_in_flight'], state['in_flight'])
+            try:
+                if url.path.endswith('/package_list'):
+                    status, result = 200, [p['name'] for p in state['packages']]
+                elif url.path.endswith('/package_search'):
+                    params = parse_qs(url.query)
+                    rows, start = int(params['rows'][0]), int(params.get('start', ['0'])[0])
+                    packages = sorted(state['packages'], key=lambda p: p['name'])
+                    threading.Event().wait(0.02)
+                    status, result = 200, {'count': len(packages), 'results': packages[start:start + rows]}
+                else:
+                    status, result = 404, None
+                body = json.dumps({'success': status == 200, 'result': result})
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(body.encode('utf-8'))
+            finally:
+                with lock:
+                    state['in_flight'] -= 1
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    state['url'] = f"http://127.0.0.1:{server.server_port}/api/3/action"
+    yield state
+    server.shutdown()
@@ -0,0 +1,155 @@
+import json, threading, time, uuid
+import pytest
+from llm_scheduler import LLMScheduler
+from warmup import Warmup
+
+
+def post_chat(client, message="housing data in dublin", stream=False, **options):
+    session_id = uuid.uuid4().hex
+    response = client.post('/api/chat', json={'message': message, 'session_id': session_id, 'stream': stream},
+                           **options)
+    return session_id, response
+
+def sse_frames(body):
+    # (event, data) for each frame of a text/event-stream body
+    frames = []
+    for frame in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in frame.splitlines())
+        frames.append((lines.get('event'), json.loads(lines['data'])))
+    return frames
+
+def history(app, session_id):
+    return [message.content for message in app.sessions.get(session_id).chat_memory.messages]
+
+def test_blocking_chat_answers_and_remembers_the_turn(chat_app, mock_mistral):
+    session_id, response = post_chat(chat_app.app.test_client())
+
+    answer = response.get_json()['response']
+    assert response.status_code == 200 and 'Server-Timing' in response.headers
+    assert answer.startswith("Here are some datasets") and "Housing Data 0" in answer
+    assert history(chat_app, session_id) == ["housing data in dublin", answer]
+    assert mock_mistral[0].requests == 1
+
+def test_streamed_chat_is_framed_as_server_sent_events(chat_app):
+    session_id, response = post_chat(chat_app.app.test_client(), stream=True)
+
+    assert response.status_code == 200 and response.mimetype == 'text/event-stream'
+    frames = sse_frames(response.get_data(as_text=True))
+    tokens = "".join(data['token'] for event, data in frames[:-1])
+    event, done = frames[-1]
+    assert all(event is None for event, _ in frames[:-1]) and event == 'done'
+    assert tokens == done['response'] and tokens.startswith("Here are some datasets")
+    assert history(chat_app, session_id) == ["housing data in dublin", done['response']]
+    assert chat_app.llm_scheduler.active == 0
+
+def test_a_client_disconnect_closes_the_upstream_stream(chat_app, monkeypatch):
+    closed = []
+    chat_stream = chat_app.mistral_client.chat_stream
+
+    def tracked_chat_stream(**kwargs):
+        try:
+            yield from chat_stream(**kwargs)
+        finally:
+            closed.append(True)
+    monkeypatch.setattr(chat_app.mistral_client, 'chat_stream', tracked_chat_stream)
+
+    session_id, response = post_chat(chat_app.app.test_client(), stream=True, buffered=False)
+    first = next(iter(response.response))
+    response.close()
+
+    assert b"token" in first
+    assert closed == [True] and chat_app.llm_scheduler.active == 0
+    # Nothing is remembered of a turn that wasn't answered
+    assert history(chat_app, session_id) == []
+
+def test_chat_answers_503_while_loading(chat_app, monkeypatch):
+    monkeypatch.setattr(chat_app, 'warmup', Warmup(lambda: None))
+
+    session_id, response = post_chat(chat_app.app.test_client())
+
+    assert response.status_code == 503 and response.headers['Retry-After'] == "5"
+    assert response.get_json()['status'] == 'loading'
+    assert history(chat_app, session_id) == []
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_chat_answers_503_when_mistral_calls_are_overloaded(chat_app, mock_mistral, monkeypatch, stream):
+    monkeypatch.setattr(chat_app, 'llm_scheduler', LLMScheduler(max_concurrency=0, max_queue=0))
+
+    session_id, response = post_chat(chat_app.app.test_client(), stream=stream)
+
+    assert response.status_code == 503 and int(response.headers['Retry-After']) >= 1
+    assert 'retry' in response.get_json()['error']
+    assert mock_mistral[0].requests == 0
+    # Turned away without side effects, so a retry is still a first turn
+    assert history(chat_app, session_id) == []
+
+@pytest.mark.parametrize('body', [{}, {'query': ""}, {'queries': []}, {'queries': ["ok", 3]},
+                                  {'query': "housing", 'n_results': 0}, {'query': "housing", 'n_results': 101},
+                                  {'query': "housing", 'n_results': True}])
+def test_search_rejects_invalid_requests(chat_app, body):
+    response = chat_app.app.test_client().post('/api/search', json=body)
+
+    assert response.status_code == 400 and response.get_json()['error']
+
+def test_search_returns_hits_per_query(chat_app):
+    client = chat_app.app.test_client()
+
+    results = client.post('/api/search', json={'queries': ["housing", "traffic"], 'n_results': 2}).get_json()
+    lines = client.post('/api/search', json={'query': "housing", 'stream': True}).get_data(as_text=True)
+
+    assert [result['query'] for result in results['results']] == ["housing", "traffic"]
+    assert [hit['name'] for hit in results['results'][0]['hits']] == ["housing-data-0", "housing-data-1"]
+    assert [json.loads(line)['query'] for line in lines.splitlines()] == ["housing"]
+
+def test_a_disconnected_leader_finishes_the_answer_for_its_followers(chat_app):
+    client = chat_app.app.test_client()
+    started, joined = threading.Event(), threading.Event()
+    leader = {}
+
+    def lead():
+        # On its own thread, as a server would run it
+        leader['session_id'], response = post_chat(client, stream=True, buffered=False)
+        next(iter(response.response))
+        started.set()
+        joined.wait(5)
+        response.close()
+
+    thread = threading.Thread(target=lead)
+    thread.start()
+    started.wait(5)
+    _, follower = post_chat(client, stream=True, buffered=False)
+    joined.set()
+    thread.join(5)
+    frames = sse_frames(b"".join(follower.response).decode('utf-8'))
+
+    assert frames[-1][0] == 'done'
+    assert "".join(data['token'] for _, data in frames[:-1]) == frames[-1][1]['response']
+    assert history(chat_app, leader['session_id']) == ["housing data in dublin", frames[-1][1]['response']]
+    assert chat_app.llm_scheduler.active == 0
+
+def test_a_stream_that_never_starts_releases_its_followers(chat_app):
+    body = {'message': "housing data in dublin", 'session_id': uuid.uuid4().hex, 'stream': True}
+    with chat_app.app.test_request_context('/api/chat', method='POST', json=body):
+        leader = chat_app.chat()
+    # The test client reads the first frame, which the follower only gets once the flight lands
+    follower = {}
+    thread = threading.Thread(target=lambda: follower.update(
+        body=post_chat(chat_app.app.test_client(), stream=True)[1].get_data(as_text=True)))
+    thread.start()
+    while not chat_app.llm_flights._flights or not next(iter(chat_app.llm_flights._flights.values())).followers:
+        time.sleep(0.001)
+
+    leader.close()
+    thread.join(5)
+
+    assert sse_frames(follower['body']) == [
+        ('error', {'error': "Failed to get response from Mistral API: Chat stream closed before it started"})]
+    assert chat_app.llm_scheduler.active == 0 and len(chat_app.llm_flights) == 0
+
+def test_a_throttled_blocking_chat_leaves_no_trace(chat_app, mock_mistral):
+    mock_mistral[0].fail_next = 10  # More 429s than the scheduler retries
+
+    session_id, response = post_chat(chat_app.app.test_client())
+
+    assert response.status_code == 503 and int(response.headers['Retry-After']) >= 1
+    assert history(chat_app, session_id) == []
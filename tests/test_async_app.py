@@ -0,0 +1,154 @@
+import asyncio, threading, uuid
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from mistralai.async_client import MistralAsyncClient
+from llm_scheduler import LLMScheduler, read_error_bodies
+from test_app import sse_frames, history
+
+
+@pytest.fixture
+def async_app(chat_app, monkeypatch):
+    import async_app
+    monkeypatch.setattr(async_app, 'llm_scheduler', chat_app.llm_scheduler)
+    return async_app
+
+def run(async_app, mock_mistral, monkeypatch, requests):
+    # Run requests(client) against the async app, with a Mistral client bound to this event loop
+    async def main():
+        client = read_error_bodies(MistralAsyncClient(api_key='test', endpoint=mock_mistral[1], max_retries=1))
+        monkeypatch.setattr(async_app, 'mistral_client', client)
+        try:
+            return await requests(async_app.app.test_client())
+        finally:
+            await client.close()
+    return asyncio.run(main())
+
+def test_blocking_chat(async_app, mock_mistral, monkeypatch):
+    session_id = uuid.uuid4().hex
+
+    async def requests(client):
+        response = await client.post('/api/chat', json={'message': "housing data", 'session_id': session_id})
+        return response.status_code, await response.get_json()
+
+    status, body = run(async_app, mock_mistral, monkeypatch, requests)
+
+    assert status == 200 and body['response'].startswith("Here are some datasets")
+    assert history(async_app, session_id) == ["housing data", body['response']]
+
+def test_streamed_chat(async_app, mock_mistral, monkeypatch):
+    session_id = uuid.uuid4().hex
+
+    async def requests(client):
+        response = await client.post('/api/chat', json={'message': "housing data", 'session_id': session_id,
+                                                        'stream': True})
+        return response.mimetype, await response.get_data(as_text=True)
+
+    mimetype, body = run(async_app, mock_mistral, monkeypatch, requests)
+
+    frames = sse_frames(body)
+    assert mimetype == 'text/event-stream' and frames[-1][0] == 'done'
+    assert "".join(data['token'] for _, data in frames[:-1]) == frames[-1][1]['response']
+    assert history(async_app, session_id) == ["housing data", frames[-1][1]['response']]
+    assert async_app.llm_scheduler.active == 0
+
+def test_clear_history(async_app, mock_mistral, monkeypatch):
+    session_id = uuid.uuid4().hex
+
+    async def requests(client):
+        await client.post('/api/chat', json={'message': "housing data", 'session_id': session_id})
+        missing = await client.post('/api/clear_history', json={})
+        cleared = await client.post('/api/clear_history', json={'session_id': session_id})
+        return missing.status_code, cleared.status_code
+
+    assert run(async_app, mock_mistral, monkeypatch, requests) == (400, 200)
+    assert history(async_app, session_id) == []
+
+def test_overloaded_chat_answers_503(async_app, mock_mistral, monkeypatch):
+    monkeypatch.setattr(async_app, 'llm_scheduler', LLMScheduler(max_concurrency=0, max_queue=0))
+
+    async def requests(client):
+        response = await client.post('/api/chat', json={'message': "housing data", 'session_id': "s1"})
+        return response.status_code, response.headers['Retry-After']
+
+    status, retry_after = run(async_app, mock_mistral, monkeypatch, requests)
+
+    assert status == 503 and int(retry_after) >= 1 and mock_mistral[0].requests == 0
+    assert history(async_app, "s1") == []
+
+@pytest.mark.parametrize('followed', [True, False])
+def test_a_disconnected_leader_keeps_streaming_only_for_its_followers(async_app, followed):
+    key = ('lead-test', followed)
+    flight, _ = async_app.llm_flights.join(key)
+
+    async def main():
+        release = asyncio.Event()
+
+        async def produce():
+            flight.publish("Here ")
+            await release.wait()
+            flight.publish("you go")
+            flight.finish("Here you go")
+
+        producer = asyncio.create_task(produce())
+        if followed:
+            async_app.llm_flights.join(key)
+        events = async_app.lead_chat(flight, producer)
+        first = await events.__anext__()
+        await events.aclose()  # The client disconnects
+        release.set()
+        await asyncio.gather(producer, return_exceptions=True)
+        return first, producer.cancelled()
+
+    first, cancelled = asyncio.run(main())
+
+    assert sse_frames(first) == [(None, {'token': "Here "})]
+    assert cancelled is not followed
+    assert (flight.result == "Here you go") is followed
+
+def test_a_stream_that_is_never_sent_gives_its_slot_back(async_app, mock_mistral, monkeypatch):
+    session_id = uuid.uuid4().hex
+    async_app.sessions.get(session_id).add_turn("hello", "Hi! What data are you looking for?")
+
+    async def main():
+        body = {'message': "housing data", 'session_id': session_id, 'stream': True}
+        async with async_app.app.test_request_context('/api/chat', method='POST', json=body):
+            response = await async_app.chat()
+            active = async_app.llm_scheduler.active
+            del response  # Dropped before it was sent
+        return active
+
+    assert asyncio.run(main()) == 1
+    assert async_app.llm_scheduler.active == 0 and mock_mistral[0].requests == 0
+
+def test_retrieval_followers_wait_on_the_event_loop(async_app, monkeypatch):
+    calls, release = [], threading.Event()
+
+    def route_and_retrieve(user_message, n_results):
+        calls.append(user_message)
+        release.wait(5)
+        return None, None, [{'id': '0', 'name': "housing-data-0", 'distance': 0.1}]
+
+    class CountingExecutor(ThreadPoolExecutor):
+        submitted = 0
+
+        def submit(self, *args, **kwargs):
+            CountingExecutor.submitted += 1
+            return super().submit(*args, **kwargs)
+
+    monkeypatch.setattr(async_app, 'route_and_retrieve', route_and_retrieve)
+    monkeypatch.setattr(async_app, 'executor', CountingExecutor(max_workers=1))
+
+    async def main():
+        requests = [asyncio.ensure_future(async_app.shared_route_and_retrieve("Housing data", 10))]
+        await asyncio.sleep(0.01)
+        requests += [asyncio.ensure_future(async_app.shared_route_and_retrieve("housing  data", 10))
+                     for _ in range(20)]
+        await asyncio.sleep(0.01)
+        release.set()
+        return await asyncio.gather(*requests)
+
+    results = asyncio.run(main())
+
+    assert len(results) == 21 and all(result == results[0] for result in results)
+    assert calls == ["Housing data"] and CountingExecutor.submitted == 1
+    assert len(async_app.retrieval_flights) == 0
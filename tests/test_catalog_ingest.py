@@ -0,0 +1,92 @@
+import os
+import threading
+import pytest
+import vector_store
+from catalog_ingest import CatalogIngest, PACKAGE_SEARCH, package_document
+from conftest import CountingEmbeddingFunction, package
+from vector_store import VectorStore
+
+
+def test_pages_are_fetched_concurrently_and_merged_in_order(ckan, tmp_path):
+    ingest = CatalogIngest(ckan['url'], str(tmp_path / "ingest"), page_size=4, concurrency=3)
+    embedding_function = CountingEmbeddingFunction()
+
+    names, vectors, metadatas = ingest.run(embedding_function, 'ascii-test')
+
+    assert names == [f"dataset-{i:03d}" for i in range(25)]
+    assert vectors.shape == (25, 128)
+    assert embedding_function.calls == 7  # one call per page
+    assert sorted(embedding_function.embedded) == sorted(package_document(p) for p in ckan['packages'])
+    assert metadatas[3] == {'name': "dataset-003", 'title': "Dataset 003", 'organization': "",
+                            'tags': "dataset", 'modified': "2024-01-01"}
+    assert 1 < ckan['max_in_flight'] <= 3
+
+def test_interrupted_ingest_resumes_with_the_remaining_pages(ckan, tmp_path):
+    checkpoint_dir = str(tmp_path / "ingest")
+    with pytest.raises(RuntimeError):
+        CatalogIngest(ckan['url'], checkpoint_dir, page_size=10, concurrency=1).run(
+            CountingEmbeddingFunction(fail_on_call=3), 'ascii-test')
+    assert len([f for f in os.listdir(checkpoint_dir) if f.startswith('page-')]) == 2
+
+    embedding_function = CountingEmbeddingFunction()
+    names, vectors, _ = CatalogIngest(ckan['url'], checkpoint_dir, page_size=10, concurrency=1).run(
+        embedding_function, 'ascii-test')
+
+    assert embedding_function.calls == 1 and len(embedding_function.embedded) == 5
+    assert len(names) == 25 and vectors.shape[0] == 25
+
+def test_vector_store_indexes_and_refreshes_package_metadata(ckan, cache_dir):
+    embedding_function = CountingEmbeddingFunction()
+    store = VectorStore(embedding_function=embedding_function, persistent=False, backend='numpy',
+                        index_dir=str(cache_dir / "index"), api_url=ckan['url'], source=PACKAGE_SEARCH)
+    assert len(embedding_function.embedded) == 25
+    assert not os.path.exists(vector_store.EMBEDDINGS_FILE + '.ingest')
+
+    ckan['packages'][7] = package("dataset-007", notes="Revised description", modified="2024-06-01")
+    ckan['packages'].append(package("weather-2024"))
+    embedding_function.embedded.clear()
+
+    assert store.refresh_catalog() == {'added': 1, 'updated': 1, 'removed': 0}
+    assert embedding_function.embedded == [package_document(ckan['packages'][7]),
+                                           package_document(ckan['packages'][-1])]
+    assert store.retrieve("weather-2024", n_results=1)[1][0]['name'] == "weather-2024"
+
+@pytest.mark.parametrize('backend', ['chroma', 'numpy'])
+def test_metadata_only_refresh_keeps_the_live_index_serving(ckan, cache_dir, backend):
+    store = VectorStore(embedding_function=CountingEmbeddingFunction(), persistent=False, backend=backend,
+                        index_dir=str(cache_dir / "index"), api_url=ckan['url'], source=PACKAGE_SEARCH)
+    live = store.collection if backend == 'chroma' else store.mmap_index
+    ckan['packages'][3] = package("dataset-003", notes="Revised description", modified="2024-06-01")
+
+    errors, refreshed = [], threading.Event()
+
+    def query():
+        while not refreshed.is_set():
+            try:
+                store.retrieve("about a revised topic", n_results=3)
+            except Exception as e:
+                errors.append(e)
+
+    querying = threading.Thread(target=query)
+    querying.start()
+    try:
+        assert store.refresh_catalog() == {'added': 0, 'updated': 1, 'removed': 0}
+    finally:
+        refreshed.set()
+        querying.join(5)
+
+    assert errors == []
+    if backend == 'chroma':
+        assert store.collection.name != live.name and live.count() == 25
+    else:
+        assert store.mmap_index.path != live.path and len(live.search(live.vectors[:1], 1)[0]) == 1
+
+def test_link_titles_come_from_package_metadata(ckan, cache_dir):
+    ckan['packages'][3]['title'] = "Road Traffic Counts"
+    store = VectorStore(embedding_function=CountingEmbeddingFunction(), persistent=False, backend='numpy',
+                        index_dir=str(cache_dir / "index"), api_url=ckan['url'], source=PACKAGE_SEARCH)
+    reopened = VectorStore(embedding_function=CountingEmbeddingFunction(), persistent=False, backend='numpy',
+                           index_dir=str(cache_dir / "index"), api_url=ckan['url'], source=PACKAGE_SEARCH)
+
+    assert store.title("dataset-003") == reopened.title("dataset-003") == "Road Traffic Counts"
+    assert store.title("not-in-the-catalog") == "Not In The Catalog"
@@ -0,0 +1,55 @@
+import pickle
+import pytest
+import vector_store
+from conftest import CountingEmbeddingFunction, package
+from vector_store import VectorStore
+
+
+def catalog(*names):
+    return [package(name) for name in names]
+
+@pytest.fixture
+def ckan(ckan):
+    ckan['packages'] = catalog("housing-data-2020", "vocational-training-2021", "road-traffic-counts")
+    return ckan
+
+
+@pytest.mark.parametrize('backend', ['chroma', 'numpy'])
+def test_refresh_embeds_only_the_difference(ckan, cache_dir, backend):
+    embedding_function = CountingEmbeddingFunction()
+    store = VectorStore(embedding_function=embedding_function, persistent=False,
+                        index_dir=str(cache_dir / "index"), backend=backend, api_url=ckan['url'])
+    assert len(embedding_function.embedded) == 3
+
+    ckan['packages'] = catalog("housing-data-2020", "road-traffic-counts", "water-quality-2022")
+    embedding_function.embedded.clear()
+    result = store.refresh_catalog()
+
+    assert result == {'added': 1, 'updated': 0, 'removed': 1}
+    assert embedding_function.embedded == ["water-quality-2022"]
+    assert [hit['name'] for hit in store.query_embeddings("water-quality-2022", n_results=1)] == ["water-quality-2022"]
+    assert "vocational-training-2021" not in [hit['name'] for hit in
+                                              store.query_embeddings("vocational-training-2021", n_results=3)]
+
+    with open(vector_store.EMBEDDINGS_FILE, 'rb') as f:
+        ids, dataset_names, vectors, metadatas = pickle.load(f)
+    assert dataset_names == ["housing-data-2020", "road-traffic-counts", "water-quality-2022"]
+    assert ids == ["0", "2", "3"]
+
+    store.drop_stale_indexes()
+    assert store.refresh_catalog() == {'added': 0, 'updated': 0, 'removed': 0}
+
+def test_refresh_swaps_in_a_new_index(ckan, cache_dir):
+    store = VectorStore(embedding_function=CountingEmbeddingFunction(), persistent=True,
+                        index_dir=str(cache_dir / "chroma"), api_url=ckan['url'])
+    live = store.collection
+
+    ckan['packages'].append(package("water-quality-2022"))
+    store.refresh_catalog()
+
+    # The old collection keeps serving until it is retired
+    assert store.collection.name != live.name
+    assert live.count() == 3
+    store.drop_stale_indexes()
+    names = [getattr(c, 'name', c) for c in store.client.list_collections()]
+    assert names == [store.collection.name]
@@ -0,0 +1,68 @@
+import os
+import threading
+import time
+import pytest
+from embedding_batcher import EmbeddingBatcher
+
+
+def test_concurrent_queries_share_a_batch():
+    batch_sizes = []
+
+    def encode(texts):
+        batch_sizes.append(len(texts))
+        time.sleep(0.01)
+        return [[float(len(text))] for text in texts]
+
+    batcher = EmbeddingBatcher(encode, max_batch_size=8, max_wait_ms=50)
+    texts = ["x" * i for i in range(1, 17)]
+    results = {}
+
+    def worker(text):
+        results[text] = batcher.embed([text])[0]
+
+    threads = [threading.Thread(target=worker, args=(text,)) for text in texts]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    batcher.close()
+
+    assert all(results[text] == [float(len(text))] for text in texts)
+    assert sum(batch_sizes) == len(texts)
+    assert max(batch_sizes) <= 8
+    assert len(batch_sizes) < len(texts)
+
+def test_lone_query_is_flushed_after_max_wait():
+    batcher = EmbeddingBatcher(lambda texts: [[1.0] for _ in texts], max_batch_size=32, max_wait_ms=5)
+    start = time.monotonic()
+
+    assert batcher.embed(["hi"]) == [[1.0]]
+    assert time.monotonic() - start < 1.0
+    batcher.close()
+
+def test_encode_errors_reach_every_caller():
+    def encode(texts):
+        raise RuntimeError("model failed")
+
+    batcher = EmbeddingBatcher(encode, max_wait_ms=1)
+    with pytest.raises(RuntimeError):
+        batcher.embed(["hi", "thanks"])
+    batcher.close()
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason="needs fork()")
+def test_batcher_keeps_working_in_a_forked_child():
+    batcher = EmbeddingBatcher(lambda texts: [[float(len(text))] for text in texts], max_wait_ms=1)
+    assert batcher.embed(["abc"]) == [[3.0]]
+
+    pid = os.fork()
+    if pid == 0:
+        # Child: exit status 0 only if the batcher answers in time
+        result = []
+        thread = threading.Thread(target=lambda: result.append(batcher.embed(["abcd"])), daemon=True)
+        thread.start()
+        thread.join(timeout=5)
+        os._exit(0 if result == [[[4.0]]] else 1)
+    _, status = os.waitpid(pid, 0)
+
+    assert os.WEXITSTATUS(status) == 0
+    assert batcher.embed(["ab"]) == [[2.0]]
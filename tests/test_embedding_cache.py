@@ -0,0 +1,53 @@
+import numpy as np
+import vector_store
+from embedding_cache import EmbeddingCache
+from vector_store import CustomEmbeddingFunction
+
+
+class FakeSentenceTransformer:
+    def __init__(self, model_name):
+        self.calls = []
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False):
+        self.calls.append((list(texts), show_progress_bar))
+        return np.array([[float(len(text)), 1.0] for text in texts], dtype=np.float32)
+
+
+def test_normalized_lookup_and_counters():
+    cache = EmbeddingCache(max_size=10)
+    cache.put("Housing  Data", [1.0, 2.0])
+
+    assert cache.get("housing data") is not None
+    assert cache.get(" HOUSING DATA ") is not None
+    assert cache.get("traffic data") is None
+    assert cache.stats() == {'size': 1, 'hits': 2, 'misses': 1, 'hit_rate': 2 / 3}
+
+def test_lru_bound():
+    cache = EmbeddingCache(max_size=2)
+    cache.put("hi", [1.0])
+    cache.put("thanks", [2.0])
+    cache.get("hi")
+    cache.put("housing data", [3.0])
+
+    assert len(cache) == 2
+    assert cache.get("thanks") is None
+    assert cache.get("hi") is not None
+
+def test_persistence(tmp_path):
+    path = str(tmp_path / "query_embeddings.pkl")
+    cache = EmbeddingCache(path=path, model_name='model-a')
+    cache.put("hi", [1.0, 2.0])
+    cache.save()
+
+    assert EmbeddingCache(path=path, model_name='model-a').get("hi").tolist() == [1.0, 2.0]
+    assert len(EmbeddingCache(path=path, model_name='model-b')) == 0
+
+def test_repeat_queries_skip_the_model(monkeypatch):
+    monkeypatch.setattr(vector_store, 'SentenceTransformer', FakeSentenceTransformer)
+    embedding_function = CustomEmbeddingFunction(cache=EmbeddingCache(max_size=10))
+
+    first = embedding_function.embed_queries(["hi", "housing data"])
+    second = embedding_function.embed_queries(["Hi", "housing data", "thanks"])
+
+    assert embedding_function.model.calls == [(["hi", "housing data"], False), (["thanks"], False)]
+    assert np.array_equal(first[1], second[1])
@@ -0,0 +1,35 @@
+import pytest
+from intent_router import IntentRouter, CONVERSATIONAL, DATASET_QUERY
+
+DATA_WORDS = {'data', 'datasets', 'statistics', 'census', 'traffic', 'housing', 'education', 'transport',
+              'water', 'covid', 'population'}
+
+
+# Toy embedding: messages mentioning data-ish words point one way, others the other
+def embed_queries(texts):
+    return [[0.1, 1.0] if DATA_WORDS & set(text.lower().split()) else [1.0, 0.1] for text in texts]
+
+
+def test_lexicon_skips_embedding():
+    router = IntentRouter(lambda texts: pytest.fail("message was embedded"))
+
+    assert router.classify("Hi!") == (CONVERSATIONAL, None)
+    assert router.classify("thank you") == (CONVERSATIONAL, None)
+    assert router.classify("What's up") == (CONVERSATIONAL, None)
+    assert router.classify("ppo08") == (DATASET_QUERY, None)
+
+def test_nearest_centroid():
+    router = IntentRouter(embed_queries)
+
+    intent, query_vector = router.classify("traffic statistics for Cork")
+    assert intent == DATASET_QUERY
+    assert query_vector == [0.1, 1.0]
+
+    intent, _ = router.classify("that is very kind of you")
+    assert intent == CONVERSATIONAL
+
+def test_exact_slugs_skip_embedding():
+    router = IntentRouter(lambda texts: pytest.fail("message was embedded"),
+                          names_slug=lambda message: message.lower() == "road traffic counts")
+
+    assert router.classify("Road traffic counts") == (DATASET_QUERY, None)
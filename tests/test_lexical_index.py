@@ -0,0 +1,57 @@
+from lexical_index import LexicalIndex, fuse, is_slug_like
+from quantized_index import StringColumn
+
+DATASET_NAMES = ["ppo08-further-education-activity-excluding-apprenticeships",
+                 "ppo07-further-education-activity-nfq-level-excluding-apprenticeships",
+                 "18-20-years-in-receipt-of-an-aftercare-service-in-vocational-training-including-youthreach-2020",
+                 "18-20-years-in-receipt-of-an-aftercare-service-in-vocational-training-including-youthreach-2019",
+                 "road-traffic-counts",
+                 "housing-data-2020"]
+
+
+def make_index():
+    return LexicalIndex([str(i) for i in range(len(DATASET_NAMES))], DATASET_NAMES)
+
+
+def test_bm25_prefers_rare_tokens():
+    hits = make_index().search("youthreach 2020 numbers", n_results=3)
+
+    assert hits[0]['name'].endswith("youthreach-2020")
+    assert hits[1]['name'] in ("housing-data-2020", DATASET_NAMES[3])
+
+def test_slug_like_queries_take_the_fast_path():
+    index = make_index()
+
+    assert [hit['name'] for hit in index.exact_hits("ppo08")] == [DATASET_NAMES[0]]
+    assert [hit['name'] for hit in index.exact_hits("youthreach-2020")] == [DATASET_NAMES[2]]
+    assert index.exact_hits("road traffic counts")[0]['name'] == "road-traffic-counts"
+    assert index.names_slug("Road traffic counts") and not index.names_slug("road traffic")
+
+def test_natural_language_queries_need_the_vector_search():
+    index = make_index()
+
+    assert index.exact_hits("what about traffic on roads") is None
+    assert index.exact_hits("ppo99") is None
+    assert not is_slug_like("housing data")
+    assert is_slug_like("ppo08")
+
+def test_fuse_combines_rankings():
+    vector_hits = [{'id': '4', 'name': "road-traffic-counts", 'distance': 0.2},
+                   {'id': '5', 'name': "housing-data-2020", 'distance': 0.3}]
+    lexical_hits = [{'id': '5', 'name': "housing-data-2020", 'distance': None, 'score': 3.0},
+                    {'id': '0', 'name': DATASET_NAMES[0], 'distance': None, 'score': 1.0}]
+
+    hits = fuse(vector_hits, lexical_hits, n_results=2)
+
+    assert [hit['id'] for hit in hits] == ['5', '4']
+    assert hits[0]['distance'] == 0.3
+
+def test_memory_mapped_columns_are_read_in_place(tmp_path):
+    StringColumn.save(str(tmp_path / "ids"), [str(i) for i in range(len(DATASET_NAMES))])
+    StringColumn.save(str(tmp_path / "names"), DATASET_NAMES)
+    index = LexicalIndex(StringColumn.load(str(tmp_path / "ids")), StringColumn.load(str(tmp_path / "names")))
+
+    assert isinstance(index.names, StringColumn)
+    assert index.exact_hits("road traffic counts")[0] == make_index().exact_hits("road traffic counts")[0]
+    assert index.search("youthreach 2020 numbers", n_results=3) == make_index().search("youthreach 2020 numbers",
+                                                                                        n_results=3)
@@ -0,0 +1,169 @@
+import asyncio, threading, time
+import pytest
+from mistralai.client import MistralClient
+from mistralai.async_client import MistralAsyncClient
+from benchmarks.mock_mistral import MockConfig, start_server
+from llm_scheduler import LLMScheduler, LLMOverloaded, TokenBucket, read_error_bodies
+from metrics import LLM_ADMISSIONS
+
+MESSAGES = [{'role': 'user', 'content': 'housing data'}]
+
+
+@pytest.fixture
+def mock():
+    config = MockConfig(latency_ms=1, tokens_per_second=10000, output_tokens=5, catalog_size=10)
+    server, url = start_server(config)
+    yield config, url
+    server.shutdown()
+
+def make_scheduler(**options):
+    settings = dict(rpm=6000, tpm=10 ** 7, max_concurrency=2, max_queue=2, queue_timeout=1.0, max_retries=3,
+                    backoff_base=0.001, backoff_max=0.01)
+    settings.update(options)
+    return LLMScheduler(**settings)
+
+def test_throttled_calls_are_retried(mock):
+    config, url = mock
+    client = read_error_bodies(MistralClient(api_key='test', endpoint=url, max_retries=1))
+    scheduler = make_scheduler()
+    config.fail_next = 2
+
+    with scheduler.admit(100) as admission:
+        response = scheduler.call(admission, lambda: client.chat(model='mistral-large-latest', messages=MESSAGES))
+
+    assert response.choices[0].message.content
+    assert config.throttled == 2 and config.requests == 3
+    assert scheduler.active == 0
+
+def test_streams_are_retried_before_the_first_chunk(mock):
+    config, url = mock
+    client = read_error_bodies(MistralClient(api_key='test', endpoint=url, max_retries=1))
+    scheduler = make_scheduler()
+    config.fail_next = 1
+
+    with scheduler.admit(100) as admission:
+        chunks = list(scheduler.stream(admission, lambda: client.chat_stream(model='mistral-large-latest',
+                                                                             messages=MESSAGES)))
+
+    assert len(chunks) == 5 and config.requests == 2
+
+def test_persistent_throttling_becomes_overloaded_with_retry_after(mock):
+    config, url = mock
+    config.rpm = 1
+    client = read_error_bodies(MistralClient(api_key='test', endpoint=url, max_retries=1))
+    scheduler = make_scheduler(max_retries=1)
+    request = lambda: client.chat(model='mistral-large-latest', messages=MESSAGES)
+
+    with scheduler.admit(100) as admission:
+        scheduler.call(admission, request)
+        with pytest.raises(LLMOverloaded) as raised:
+            scheduler.call(admission, request)
+
+    assert raised.value.reason == 'throttled' and raised.value.retry_after > 1
+    assert config.throttled == 2
+
+def test_async_calls_are_retried(mock):
+    config, url = mock
+    scheduler = make_scheduler()
+    config.fail_next = 2
+
+    async def run():
+        client = read_error_bodies(MistralAsyncClient(api_key='test', endpoint=url, max_retries=1))
+        admission = await scheduler.aadmit(100)
+        with admission:
+            response = await scheduler.acall(admission, lambda: client.chat(model='mistral-large-latest',
+                                                                            messages=MESSAGES))
+            config.fail_next = 1
+            chunks = [chunk async for chunk in scheduler.astream(
+                admission, lambda: client.chat_stream(model='mistral-large-latest', messages=MESSAGES))]
+        await client.close()
+        return response, chunks
+
+    response, chunks = asyncio.run(run())
+
+    assert response.choices[0].message.content and len(chunks) == 5
+    assert config.throttled == 3 and scheduler.active == 0
+
+def test_a_full_queue_fails_fast():
+    scheduler = make_scheduler(max_concurrency=1, max_queue=1, queue_timeout=5.0)
+    held = scheduler.admit(10)
+    waiter = threading.Thread(target=lambda: scheduler.admit(10).release())
+    waiter.start()
+    while scheduler.waiting < 1:
+        time.sleep(0.001)
+    rejected = LLM_ADMISSIONS.value(result='queue_full')
+
+    start = time.monotonic()
+    with pytest.raises(LLMOverloaded) as raised:
+        scheduler.admit(10)
+
+    assert time.monotonic() - start < 0.5
+    assert raised.value.reason == 'queue_full' and raised.value.retry_after >= 1
+    assert LLM_ADMISSIONS.value(result='queue_full') == rejected + 1
+    held.release()
+    waiter.join(5)
+    assert scheduler.active == 0 and scheduler.waiting == 0
+
+def test_waiting_for_a_slot_has_a_deadline():
+    scheduler = make_scheduler(max_concurrency=1, queue_timeout=0.05)
+    held = scheduler.admit(10)
+
+    with pytest.raises(LLMOverloaded, match='timeout'):
+        scheduler.admit(10)
+    with pytest.raises(LLMOverloaded, match='timeout'):
+        asyncio.run(scheduler.aadmit(10))
+    held.release()
+    held.release()  # Releasing twice gives back one slot
+    assert scheduler.active == 0
+
+def test_calls_stay_within_the_request_quota():
+    scheduler = make_scheduler(rpm=60, queue_timeout=0.5)
+    admission = scheduler.admit(10)
+    # A full bucket allows a minute's worth at once, then one request a second
+    scheduler.requests.level = 0.0
+
+    with pytest.raises(LLMOverloaded) as raised:
+        scheduler.call(admission, lambda: "called")
+
+    assert raised.value.reason == 'rate_limited' and raised.value.retry_after == 1
+
+def test_processes_split_the_quota():
+    scheduler = make_scheduler(rpm=300, tpm=90000, processes=3)
+
+    assert scheduler.requests.capacity == 100 and scheduler.tokens.capacity == 30000
+    assert scheduler.requests.rate == pytest.approx(100 / 60)
+
+def test_token_bucket_refills_and_carries_debt():
+    bucket = TokenBucket(600)
+    now = bucket.updated
+
+    assert bucket.wait_time(600, now) == 0
+    bucket.take(700, now)
+    assert bucket.wait_time(1, now) == pytest.approx(10.1)
+    assert bucket.wait_time(1, now + 10.1) == pytest.approx(0.0)
+
+def test_waiting_requests_are_admitted_in_arrival_order():
+    scheduler = make_scheduler(max_concurrency=1, max_queue=10)
+    held = scheduler.admit(10)
+    admitted = []
+
+    async def wait(i):
+        with await scheduler.aadmit(10):
+            admitted.append(i)
+            await asyncio.sleep(0.001)
+
+    async def main():
+        waiters = []
+        for i in range(5):
+            waiters.append(asyncio.create_task(wait(i)))
+            await asyncio.sleep(0)
+        cancelled = waiters.pop(2)
+        cancelled.cancel()  # Leaves the queue without taking a slot
+        await asyncio.sleep(0)
+        held.release()
+        await asyncio.gather(*waiters)
+
+    asyncio.run(main())
+
+    assert admitted == [0, 1, 3, 4]
+    assert scheduler.active == 0 and scheduler.waiting == 0
@@ -0,0 +1,56 @@
+import threading
+from metrics import Counter, Histogram, RequestTimer, REGISTRY, render, record, stage, start_request, current_request
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram('test_latency_seconds', "Test latency.", ['stage'], buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 2.0):
+        histogram.observe(value, stage='embed')
+
+    lines = histogram.render()
+
+    assert '# TYPE test_latency_seconds histogram' in lines
+    assert 'test_latency_seconds_bucket{stage="embed",le="0.1"} 1' in lines
+    assert 'test_latency_seconds_bucket{stage="embed",le="1.0"} 2' in lines
+    assert 'test_latency_seconds_bucket{stage="embed",le="+Inf"} 3' in lines
+    assert 'test_latency_seconds_count{stage="embed"} 3' in lines
+    assert histogram.render()[-2] == 'test_latency_seconds_sum{stage="embed"} 2.55'
+    REGISTRY.remove(histogram)
+
+def test_counter_checks_labels_and_escapes_values():
+    counter = Counter('test_calls_total', "Test calls.", ['model'])
+    counter.inc(model='a"b')
+    counter.inc(2, model='a"b')
+
+    assert counter.value(model='a"b') == 3
+    assert 'test_calls_total{model="a\\"b"} 3.0' in render()
+    REGISTRY.remove(counter)
+
+    try:
+        counter.inc(kind='x')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("unknown label accepted")
+
+def test_stages_add_up_per_request():
+    timer = start_request()
+    with stage('search'):
+        pass
+    record('search', 0.002)
+    record('embed', 0.010)
+
+    assert current_request() is timer
+    assert set(timer.stages) == {'search', 'embed'} and timer.stages['search'] >= 0.002
+    header = timer.server_timing()
+    assert header.startswith('search;dur=') and 'embed;dur=10.0' in header and 'total;dur=' in header
+
+def test_requests_in_other_threads_have_their_own_timer():
+    start_request()
+    seen = []
+    thread = threading.Thread(target=lambda: seen.append(current_request()))
+    thread.start()
+    thread.join()
+
+    assert seen == [None]
+    assert isinstance(current_request(), RequestTimer)
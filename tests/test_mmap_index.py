@@ -0,0 +1,70 @@
+import pickle
+import numpy as np
+import pytest
+from chromadb.utils.embedding_functions import EmbeddingFunction
+import vector_store
+from mmap_index import MmapIndex
+from vector_store import VectorStore
+
+
+class RandomEmbeddingFunction(EmbeddingFunction):
+    # Stand-in embedding function; the tests search with precomputed vectors
+    model_name = 'random-test'
+
+    def __call__(self, texts):
+        if not isinstance(texts, list):
+            texts = [texts]
+        rng = np.random.default_rng(abs(hash(tuple(texts))) % 2**32)
+        return rng.normal(size=(len(texts), 32)).tolist()
+
+
+@pytest.fixture
+def catalog(cache_dir):
+    rng = np.random.default_rng(0)
+    dataset_names = [f"dataset-{i}" for i in range(300)]
+    ids = [str(i) for i in range(len(dataset_names))]
+    vectors = rng.normal(size=(len(dataset_names), 32)).tolist()
+    with open(vector_store.EMBEDDINGS_FILE, 'wb') as f:
+        pickle.dump((ids, dataset_names, vectors, [{'name': name} for name in dataset_names]), f)
+    return cache_dir, vectors
+
+def test_matches_brute_force(tmp_path):
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(100, 16))
+    index = MmapIndex.build(str(tmp_path / "index"), [str(i) for i in range(100)],
+                            [f"d{i}" for i in range(100)], vectors)
+    queries = rng.normal(size=(3, 16))
+
+    hits = index.search(queries, n_results=5)
+
+    normed = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    for query, query_hits in zip(queries, hits):
+        expected = np.argsort(-(normed @ (query / np.linalg.norm(query))))[:5]
+        assert [hit['id'] for hit in query_hits] == [str(i) for i in expected]
+        assert query_hits[0]['distance'] <= query_hits[-1]['distance']
+
+def test_numpy_backend_matches_chroma(catalog):
+    tmp_path, vectors = catalog
+    chroma_store = VectorStore(embedding_function=RandomEmbeddingFunction(), persistent=False,
+                               backend='chroma')
+    numpy_store = VectorStore(embedding_function=RandomEmbeddingFunction(),
+                              index_dir=str(tmp_path / "index"), backend='numpy')
+
+    queries = np.random.default_rng(2).normal(size=(20, 32)).tolist()
+    chroma_hits = chroma_store.search(queries, n_results=5)
+    numpy_hits = numpy_store.search(queries, n_results=5)
+
+    for expected, actual in zip(chroma_hits, numpy_hits):
+        assert [hit['id'] for hit in actual] == [hit['id'] for hit in expected]
+        assert [hit['distance'] for hit in actual] == pytest.approx([hit['distance'] for hit in expected], abs=1e-4)
+
+def test_numpy_backend_reopens_mmap(catalog, monkeypatch):
+    tmp_path, vectors = catalog
+    VectorStore(embedding_function=RandomEmbeddingFunction(), index_dir=str(tmp_path / "index"), backend='numpy')
+
+    monkeypatch.setattr(MmapIndex, 'build', classmethod(lambda *args: pytest.fail("index was rebuilt")))
+    store = VectorStore(embedding_function=RandomEmbeddingFunction(), index_dir=str(tmp_path / "index"),
+                        backend='numpy')
+
+    assert isinstance(store.mmap_index.vectors, np.memmap)
+    assert len(store.mmap_index) == 300
@@ -0,0 +1,44 @@
+import pytest
+import requests
+from mistralai.client import MistralClient
+from benchmarks.common import load_workload, percentile, sample_workload
+from benchmarks.mock_mistral import MockConfig, start_server
+
+
+@pytest.fixture(scope='module')
+def mock():
+    config = MockConfig(latency_ms=1, tokens_per_second=10000, output_tokens=5, catalog_size=50)
+    server, url = start_server(config)
+    yield config, url
+    server.shutdown()
+
+def test_mock_speaks_the_mistral_protocol(mock):
+    config, url = mock
+    client = MistralClient(api_key='test', endpoint=url)
+    messages = [{'role': 'user', 'content': 'housing data'}]
+
+    response = client.chat(model='mistral-large-latest', messages=messages)
+    tokens = [chunk.choices[0].delta.content or ""
+              for chunk in client.chat_stream(model='mistral-large-latest', messages=messages)]
+
+    assert response.choices[0].message.content == "".join(tokens)
+    assert config.requests == 2
+
+def test_mock_serves_a_synthetic_catalog(mock):
+    _, url = mock
+    names = requests.get(f"{url}/api/3/action/package_list").json()['result']
+
+    assert len(set(names)) == 50
+
+def test_workload_sampling_is_replayable():
+    workload = load_workload()
+
+    assert sample_workload(workload, 20, seed=3) == sample_workload(workload, 20, seed=3)
+    assert {item['kind'] for item in sample_workload(workload, 50, seed=1, small_talk_ratio=0.0)} != {'small_talk'}
+    assert percentile([1, 2, 3, 4], 50) == 2.5
+
+def test_unique_workload_messages_never_repeat():
+    items = sample_workload(load_workload(), 200, seed=2, unique=True)
+    dataset = [item['message'] for item in items if item['kind'] != 'small_talk']
+
+    assert len(set(dataset)) == len(dataset)
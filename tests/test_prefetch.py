@@ -0,0 +1,75 @@
+import threading, time
+from prefetch import Prefetcher, similar
+from metrics import CACHE_LOOKUPS
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+def test_typing_is_debounced_to_the_latest_text():
+    computed = []
+    prefetcher = Prefetcher(lambda text: computed.append(text) or f"hits for {text}", debounce=0.05)
+
+    for text in ("hous", "housing", "housing data"):
+        prefetcher.schedule('s1', text)
+
+    assert wait_until(lambda: computed)
+    time.sleep(0.1)
+    assert computed == ["housing data"]
+    assert prefetcher.take('s1', "Housing  data") == "hits for housing data"
+    # The result is handed over once
+    assert prefetcher.take('s1', "housing data") is None
+
+def test_only_matching_messages_reuse_the_prefetch():
+    prefetcher = Prefetcher(lambda text: text, debounce=0.0)
+    prefetcher.schedule('s1', "Housing data in Dublin")
+    prefetcher.schedule('s2', "housing data in dubl")
+    prefetcher.schedule('s3', "housing data")
+    assert wait_until(lambda: all(entry.result for entry in prefetcher._entries.values()))
+    hits = CACHE_LOOKUPS.value(cache='prefetch', result='hit')
+
+    assert prefetcher.take('s1', "housing  data in dublin") == "Housing data in Dublin"
+    assert prefetcher.take('s2', "housing data in dublin") is None
+    assert prefetcher.take('s3', "traffic counts in cork") is None
+    assert prefetcher.take('s4', "housing data") is None
+    assert CACHE_LOOKUPS.value(cache='prefetch', result='hit') == hits + 1
+
+def test_close_texts_must_have_the_same_words():
+    assert similar("crime rates, 2019", "crime rates 2019", ratio=0.9)
+    assert not similar("crime rates 2019", "crime rates 2018", ratio=0.9)
+    assert not similar("housing in cork", "housing in york", ratio=0.9)
+    assert not similar("education galw", "education galway", ratio=0.9)
+    assert not similar("crime rates, 2019", "crime rates 2019")
+
+def test_submitting_cancels_a_pending_prefetch():
+    computed = []
+    prefetcher = Prefetcher(computed.append, debounce=0.05)
+    prefetcher.schedule('s1', "housing data")
+
+    assert prefetcher.take('s1', "housing data") is None
+    time.sleep(0.15)
+    assert computed == [] and len(prefetcher) == 0
+
+def test_short_texts_failures_and_expiry():
+    release = threading.Event()
+
+    def compute(text):
+        release.wait(5)
+        if text == "broken query":
+            raise RuntimeError("index unavailable")
+        return text
+
+    prefetcher = Prefetcher(compute, debounce=0.0, ttl=0.2, max_sessions=2)
+    assert not prefetcher.schedule('s1', "ho")
+    prefetcher.schedule('s1', "broken query")
+    prefetcher.schedule('s2', "housing data")
+    prefetcher.schedule('s3', "traffic data")  # Evicts s1, the least recently scheduled
+    release.set()
+    assert wait_until(lambda: prefetcher._entries['s3'].result)
+
+    assert len(prefetcher) == 2 and prefetcher.take('s1', "broken query") is None
+    time.sleep(0.25)
+    assert prefetcher.take('s3', "traffic data") is None
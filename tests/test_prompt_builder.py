@@ -0,0 +1,48 @@
+from langchain_core.messages import HumanMessage, AIMessage
+from prompt_builder import PromptBuilder
+from prompts.roles import system, user
+
+HITS = [{'id': str(i), 'name': f"dataset-number-{i}-about-housing-in-ireland"} for i in range(10)]
+HISTORY = [HumanMessage(content=f"question {i} " + "words " * 20) if i % 2 == 0
+           else AIMessage(content=f"answer {i} " + "words " * 20) for i in range(6)]
+
+
+def test_every_piece_appears_once():
+    messages, usage = PromptBuilder(budget=10000).build(system, user, "housing in Cork",
+                                                        hits=HITS, history=HISTORY, summary="Human: hello")
+    prompt = messages[1]['content']
+
+    assert prompt.count("housing in Cork") == 1
+    assert prompt.count("question 0") == 1
+    assert prompt.count(HITS[0]['name']) == 1
+    assert usage['hits_used'] == 10 and usage['turns_used'] == 6 and usage['summary'] > 0
+    assert usage['total'] == sum(usage[section] for section in
+                                 ('system', 'template', 'message', 'search_results', 'history', 'summary'))
+
+def test_budget_is_filled_by_priority():
+    builder = PromptBuilder(budget=10000)
+    _, full = builder.build(system, user, "housing in Cork", hits=HITS, history=HISTORY)
+    fixed = full['system'] + full['template'] + full['message']
+
+    # Room for all hits but only part of the history: the newest turns are kept
+    budget = fixed + full['search_results'] + full['history'] // 2
+    messages, usage = PromptBuilder(budget=budget).build(system, user, "housing in Cork",
+                                                         hits=HITS, history=HISTORY, summary="Human: hello")
+    prompt = messages[1]['content']
+
+    assert usage['hits_used'] == 10
+    assert 0 < usage['turns_used'] < 6
+    assert "answer 5" in prompt and "question 0" not in prompt
+    assert usage['total'] <= budget
+
+    # Too small for every hit: top hits are kept in rank order
+    messages, usage = PromptBuilder(budget=fixed + 30).build(system, user, "housing in Cork",
+                                                             hits=HITS, history=HISTORY)
+    assert 0 < usage['hits_used'] < 10
+    assert usage['turns_used'] == 0
+    assert HITS[0]['name'] in messages[1]['content']
+
+def test_numbered_hits():
+    messages, _ = PromptBuilder(budget=10000).build(system, user, "housing in Cork", hits=HITS[:2], numbered=True)
+
+    assert f"1. {HITS[0]['name']}\n2. {HITS[1]['name']}" in messages[1]['content']
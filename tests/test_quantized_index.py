@@ -0,0 +1,64 @@
+import os
+import numpy as np
+import pytest
+from mmap_index import MmapIndex
+from quantized_index import QuantizedIndex, StringColumn, quantize
+import vector_store
+from vector_store import VectorStore
+from test_mmap_index import RandomEmbeddingFunction, catalog
+
+
+def clustered_vectors(rng, n, dim, clusters=20):
+    centers = rng.normal(size=(clusters, dim))
+    return centers[rng.integers(clusters, size=n)] + 0.5 * rng.normal(size=(n, dim))
+
+
+@pytest.mark.parametrize('quantization, bytes_per_value', [('int8', 1), ('float16', 2)])
+def test_recall_against_full_precision(tmp_path, quantization, bytes_per_value):
+    rng = np.random.default_rng(0)
+    vectors = clustered_vectors(rng, 2000, 64)
+    ids = [str(i) for i in range(2000)]
+    index = QuantizedIndex.build(str(tmp_path / "index"), ids, [f"d{i}" for i in ids], vectors,
+                                 quantization=quantization)
+    exact_index = MmapIndex.build(str(tmp_path / "exact"), ids, [f"d{i}" for i in ids], vectors)
+    queries = clustered_vectors(rng, 50, 64)
+
+    assert index.codes.nbytes == 2000 * 64 * bytes_per_value
+    assert index.recall(queries, n_results=10) >= 0.95
+
+    # Returned distances are the exact ones, not the quantized approximations
+    for hits, exact_hits in zip(index.search(queries, n_results=10), exact_index.search(queries, n_results=10)):
+        exact = {hit['id']: hit['distance'] for hit in exact_hits}
+        for hit in hits:
+            if hit['id'] in exact:
+                assert hit['distance'] == pytest.approx(exact[hit['id']], abs=1e-5)
+
+def test_int8_codes_reconstruct_the_vectors():
+    matrix = np.random.default_rng(1).normal(size=(10, 8)).astype(np.float32)
+    codes, scales = quantize(matrix, 'int8')
+
+    assert codes.dtype == np.int8
+    assert np.abs(codes * scales[:, None] - matrix).max() <= scales.max() / 2 + 1e-6
+
+def test_string_column_round_trip(tmp_path):
+    strings = ["housing-data-2020", "", "áras-an-uachtaráin", "x" * 300]
+    StringColumn.save(str(tmp_path / "names"), strings)
+    column = StringColumn.load(str(tmp_path / "names"))
+
+    assert len(column) == 4 and list(column) == strings and column[2] == "áras-an-uachtaráin"
+
+def test_quantized_backend_is_reopened_and_keeps_its_files(catalog):
+    tmp_path, vectors = catalog
+    index_dir = tmp_path / "index"
+    first = VectorStore(embedding_function=RandomEmbeddingFunction(), index_dir=str(index_dir), backend='quantized')
+    files = sorted(os.listdir(index_dir))
+
+    reopened = VectorStore(embedding_function=RandomEmbeddingFunction(), index_dir=str(index_dir),
+                           backend='quantized')
+    reopened.drop_stale_indexes()
+
+    assert sorted(os.listdir(index_dir)) == files
+    assert isinstance(reopened.mmap_index, QuantizedIndex) and len(reopened.mmap_index) == 300
+    query = np.asarray(vectors[42])
+    assert reopened.search([query], n_results=1)[0][0]['name'] == "dataset-42"
+    assert first.search([query], n_results=3) == reopened.search([query], n_results=3)
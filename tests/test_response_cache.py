@@ -0,0 +1,55 @@
+import pytest
+from flask import Flask
+from flask_caching import Cache
+from response_cache import ResponseCache
+
+
+@pytest.fixture
+def flask_cache():
+    return Cache(Flask(__name__), config={'CACHE_TYPE': 'SimpleCache', 'CACHE_THRESHOLD': 100})
+
+
+HITS = [{'id': '1', 'name': 'housing-data-2020', 'distance': 0.1},
+        {'id': '2', 'name': 'housing-data-2021', 'distance': 0.2}]
+
+
+def test_exact_match_on_normalized_message_and_ids(flask_cache):
+    response_cache = ResponseCache(flask_cache)
+    response_cache.put("Housing data", [1.0, 0.0], HITS, "answer")
+
+    assert response_cache.get("  housing DATA", [1.0, 0.0], list(reversed(HITS))) == "answer"
+    assert response_cache.get("housing data", [1.0, 0.0], HITS[:1]) is None
+    assert response_cache.stats() == {'exact_hits': 1, 'semantic_hits': 0, 'misses': 1, 'hit_rate': 0.5}
+
+def test_semantic_match_requires_similarity_and_same_ids(flask_cache):
+    response_cache = ResponseCache(flask_cache, semantic=True, threshold=0.9)
+    response_cache.put("housing data", [1.0, 0.0], HITS, "answer")
+
+    assert response_cache.get("housing datasets", [0.99, 0.05], HITS) == "answer"
+    assert response_cache.get("housing datasets", [0.99, 0.05], HITS[:1]) is None
+    assert response_cache.get("road traffic", [0.0, 1.0], HITS) is None
+    assert response_cache.semantic_hits == 1
+
+def test_semantic_mode_is_off_by_default(flask_cache):
+    response_cache = ResponseCache(flask_cache)
+    response_cache.put("housing data", [1.0, 0.0], HITS, "answer")
+
+    assert response_cache.get("housing datasets", [1.0, 0.0], HITS) is None
+
+def test_entries_expire(flask_cache, monkeypatch):
+    import response_cache as module
+    now = [100.0]
+    monkeypatch.setattr(module.time, 'monotonic', lambda: now[0])
+
+    response_cache = ResponseCache(flask_cache, ttl=10, semantic=True)
+    response_cache.put("housing data", [1.0, 0.0], HITS, "answer")
+    now[0] += 11
+
+    assert response_cache.get("housing datasets", [1.0, 0.0], HITS) is None
+
+def test_a_disabled_cache_stores_nothing(flask_cache):
+    response_cache = ResponseCache(flask_cache, semantic=True, enabled=False)
+    response_cache.put("housing data", [1.0, 0.0], HITS, "answer")
+
+    assert response_cache.get("housing data", [1.0, 0.0], HITS) is None
+    assert response_cache.stats()['misses'] == 0
@@ -0,0 +1,39 @@
+import pytest
+from retrieval_depth import RetrievalDepth
+
+DISTANCES = [0.20, 0.24, 0.27, 0.55, 0.58, 0.60, 0.62, 0.63, 0.70, 0.71, 0.75]
+
+
+def hits(distances):
+    return [{'id': str(i), 'name': f"dataset-{i}", 'distance': d} for i, d in enumerate(distances)]
+
+
+@pytest.mark.parametrize('cutoff, options, k', [
+    ('none', {}, 10),
+    ('distance', {'max_distance': 0.6}, 6),
+    ('gap', {'max_gap': 0.1}, 3),
+    ('elbow', {}, 3),
+    ('elbow', {'elbow_min_jump': 0.5}, 10),  # No jump is big enough: keep max_k
+])
+def test_cutoffs(cutoff, options, k):
+    depth = RetrievalDepth(cutoff=cutoff, min_k=1, max_k=10, **options)
+
+    assert [hit['name'] for hit in depth.truncate(hits(DISTANCES))] == [f"dataset-{i}" for i in range(k)]
+
+def test_min_k_is_always_kept():
+    depth = RetrievalDepth(cutoff='distance', min_k=2, max_k=10, max_distance=0.1)
+
+    assert len(depth.truncate(hits(DISTANCES))) == 2
+    assert depth.truncate([]) == []
+
+def test_lexical_hits_without_distance_are_not_cut():
+    depth = RetrievalDepth(cutoff='gap', min_k=1, max_k=10, max_gap=0.1)
+
+    assert len(depth.truncate(hits([None, None, None]))) == 3
+    assert len(depth.truncate(hits([None, 0.2, None, 0.25, 0.9]))) == 4
+
+def test_bad_settings_are_rejected():
+    with pytest.raises(ValueError):
+        RetrievalDepth(cutoff='median')
+    with pytest.raises(ValueError):
+        RetrievalDepth(min_k=5, max_k=3)
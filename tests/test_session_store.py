@@ -0,0 +1,133 @@
+import os, time
+import pytest
+from session_store import SessionStore, SessionMemory, SqliteSessionStore
+from tokens import estimate_tokens
+
+
+def test_sessions_are_isolated():
+    store = SessionStore()
+    store.get("a").add_user_message("hello from a")
+    store.get("b").add_user_message("hello from b")
+
+    assert "hello from a" in store.get("a").load_memory_variables({})['history']
+    assert "hello from a" not in store.get("b").load_memory_variables({})['history']
+
+    store.clear("a")
+    assert "a" not in store
+    assert "b" in store
+
+def test_lru_eviction():
+    store = SessionStore(max_sessions=2)
+    store.get("a")
+    store.get("b")
+    store.get("a")  # "b" is now the least recently used
+    store.get("c")
+
+    assert len(store) == 2
+    assert "a" in store and "c" in store
+    assert "b" not in store
+
+def test_idle_ttl_eviction(monkeypatch):
+    import session_store
+    now = [1000.0]
+    monkeypatch.setattr(session_store.time, 'monotonic', lambda: now[0])
+
+    store = SessionStore(ttl=60)
+    store.get("a")
+    now[0] += 61
+    store.get("b")
+
+    assert "a" not in store
+    assert "b" in store
+
+def test_history_is_trimmed_into_summary():
+    memory = SessionMemory(token_budget=50, summary_budget=1000)
+    for i in range(10):
+        memory.add_user_message(f"question number {i} about housing datasets in Dublin")
+        memory.add_ai_message(f"answer number {i}\n<a href=\"https://data.gov.ie/dataset/x\">**X**</a>")
+
+    assert memory.history_tokens() <= 50
+    assert "question number 0" in memory.summary
+    history = memory.load_memory_variables({})['history']
+    assert history.startswith("Summary of earlier conversation:")
+    assert "answer number 9" in history
+
+def test_latest_message_is_always_kept():
+    memory = SessionMemory(token_budget=1, summary_budget=1)
+    memory.add_user_message("a rather long message that is over the budget on its own")
+
+    assert len(memory.chat_memory.messages) == 1
+    assert estimate_tokens(memory.summary) <= 1
+
+def test_sqlite_history_is_shared_and_durable(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    store = SqliteSessionStore(path)
+    memory = store.get("a")
+    memory.add_user_message("hello from a")
+    memory.add_ai_message("hi there")
+    store.get("b").add_user_message("hello from b")
+    store.close()
+
+    # A second store (another worker, or after a restart) sees the same history
+    other = SqliteSessionStore(path)
+    history = other.get("a").load_memory_variables({})['history']
+    assert "Human: hello from a\nAI: hi there" == history
+    assert "hello from a" not in other.get("b").load_memory_variables({})['history']
+    assert len(other) == 2
+
+    other.get("a").clear()
+    assert "a" not in other and "b" in other
+    assert not other.get("a").chat_memory.messages
+
+def test_sqlite_reads_only_the_last_turns(tmp_path):
+    store = SqliteSessionStore(str(tmp_path / "sessions.db"), history_turns=2)
+    for i in range(10):
+        store.get("a").add_turn(f"question {i}", f"answer {i}")
+
+    messages = store.get("a").chat_memory.messages
+    assert [m.content for m in messages] == ["question 8", "answer 8", "question 9", "answer 9"]
+
+def test_sqlite_history_never_starts_with_an_orphan_answer(tmp_path):
+    store = SqliteSessionStore(str(tmp_path / "sessions.db"), history_turns=1)
+    # A question without an answer, as earlier versions stored failed turns
+    store.get("a").add_turn("question 0", "answer 0")
+    store.get("a").add_user_message("question 1")
+
+    messages = store.get("a").chat_memory.messages
+    assert [m.content for m in messages] == ["question 1"]
+
+def test_sqlite_prunes_expired_sessions(tmp_path, monkeypatch):
+    import session_store
+    now = [1000.0]
+    monkeypatch.setattr(session_store.time, 'time', lambda: now[0])
+    store = SqliteSessionStore(str(tmp_path / "sessions.db"), ttl=60, prune_interval=0.01)
+    store.get("a").add_user_message("old")
+    store.wait()
+    now[0] += 30
+    store.get("b").add_user_message("recent")
+    store.wait()
+    now[0] += 45
+
+    deadline = time.monotonic() + 5
+    while "a" in store and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert "a" not in store and "b" in store
+    assert store._reader().execute("SELECT COUNT(*) FROM turns").fetchone()[0] == 1
+    assert store._reader().execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason="needs fork()")
+def test_sqlite_store_is_shared_by_forked_workers(tmp_path):
+    store = SqliteSessionStore(str(tmp_path / "sessions.db"))
+    pids = []
+    for worker in range(3):
+        pid = os.fork()
+        if pid == 0:
+            # Child: each worker writes its own session
+            for i in range(5):
+                store.get(f"worker-{worker}").add_user_message(f"message {i}")
+            os._exit(0 if store.wait() else 1)
+        pids.append(pid)
+
+    assert all(os.WEXITSTATUS(os.waitpid(pid, 0)[1]) == 0 for pid in pids)
+    assert len(store) == 3
+    assert len(store.get("worker-2").chat_memory.messages) == 5
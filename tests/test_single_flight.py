@@ -0,0 +1,128 @@
+import asyncio, threading, time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from single_flight import SingleFlight, FlightError
+from metrics import COALESCED_REQUESTS
+
+
+def test_concurrent_callers_share_one_computation():
+    flights = SingleFlight('test-do')
+    calls = []
+    release = threading.Event()
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return "answer"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flights.do("key", compute))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    while COALESCED_REQUESTS.value(flight='test-do') < 4:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["answer"] * 5 and len(calls) == 1
+    assert len(flights) == 0
+    # Nothing is kept once the flight has landed
+    assert flights.do("key", lambda: "fresh") == "fresh"
+
+def test_followers_replay_the_stream_from_the_start():
+    flights = SingleFlight('test-stream')
+    flight, leader = flights.join("key")
+    flight.publish("Here ")
+    follower, follower_leads = flights.join("key")
+    received = []
+    thread = threading.Thread(target=lambda: received.extend(follower.follow()))
+    thread.start()
+    flight.publish("you go")
+    flight.finish("Here you go")
+    thread.join(5)
+
+    assert leader and not follower_leads and follower is flight
+    assert received == ["Here ", "you go"] and flight.wait() == "Here you go"
+
+def test_a_failed_leader_fails_its_followers():
+    flights = SingleFlight('test-error')
+    flight, _ = flights.join("key")
+    flight.publish("partial")
+    flight.finish(error=RuntimeError("upstream failed"))
+
+    with pytest.raises(FlightError, match="upstream failed"):
+        list(flight.follow())
+    with pytest.raises(FlightError):
+        asyncio.run(flight.await_result())
+    assert flights.join("key")[1]  # The next request leads a new flight
+
+def test_abandoned_flights_are_replaced():
+    flights = SingleFlight('test-timeout', timeout=0.05)
+    first, _ = flights.join("key")
+    time.sleep(0.1)
+    second, leader = flights.join("key")
+
+    assert leader and second is not first
+    with pytest.raises(FlightError, match="Timed out"):
+        first.wait(timeout=0.01)
+
+def test_async_followers():
+    flights = SingleFlight('test-async')
+    flight, _ = flights.join("key")
+
+    async def main():
+        async def lead():
+            for token in ["a", "b", "c"]:
+                await asyncio.sleep(0.01)
+                flight.publish(token)
+            flight.finish("abc")
+        follower, _ = flights.join("key")
+        leader_task = asyncio.create_task(lead())
+        received = [chunk async for chunk in follower.afollow()]
+        await leader_task
+        return received, await follower.await_result()
+
+    assert asyncio.run(main()) == (["a", "b", "c"], "abc")
+
+def test_followers_are_counted_until_they_stop_waiting():
+    flights = SingleFlight('test-followers')
+    flight, _ = flights.join("key")
+    follower, _ = flights.join("key")
+    chunks = follower.follow()
+    flight.publish("a")
+    next(chunks)
+    assert flight.followers == 1
+
+    chunks.close()
+    flight.finish("a")
+    flight.finish(error=RuntimeError("too late"))  # Only the first finish counts
+
+    assert flight.followers == 0 and flight.wait() == "a"
+
+def test_async_followers_wait_without_threads():
+    flights = SingleFlight('test-async-threads')
+    flight, _ = flights.join("key")
+
+    class NoExecutor(ThreadPoolExecutor):
+        def submit(self, *args, **kwargs):
+            raise AssertionError("an executor thread was used")
+
+    async def main():
+        asyncio.get_running_loop().set_default_executor(NoExecutor())
+        followers = [flights.join("key")[0] for _ in range(100)]
+
+        # The leader publishes from another thread
+        threading.Timer(0.02, lambda: (flight.publish("a"), flight.finish("a"))).start()
+        with pytest.raises(FlightError, match="Timed out"):
+            await flight.await_change(lambda: False, timeout=0.01)
+        return await asyncio.gather(*(follower.await_result() for follower in followers[:50]),
+                                    *(collect(follower) for follower in followers[50:]))
+
+    async def collect(follower):
+        return [chunk async for chunk in follower.afollow()]
+
+    results = asyncio.run(main())
+
+    assert results == ["a"] * 50 + [["a"]] * 50
+    assert flight.followers == 0
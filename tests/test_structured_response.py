@@ -0,0 +1,43 @@
+import json
+from structured_response import StructuredAnswer, parse_selection, render, slug_title
+
+HITS = [{'id': str(i), 'name': f"housing-dublin-{i}", 'distance': 0.1 * i} for i in range(5)]
+
+
+def test_selection_is_rendered_as_links():
+    answer = StructuredAnswer(HITS, title=lambda name: f"Title of {name}")
+    response = answer.complete('{"intro": "Here are some datasets:", "datasets": [2, 1]}')
+
+    assert response == ("Here are some datasets:<br>\n"
+                        '<a href="https://data.gov.ie/dataset/housing-dublin-1" target="_blank">'
+                        "**Title of housing-dublin-1**</a><br>\n"
+                        '<a href="https://data.gov.ie/dataset/housing-dublin-0" target="_blank">'
+                        "**Title of housing-dublin-0**</a>")
+
+def test_only_candidates_are_linked():
+    # Out-of-range numbers, unknown slugs and duplicates are dropped
+    text = '```json\n{"intro": "Found:", "datasets": [9, "3", "made-up-slug", "housing-dublin-4", 3, true]}\n```'
+    intro, selected = parse_selection(text, HITS)
+
+    assert intro == "Found:"
+    assert [hit['name'] for hit in selected] == ["housing-dublin-2", "housing-dublin-4"]
+    assert parse_selection("Sorry, no datasets.", HITS) is None
+    assert render("Nothing relevant.", []) == "Nothing relevant."
+
+def test_streamed_intro_then_links():
+    content = json.dumps({'intro': 'Datasets on "housing" – cafés:', 'datasets': [1]}, ensure_ascii=True)
+    answer = StructuredAnswer(HITS)
+    streamed = "".join(answer.feed(content[i:i + 3]) for i in range(0, len(content), 3))
+    response, rest = answer.finish()
+
+    assert streamed == 'Datasets on "housing" – cafés:'
+    assert streamed + rest == response
+    assert rest.endswith("**Housing Dublin 0**</a>")
+
+def test_plain_text_replies_pass_through():
+    answer = StructuredAnswer(HITS)
+    streamed = answer.feed("Hello! ") + answer.feed("How can I help?")
+
+    assert streamed == "Hello! How can I help?"
+    assert answer.finish() == ("Hello! How can I help?", "")
+    assert slug_title("water-quality-cork-2020") == "Water Quality Cork 2020"
@@ -0,0 +1,83 @@
+import pickle
+import pytest
+import vector_store
+from conftest import CountingEmbeddingFunction
+from vector_store import VectorStore, collection_name, catalog_hash
+
+
+DATASET_NAMES = ["housing-data-2020", "vocational-training-2021", "road-traffic-counts"]
+
+
+def metadatas(dataset_names):
+    return [{'name': name} for name in dataset_names]
+
+def write_embeddings(path, dataset_names):
+    embedding_function = CountingEmbeddingFunction()
+    ids = [str(i) for i in range(len(dataset_names))]
+    with open(path, 'wb') as f:
+        pickle.dump((ids, dataset_names, embedding_function(dataset_names), metadatas(dataset_names)), f)
+
+
+@pytest.fixture
+def cache_dir(cache_dir):
+    write_embeddings(vector_store.EMBEDDINGS_FILE, DATASET_NAMES)
+    return cache_dir
+
+def test_in_memory_index(cache_dir):
+    store = VectorStore(embedding_function=CountingEmbeddingFunction(), persistent=False)
+
+    assert store.collection.count() == len(DATASET_NAMES)
+    assert [hit['name'] for hit in store.query_embeddings("road-traffic-counts", n_results=1)] == ["road-traffic-counts"]
+
+def test_persistent_index_is_reopened(cache_dir, monkeypatch):
+    index_dir = str(cache_dir / "chroma")
+    store = VectorStore(embedding_function=CountingEmbeddingFunction(), persistent=True, index_dir=index_dir)
+    assert store.collection.name == collection_name('ascii-test', catalog_hash(DATASET_NAMES, metadatas(DATASET_NAMES)))
+
+    # A second start must not re-add anything
+    def fail(*args, **kwargs):
+        raise AssertionError("index was rebuilt")
+    monkeypatch.setattr(VectorStore, 'build_collection', fail)
+
+    reopened = VectorStore(embedding_function=CountingEmbeddingFunction(), persistent=True, index_dir=index_dir)
+    assert reopened.collection.count() == len(DATASET_NAMES)
+    assert [hit['name'] for hit in reopened.query_embeddings("housing-data-2020", n_results=1)] == ["housing-data-2020"]
+
+def test_changed_catalog_replaces_index(cache_dir):
+    index_dir = str(cache_dir / "chroma")
+    VectorStore(embedding_function=CountingEmbeddingFunction(), persistent=True, index_dir=index_dir)
+
+    new_names = DATASET_NAMES + ["water-quality-2022"]
+    write_embeddings(vector_store.EMBEDDINGS_FILE, new_names)
+    vector_store.write_manifest('ascii-test', new_names, metadatas=metadatas(new_names))
+
+    store = VectorStore(embedding_function=CountingEmbeddingFunction(), persistent=True, index_dir=index_dir)
+    names = [getattr(c, 'name', c) for c in store.client.list_collections()]
+    assert names == [collection_name('ascii-test', catalog_hash(new_names, metadatas(new_names)))]
+    assert store.collection.count() == len(new_names)
+
+def test_slug_queries_skip_embedding(cache_dir, monkeypatch):
+    store = VectorStore(embedding_function=CountingEmbeddingFunction(), persistent=False)
+    monkeypatch.setattr(store, 'embed_queries', lambda texts: pytest.fail("query was embedded"))
+
+    query_vector, hits = store.retrieve("vocational-training-2021", n_results=2)
+
+    assert query_vector is None
+    assert [hit['name'] for hit in hits] == ["vocational-training-2021"]
+
+@pytest.mark.parametrize('backend', ['chroma', 'numpy'])
+def test_retrieve_many_embeds_once_and_matches_retrieve(cache_dir, backend):
+    store = VectorStore(embedding_function=CountingEmbeddingFunction(), persistent=False, backend=backend,
+                        index_dir=str(cache_dir / "index"))
+    queries = ["housing data", "road-traffic-counts", "training for work"]
+    embedded = []
+    embed_queries = store.embed_queries
+    store.embed_queries = lambda texts: embedded.append(list(texts)) or embed_queries(texts)
+
+    results = store.retrieve_many(queries, n_results=2)
+
+    # The exact slug is answered lexically, the others are embedded in one call
+    assert embedded == [["housing data", "training for work"]]
+    assert [hit['name'] for hit in results[1]] == ["road-traffic-counts"]
+    for query, hits in zip(queries, results):
+        assert [hit['id'] for hit in hits] == [hit['id'] for hit in store.retrieve(query, n_results=2)[1]]
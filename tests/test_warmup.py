@@ -0,0 +1,23 @@
+import threading
+from warmup import Warmup, LOADING, READY, FAILED
+
+
+def test_background_load_reports_ready_when_done():
+    release = threading.Event()
+    warmup = Warmup(release.wait).start()
+
+    assert warmup.state == LOADING and not warmup.ready
+    assert warmup.status() == {'status': LOADING}
+
+    release.set()
+    assert warmup.wait(timeout=5)
+    assert warmup.state == READY and 'load_seconds' in warmup.status()
+
+def test_failed_load_is_reported():
+    def load():
+        raise RuntimeError("model download failed")
+
+    warmup = Warmup(load).start(background=False)
+
+    assert warmup.state == FAILED and not warmup.wait(timeout=0)
+    assert warmup.status()['error'] == "model download failed"